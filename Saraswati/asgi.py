@@ -2,6 +2,8 @@
 ASGI config for Saraswati project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
+Run with ASYNC_EXAM_VIEWS=true to serve the question bank proxy endpoints from
+exam.async_views, e.g. ``gunicorn Saraswati.asgi:application -k uvicorn.workers.UvicornWorker``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/4.2/howto/deployment/asgi/
@@ -0,0 +1,90 @@
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+# set by replica_reads() around reads that may be a little stale
+_replica_reads = ContextVar('replica_reads', default=False)
+# set on the first write of a request, its later reads stay on the primary
+_pinned = ContextVar('pinned_to_primary', default=False)
+
+
+@contextmanager
+def replica_reads():
+    """
+    Reads inside the block (or the decorated function) go to a replica,
+    unless the request has already written.
+    """
+    token = _replica_reads.set(True)
+    try:
+        yield
+    finally:
+        _replica_reads.reset(token)
+
+
+def pin_to_primary():
+    # for writes the router does not see, like raw cursor.execute()
+    _pinned.set(True)
+
+
+def reset_pinning():
+    _pinned.set(False)
+
+
+def on_replica():
+    return bool(settings.DATABASE_REPLICAS) and _replica_reads.get() and not _pinned.get()
+
+
+def replica_first(query):
+    """
+    query() on a replica, again on the primary when the replica returned
+    None: the row may have been written moments ago and not replicated yet.
+    Returns (result, True when the result came from a replica), a replica
+    result may also be stale the other way round and is not worth caching.
+    """
+    with replica_reads():
+        if not on_replica():
+            return query(), False
+
+        result = query()
+
+    if result is not None:
+        return result, True
+    return query(), False
+
+
+async def areplica_first(query):
+    with replica_reads():
+        if not on_replica():
+            return await query(), False
+
+        result = await query()
+
+    if result is not None:
+        return result, True
+    return await query(), False
+
+
+class ReplicaRouter:
+    """
+    Reads go to the primary unless they opted in with replica_reads(), writes
+    always do. Replicas are settings.DATABASE_REPLICAS (SERVICE_DATABASE_REPLICAS),
+    without any everything stays on "default".
+    """
+
+    def db_for_read(self, model, **hints):
+        if on_replica():
+            return random.choice(settings.DATABASE_REPLICAS)
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        pin_to_primary()
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # replicas hold the same rows as the primary
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
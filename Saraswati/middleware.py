@@ -1,10 +1,177 @@
-import os
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import JsonResponse
 
-from django.db import connection
-from django.utils.deprecation import MiddlewareMixin
+from Saraswati.db_router import reset_pinning
+from exam.admission import admission_controller, retry_after_header
+from exam.constants import TOO_MANY_REQUESTS
+from exam.fastjson import loads
+from exam.metrics import end_request, observe_request, start_request
 
 
-class SetSearchPathMiddleware(MiddlewareMixin):
-    def process_request(self, request):
-            with connection.cursor() as cursor:
-                cursor.execute(f'SET search_path TO {os.getenv("SERVICE_DATABASE_SEARCH_PATH")}, public;')
+class RequestTimingMiddleware:
+    """
+    Records how long each request took and how much of it went to the
+    database, redis and the question bank. Requests carrying the
+    SERVER_TIMING_HEADER get the breakdown back as a Server-Timing header.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        timings, token = start_request()
+        try:
+            response = self.get_response(request)
+        finally:
+            end_request(token)
+
+        return self.finish(request, response, timings)
+
+    async def __acall__(self, request):
+        timings, token = start_request()
+        try:
+            response = await self.get_response(request)
+        finally:
+            end_request(token)
+
+        return self.finish(request, response, timings)
+
+    @staticmethod
+    def finish(request, response, timings):
+        # the route pattern, not the path, keeps the label set bounded
+        match = getattr(request, 'resolver_match', None)
+        endpoint = match.route if match is not None else 'unmatched'
+        observe_request(endpoint, request.method, response.status_code, timings)
+
+        if settings.SERVER_TIMING_HEADER in request.headers:
+            response['Server-Timing'] = timings.server_timing()
+
+        return response
+
+
+class AdmissionControlMiddleware:
+    """
+    Puts settings.ADMISSION_PATHS (login and question fetch) behind the
+    exam.admission rate limits and in-flight cap. Rejected requests get a
+    429 with a jittered Retry-After instead of queueing on the DB pool.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.ADMISSION_CONTROL:
+            raise MiddlewareNotUsed()
+
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        if request.path not in settings.ADMISSION_PATHS:
+            return self.get_response(request)
+
+        admission = admission_controller.admit(*self.identify(request))
+        if not admission.admitted:
+            return self.rejected(admission)
+
+        try:
+            return self.get_response(request)
+        finally:
+            admission_controller.release(admission)
+
+    async def __acall__(self, request):
+        if request.path not in settings.ADMISSION_PATHS:
+            return await self.get_response(request)
+
+        admission = await admission_controller.aadmit(*self.identify(request))
+        if not admission.admitted:
+            return self.rejected(admission)
+
+        try:
+            return await self.get_response(request)
+        finally:
+            await admission_controller.arelease(admission)
+
+    @staticmethod
+    def identify(request):
+        # (exam prefix, client address). The username in the body is not
+        # authenticated yet, it only picks the exam bucket: as the client key
+        # it would let a client rotate itself fresh buckets or drain another
+        # student's.
+        try:
+            username = loads(request.body or b'{}').get('username')
+
+        except (AttributeError, ValueError):
+            username = None
+
+        exam_prefix = username.split('_')[0] + '_' if isinstance(username, str) and '_' in username else '-'
+        return exam_prefix, AdmissionControlMiddleware.client_address(request)
+
+    @staticmethod
+    def client_address(request):
+        # only the X-Forwarded-For entries appended by our own
+        # ADMISSION_PROXY_HOPS proxies are trusted, the ones before are client supplied
+        hops = settings.ADMISSION_PROXY_HOPS
+        forwarded = [
+            address.strip() for address in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if address.strip()
+        ]
+        if hops and len(forwarded) >= hops:
+            return forwarded[-hops]
+
+        return request.META.get('REMOTE_ADDR', '')
+
+    @staticmethod
+    def rejected(admission):
+        response = JsonResponse({
+            'error': TOO_MANY_REQUESTS,
+            'retry_after_ms': int(admission.retry_after * 1000),
+            'is_success': False
+        },
+            status=429
+        )
+        response['Retry-After'] = retry_after_header(admission.retry_after)
+        return response
+
+
+class PrimaryPinningMiddleware:
+    """
+    Starts every request unpinned. Worker threads keep their context across
+    requests, without this one write would keep a thread off the replicas
+    for good (see Saraswati.db_router).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed()
+
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+
+        reset_pinning()
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        reset_pinning()
+        return await self.get_response(request)
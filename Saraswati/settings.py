@@ -37,18 +37,35 @@ CORS_ALLOW_METHODS = [
 
 CORS_ALLOW_ALL_ORIGINS = True
 
+CORS_EXPOSE_HEADERS = ['Retry-After']
+
 MIDDLEWARE = [
+    'Saraswati.middleware.RequestTimingMiddleware',
+    'Saraswati.middleware.PrimaryPinningMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'Saraswati.middleware.AdmissionControlMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
-    'Saraswati.middleware.SetSearchPathMiddleware',
     'django.middleware.security.SecurityMiddleware',
 ]
 
 ROOT_URLCONF = 'Saraswati.urls'
 
+# orjson backed JSON for every DRF view (stdlib json when orjson is missing)
+REST_FRAMEWORK = {
+    'DEFAULT_PARSER_CLASSES': [
+        'exam.fastjson.FastJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'exam.fastjson.FastJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
+}
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -67,6 +84,39 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'Saraswati.wsgi.application'
+ASGI_APPLICATION = 'Saraswati.asgi.application'
+
+# serve the question bank proxy endpoints with the async views (exam.async_views),
+# only worth it under Saraswati.asgi, the sync DRF views stay the default
+ASYNC_EXAM_VIEWS = os.getenv("ASYNC_EXAM_VIEWS", "false").lower() == "true"
+
+# acknowledge answers once they are on the redis stream, `manage.py drain_answers`
+# forwards them to the question bank in bulk
+ANSWER_WRITE_BEHIND = os.getenv("ANSWER_WRITE_BEHIND", "false").lower() == "true"
+
+# serve /api/question from the student's whole paper cached in redis:
+# "off", "login" (fetched at login) or "first_fetch" (fetched on the first /api/question)
+QUESTION_PREFETCH = os.getenv("QUESTION_PREFETCH", "off")
+
+# time exam sessions on the server (exam.exam_timer): late answers and fetches
+# after Exam.valid_till are rejected from a redis hash created at login
+EXAM_TIMER = os.getenv("EXAM_TIMER", "false").lower() == "true"
+
+# large csv imports / exports and bulk question ingests answer 202 with a job id
+# (exam.jobs) instead of running in the request, needs `manage.py run_jobs`
+BACKGROUND_JOBS = os.getenv("BACKGROUND_JOBS", "false").lower() == "true"
+
+# requests sending this header get their db / redis / upstream breakdown back
+# as a Server-Timing header, histograms of all requests are at /api/metrics
+SERVER_TIMING_HEADER = os.getenv("SERVER_TIMING_HEADER", "X-Debug-Timing")
+
+# token buckets per exam / client address and a cap on in-flight requests for the
+# exam start stampede (exam.admission), redis failures let requests through
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "false").lower() == "true"
+ADMISSION_PATHS = ['/api/login', '/api/question']
+# reverse proxies in front of the app that append to X-Forwarded-For, clients
+# are told apart by the address the outermost one saw (REMOTE_ADDR when 0)
+ADMISSION_PROXY_HOPS = int(os.getenv("ADMISSION_PROXY_HOPS", 0))
 
 DATABASES = {
     "default": {
@@ -76,9 +126,27 @@ DATABASES = {
         "PASSWORD": os.getenv("SERVICE_DATABASE_PASSWORD"),
         "HOST": os.getenv("SERVICE_DATABASE_HOST"),
         "PORT": os.getenv("SERVICE_DATABASE_PORT"),
+        # search_path is set once per connection in exam.signals
+        "CONN_MAX_AGE": int(os.getenv("SERVICE_DATABASE_CONN_MAX_AGE", 60)),
+        "CONN_HEALTH_CHECKS": os.getenv("SERVICE_DATABASE_CONN_HEALTH_CHECKS", "true").lower() == "true",
     }
 }
 
+# read replicas as "host[:port],host[:port]", same credentials as the primary. Only
+# reads that opt in (export, leaderboard, token check) use them, see Saraswati.db_router
+DATABASE_REPLICAS = []
+for index, replica in enumerate(filter(None, os.getenv("SERVICE_DATABASE_REPLICAS", "").split(","))):
+    host, _, port = replica.strip().partition(":")
+    DATABASES[f"replica_{index}"] = dict(
+        DATABASES["default"],
+        HOST=host,
+        PORT=port or DATABASES["default"]["PORT"],
+        TEST={"MIRROR": "default"}
+    )
+    DATABASE_REPLICAS.append(f"replica_{index}")
+
+DATABASE_ROUTERS = ['Saraswati.db_router.ReplicaRouter']
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
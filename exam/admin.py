@@ -1,3 +1,21 @@
-from django.contrib import admin
+from django.contrib import admin, messages
 
-# Register your models here.
+from .models import Exam
+from .question_content import question_content_cache
+
+
+@admin.register(Exam)
+class ExamAdmin(admin.ModelAdmin):
+    list_display = ('exam_name', 'prefix', 'no_of_questions', 'time_per_question', 'valid_till', 'prefix_released')
+    search_fields = ('exam_name', 'prefix')
+    actions = ['warm_exam']
+
+    @admin.action(description='Warm the question cache of the selected exams')
+    def warm_exam(self, request, queryset):
+        # preloads the question pool before the exam opens, the first students then hit the cache
+        for exam in queryset.exclude(prefix=''):
+            cached = question_content_cache.warm_exam(exam.prefix)
+            if cached is None:
+                self.message_user(request, f'{exam.prefix}: the question bank did not return a pool', messages.ERROR)
+            else:
+                self.message_user(request, f'{exam.prefix}: {cached} questions cached', messages.SUCCESS)
@@ -0,0 +1,168 @@
+import math
+import os
+import random
+import uuid
+from collections import namedtuple
+
+import redis
+
+from .cache import RedisManagerClient, async_redis_client
+
+import logging
+logger = logging.getLogger()
+
+EXAM_RATE = float(os.getenv('ADMISSION_EXAM_RATE', 500))  # requests per second per exam prefix
+EXAM_BURST = float(os.getenv('ADMISSION_EXAM_BURST', 1000))
+CLIENT_RATE = float(os.getenv('ADMISSION_CLIENT_RATE', 5))  # requests per second per client address
+CLIENT_BURST = float(os.getenv('ADMISSION_CLIENT_BURST', 10))
+MAX_IN_FLIGHT = int(os.getenv('ADMISSION_MAX_IN_FLIGHT', 200))  # across all workers
+IN_FLIGHT_LEASE_MS = int(os.getenv('ADMISSION_LEASE_MS', 10000))  # slots of crashed workers expire
+RETRY_AFTER = float(os.getenv('ADMISSION_RETRY_AFTER', 1))  # seconds, when the in-flight queue is full
+RETRY_JITTER = float(os.getenv('ADMISSION_RETRY_JITTER', 2))  # seconds, spreads the retries out
+
+# All keys share the {admission} hash tag so one script sees them under redis cluster.
+IN_FLIGHT_KEY = '{admission}:in-flight'
+
+# Refills and takes a token from the exam and the client bucket, then takes an
+# in-flight slot, all or nothing. Returns {1, 0} when admitted, {0, wait_ms}
+# when a bucket is empty and {-1, 0} when every slot is taken.
+ADMIT_SCRIPT = """
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+
+local function refill(key, rate, burst)
+    local state = redis.call('HMGET', key, 'tokens', 'ts')
+    local tokens = tonumber(state[1]) or burst
+    local elapsed = math.max(0, now - (tonumber(state[2]) or now))
+    return math.min(burst, tokens + elapsed * rate / 1000)
+end
+
+local function save(key, tokens, rate, burst)
+    redis.call('HSET', key, 'tokens', tostring(tokens), 'ts', now)
+    redis.call('PEXPIRE', key, math.ceil(burst / rate * 1000) + 1000)
+end
+
+local exam_rate, exam_burst = tonumber(ARGV[1]), tonumber(ARGV[2])
+local client_rate, client_burst = tonumber(ARGV[3]), tonumber(ARGV[4])
+local exam_tokens = refill(KEYS[1], exam_rate, exam_burst)
+local client_tokens = refill(KEYS[2], client_rate, client_burst)
+
+local wait = 0
+if exam_tokens < 1 then
+    wait = math.ceil((1 - exam_tokens) * 1000 / exam_rate)
+end
+if client_tokens < 1 then
+    wait = math.max(wait, math.ceil((1 - client_tokens) * 1000 / client_rate))
+end
+
+if wait > 0 then
+    save(KEYS[1], exam_tokens, exam_rate, exam_burst)
+    save(KEYS[2], client_tokens, client_rate, client_burst)
+    return {0, wait}
+end
+
+local lease = tonumber(ARGV[7])
+redis.call('ZREMRANGEBYSCORE', KEYS[3], '-inf', now - lease)
+if redis.call('ZCARD', KEYS[3]) >= tonumber(ARGV[5]) then
+    return {-1, 0}
+end
+
+redis.call('ZADD', KEYS[3], now, ARGV[6])
+redis.call('PEXPIRE', KEYS[3], lease)
+save(KEYS[1], exam_tokens - 1, exam_rate, exam_burst)
+save(KEYS[2], client_tokens - 1, client_rate, client_burst)
+return {1, 0}
+"""
+
+# ticket is None when nothing has to be released, retry_after in seconds
+Admission = namedtuple('Admission', ['admitted', 'ticket', 'retry_after'])
+ADMITTED_UNTRACKED = Admission(True, None, 0)
+
+
+def _retry_after(wait_ms):
+    return wait_ms / 1000 + random.uniform(0, RETRY_JITTER)
+
+
+class AdmissionController:
+    """
+    Token buckets per exam prefix and per client plus a cap on requests in
+    flight across all workers, enforced in one Lua call. Rejected requests
+    are told when to come back (with jitter, so they do not all return in
+    the same second). Any redis failure admits the request.
+    """
+
+    def __init__(self, redis_client, async_redis):
+        self.redis = redis_client
+        self.async_redis = async_redis
+        self.admit_script = redis_client.register_script(ADMIT_SCRIPT)
+
+    @staticmethod
+    def _keys(exam_prefix, client):
+        return [f'{{admission}}:exam:{exam_prefix}', f'{{admission}}:client:{client}', IN_FLIGHT_KEY]
+
+    @staticmethod
+    def _args(ticket):
+        return [EXAM_RATE, EXAM_BURST, CLIENT_RATE, CLIENT_BURST, MAX_IN_FLIGHT, ticket, IN_FLIGHT_LEASE_MS]
+
+    @staticmethod
+    def _decision(result, ticket):
+        status, wait_ms = int(result[0]), int(result[1])
+        if status == 1:
+            return Admission(True, ticket, 0)
+
+        if status == 0:
+            return Admission(False, None, _retry_after(wait_ms))
+
+        return Admission(False, None, _retry_after(RETRY_AFTER * 1000))
+
+    def admit(self, exam_prefix, client):
+        ticket = uuid.uuid4().hex
+        try:
+            result = self.admit_script(keys=self._keys(exam_prefix, client), args=self._args(ticket))
+
+        except redis.RedisError as e:
+            logger.info(e)
+            return ADMITTED_UNTRACKED
+
+        return self._decision(result, ticket)
+
+    async def aadmit(self, exam_prefix, client):
+        ticket = uuid.uuid4().hex
+        admit_script = self.async_redis.client.register_script(ADMIT_SCRIPT)
+        try:
+            result = await admit_script(keys=self._keys(exam_prefix, client), args=self._args(ticket))
+
+        except redis.RedisError as e:
+            logger.info(e)
+            return ADMITTED_UNTRACKED
+
+        return self._decision(result, ticket)
+
+    def release(self, admission):
+        if admission.ticket is None:
+            return
+
+        try:
+            self.redis.zrem(IN_FLIGHT_KEY, admission.ticket)
+
+        except redis.RedisError as e:
+            # the slot expires with its lease
+            logger.info(e)
+
+    async def arelease(self, admission):
+        if admission.ticket is None:
+            return
+
+        try:
+            await self.async_redis.client.zrem(IN_FLIGHT_KEY, admission.ticket)
+
+        except redis.RedisError as e:
+            logger.info(e)
+
+
+def retry_after_header(retry_after):
+    # Retry-After takes whole seconds, the body carries the exact delay
+    return str(max(1, math.ceil(retry_after)))
+
+
+admission_controller = AdmissionController(RedisManagerClient().client, async_redis_client)
@@ -0,0 +1,200 @@
+import json
+import os
+import random
+import time
+
+import redis
+
+from .utils import question_bank_network_call
+
+import logging
+logger = logging.getLogger()
+
+ANSWER_STREAM = os.getenv('ANSWER_STREAM', 'answers:pending')
+ANSWER_GROUP = os.getenv('ANSWER_GROUP', 'answer-drainers')
+ANSWER_DEAD_LETTER = os.getenv('ANSWER_DEAD_LETTER', 'answers:dead')
+ANSWER_ATTEMPTS = f'{ANSWER_STREAM}:attempts'
+ANSWER_BULK_PATH = os.getenv('ANSWER_BULK_PATH', '/answer/submit/bulk')
+ANSWER_MAX_ATTEMPTS = int(os.getenv('ANSWER_MAX_ATTEMPTS', 5))
+
+
+def idempotency_key(body: dict) -> str:
+    return f"{body.get('username')}:{body.get('question_id')}"
+
+
+def _entry(body: dict) -> dict:
+    return {
+        'key': idempotency_key(body),
+        'payload': json.dumps(body)
+    }
+
+
+def enqueue_answer(redis_client, body: dict) -> str:
+    # XADD is persisted by redis (AOF), the view acknowledges right after it
+    redis_client.xadd(ANSWER_STREAM, _entry(body))
+    return idempotency_key(body)
+
+
+async def aenqueue_answer(async_redis, body: dict) -> str:
+    await async_redis.xadd(ANSWER_STREAM, _entry(body))
+    return idempotency_key(body)
+
+
+class AnswerDrainer:
+    """
+    Drains the answer stream to the question bank in bulk through a consumer
+    group. Failed batches stay pending and are re-claimed after min_idle_ms,
+    an entry failing ANSWER_MAX_ATTEMPTS times is moved to the dead-letter list.
+    """
+
+    def __init__(self, redis_client, consumer, batch_size=200, block_ms=1000, min_idle_ms=30000):
+        self.redis = redis_client
+        self.consumer = consumer
+        self.batch_size = batch_size
+        self.block_ms = block_ms
+        self.min_idle_ms = min_idle_ms
+
+    def ensure_group(self):
+        try:
+            self.redis.xgroup_create(ANSWER_STREAM, ANSWER_GROUP, id='0', mkstream=True)
+
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def drain_once(self) -> dict:
+        # entries left behind by failed batches or dead consumers go first
+        claimed = self.redis.xautoclaim(
+            ANSWER_STREAM,
+            ANSWER_GROUP,
+            self.consumer,
+            min_idle_time=self.min_idle_ms,
+            start_id='0-0',
+            count=self.batch_size
+        )
+        entries = claimed[1]
+
+        if not entries:
+            response = self.redis.xreadgroup(
+                ANSWER_GROUP,
+                self.consumer,
+                {ANSWER_STREAM: '>'},
+                count=self.batch_size,
+                block=self.block_ms
+            )
+            entries = response[0][1] if response else []
+
+        return self._process(entries)
+
+    def run(self, once=False):
+        self.ensure_group()
+        failures = 0
+
+        while True:
+            try:
+                result = self.drain_once()
+
+            except redis.RedisError as e:
+                logger.info(e)
+                if once:
+                    raise
+                time.sleep(1)
+                continue
+
+            if result['submitted'] or result['failed']:
+                logger.info(f"answer drainer: {result}")
+
+            if once:
+                return result
+
+            # back off with jitter while the question bank keeps failing
+            failures = failures + 1 if result['failed'] and not result['submitted'] else 0
+            if failures:
+                time.sleep(min(2 ** failures, 30) * random.uniform(0.5, 1.0))
+
+    def _process(self, entries) -> dict:
+        result = {'submitted': 0, 'superseded': 0, 'failed': 0, 'dead_lettered': 0}
+        if not entries:
+            return result
+
+        # a later answer for the same (username, question_id) wins
+        latest = {}
+        superseded = []
+        for entry_id, fields in entries:
+            key = fields[b'key'].decode('utf-8')
+            if key in latest:
+                superseded.append(latest[key][0])
+            latest[key] = (entry_id, json.loads(fields[b'payload']))
+
+        if superseded:
+            self._ack(superseded)
+            result['superseded'] = len(superseded)
+
+        # stream ids only grow, so the question bank can drop a retried older answer
+        # that arrives after a newer one for the same idempotency key
+        response = question_bank_network_call(
+            {
+                'answers': [
+                    dict(payload, idempotency_key=key, sequence=entry_id.decode('utf-8'))
+                    for key, (entry_id, payload) in latest.items()
+                ]
+            },
+            'POST',
+            ANSWER_BULK_PATH
+        )
+
+        if response.get('error'):
+            failed_keys = set(latest)
+        else:
+            failed_keys = set(response.get('failed', [])) & set(latest)
+
+        done = [entry_id for key, (entry_id, _) in latest.items() if key not in failed_keys]
+        self._ack(done)
+        result['submitted'] = len(done)
+
+        for key in failed_keys:
+            entry_id, payload = latest[key]
+            attempts = self.redis.hincrby(ANSWER_ATTEMPTS, entry_id, 1)
+            if attempts >= ANSWER_MAX_ATTEMPTS:
+                self.redis.lpush(ANSWER_DEAD_LETTER, json.dumps({
+                    'idempotency_key': key,
+                    'payload': payload,
+                    'error': response.get('error', 'rejected by question bank')
+                }))
+                self._ack([entry_id])
+                result['dead_lettered'] += 1
+            else:
+                result['failed'] += 1
+
+        return result
+
+    def _ack(self, entry_ids):
+        if not entry_ids:
+            return
+
+        pipe = self.redis.pipeline()
+        pipe.xack(ANSWER_STREAM, ANSWER_GROUP, *entry_ids)
+        pipe.xdel(ANSWER_STREAM, *entry_ids)
+        pipe.hdel(ANSWER_ATTEMPTS, *entry_ids)
+        pipe.execute()
+
+    def stats(self) -> dict:
+        pending = self.redis.xpending(ANSWER_STREAM, ANSWER_GROUP)
+        return {
+            'stream_length': self.redis.xlen(ANSWER_STREAM),
+            'pending': pending['pending'],
+            'consumers': {
+                consumer['name'].decode('utf-8'): consumer['pending'] for consumer in pending['consumers']
+            },
+            'dead_letter': self.redis.llen(ANSWER_DEAD_LETTER),
+        }
+
+    def requeue_dead_letters(self) -> int:
+        requeued = 0
+        while True:
+            raw = self.redis.rpop(ANSWER_DEAD_LETTER)
+            if raw is None:
+                return requeued
+
+            enqueue_answer(self.redis, json.loads(raw)['payload'])
+            requeued += 1
@@ -0,0 +1,138 @@
+import asyncio
+import random
+import weakref
+from functools import wraps
+
+import httpx
+
+from .fastjson import FastJsonResponse
+from .metrics import dependency_timer
+from .utils import (QUESTION_BANK_DEFAULT_TIMEOUT, QUESTION_BANK_POOL_SIZE, QUESTION_BANK_RETRIES,
+                    QUESTION_BANK_RETRY_BACKOFF, QUESTION_BANK_RETRY_JITTER, QUESTION_BANK_TIMEOUTS,
+                    PoolCounters, exception_response_data, question_bank_headers, question_bank_uri)
+
+import logging
+logger = logging.getLogger()
+
+RETRY_STATUSES = (502, 503, 504)
+
+
+def async_exception_handler_decorator(func):
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        try:
+            return await func(*args, **kwargs)
+
+        except Exception as e:
+            logger.info(e)
+            data, response_status = exception_response_data(e)
+            return FastJsonResponse(data, status=response_status)
+
+    return wrapper
+
+
+class AsyncQuestionBankClient(PoolCounters):
+    """
+    httpx counterpart of QuestionBankClient. One AsyncClient (and connection
+    pool) is shared by every request running on the same event loop.
+    """
+
+    def __init__(self, base_uri, pool_size, retries, backoff, jitter, default_timeout, timeouts):
+        super().__init__()
+        self.base_uri = base_uri
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self.jitter = jitter
+        self.default_timeout = default_timeout
+        self.timeouts = timeouts
+        self._clients = weakref.WeakKeyDictionary()
+
+    def _client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            limits = httpx.Limits(max_connections=self.pool_size, max_keepalive_connections=self.pool_size)
+            client = httpx.AsyncClient(
+                base_url=self.base_uri,
+                limits=limits,
+                # transport level retries only cover connect errors, safe for every method
+                transport=httpx.AsyncHTTPTransport(retries=self.retries, limits=limits)
+            )
+            self._clients[loop] = client
+        return client
+
+    def _timeout(self, path):
+        connect_timeout, read_timeout = self.timeouts.get(path, self.default_timeout)
+        return httpx.Timeout(read_timeout, connect=connect_timeout)
+
+    async def request(self, method: str, path: str, **kwargs):
+        attempts = self.retries + 1 if method == 'GET' else 1
+
+        self._track('requests')
+        self._track('in_flight')
+        try:
+            with dependency_timer('upstream'):
+                for attempt in range(attempts):
+                    try:
+                        response = await self._client().request(method, path, timeout=self._timeout(path), **kwargs)
+                        if response.status_code not in RETRY_STATUSES or attempt == attempts - 1:
+                            return response
+
+                    except (httpx.TimeoutException, httpx.NetworkError):
+                        if attempt == attempts - 1:
+                            raise
+
+                    await asyncio.sleep(self.backoff * (2 ** attempt) + random.uniform(0, self.jitter))
+
+        except httpx.HTTPError:
+            self._track('errors')
+            raise
+
+        finally:
+            self._track('in_flight', -1)
+
+    def stats(self) -> dict:
+        stats = self.counters()
+        stats['pool_size'] = self.pool_size
+        stats['event_loops'] = len(self._clients)
+        return stats
+
+
+async_question_bank_client = AsyncQuestionBankClient(
+    base_uri=question_bank_uri,
+    pool_size=QUESTION_BANK_POOL_SIZE,
+    retries=QUESTION_BANK_RETRIES,
+    backoff=QUESTION_BANK_RETRY_BACKOFF,
+    jitter=QUESTION_BANK_RETRY_JITTER,
+    default_timeout=QUESTION_BANK_DEFAULT_TIMEOUT,
+    timeouts=QUESTION_BANK_TIMEOUTS
+)
+
+
+async def async_question_bank_network_call(body: dict, request_type: str, request_path: str):
+    headers = question_bank_headers()
+
+    try:
+        if request_type == 'GET':
+            response = await async_question_bank_client.request(
+                'GET',
+                request_path,
+                headers=headers,
+                params=body
+            )
+            return response.json()
+
+        else:
+            response = await async_question_bank_client.request(
+                'POST',
+                request_path,
+                headers=headers,
+                json=body
+            )
+            return response.json()
+
+    except Exception as e:
+        return {
+            'error': str(e)
+        }
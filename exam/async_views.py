@@ -0,0 +1,275 @@
+import redis
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.views import View
+from rest_framework import status
+
+from exam.constants import (JOB_INPUT_TOO_LARGE, MISSING_REQUIRED_FIELD, QUESTION_CONTENT_MISSING, USERNAME_MISSING,
+                             USER_NOT_LOGGED_IN)
+from .answer_queue import aenqueue_answer
+from .async_utils import async_exception_handler_decorator, async_question_bank_network_call
+from .cache import async_redis_client
+from .exam_config import exam_config_cache
+from .exam_timer import exam_timer
+from .fastjson import FastJsonResponse, dumps, read_json_body
+from .ingest import (INGEST_BATCH_SIZE, ingest_questions, ingest_summary_response, json_rows, upload_format,
+                     upload_rows)
+from .jobs import (JOB_INLINE_MAX_BYTES, JOB_INLINE_MAX_QUESTIONS, JOB_MAX_INPUT_BYTES, accepted_response_data,
+                   job_queue, run_as_job)
+from .question_content import question_content_cache, question_request
+from .question_paper import question_paper_cache
+from .sessions import awarm_request_caches, session_cache
+
+import logging
+logger = logging.getLogger()
+
+# Async counterparts of the views that mostly wait on the question bank, served
+# through Saraswati.asgi. They return FastJsonResponses since DRF's APIView
+# cannot run async handlers. Picked in exam.urls when ASYNC_EXAM_VIEWS is on.
+
+
+class AsyncRequestQuestionsView(View):
+    @async_exception_handler_decorator
+    async def post(self, request):
+        body_data = read_json_body(request)
+
+        try:
+            username = body_data['username']
+
+        except KeyError:
+            return FastJsonResponse({
+                "error": USERNAME_MISSING,
+                "is_success": False
+            },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if '_' in username:
+            exam_prefix = username.split('_')[0] + '_'
+
+        else:
+            return FastJsonResponse({
+                "error": MISSING_REQUIRED_FIELD.format("exam_prefix"),
+                "is_success": False
+            },
+                status=status.HTTP_400_BAD_REQUEST)
+
+        await awarm_request_caches(username, exam_prefix)
+
+        # check if auth token is correct
+        if await session_cache.aresolve(username, body_data.get("token")) is None:
+            return FastJsonResponse({
+                    'error': USER_NOT_LOGGED_IN,
+                    'is_success': False
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        no_of_questions = (await exam_config_cache.aget(exam_prefix)).no_of_questions
+        lookahead = int(body_data.get('lookahead') or 0) if settings.QUESTION_PREFETCH != 'off' else 0
+
+        reserved = False
+        if settings.EXAM_TIMER:
+            reservation = await exam_timer.abegin(username)
+            if not reservation.allowed:
+                return FastJsonResponse({
+                    'error': reservation.error,
+                    'is_success': False
+                },
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            if reservation.remaining is not None:
+                reserved = True
+                lookahead = min(lookahead, reservation.remaining - 1)
+
+        try:
+            data = await self.question(username, no_of_questions, lookahead)
+
+        except BaseException:
+            if reserved:
+                await exam_timer.arelease(username)
+            raise
+
+        if data.get('is_success') is False:
+            if reserved:
+                await exam_timer.arelease(username)
+            return FastJsonResponse(data, status=status.HTTP_400_BAD_REQUEST)
+
+        if reserved:
+            await exam_timer.aserved(username, data)
+        return FastJsonResponse(data)
+
+    @staticmethod
+    async def question(username, no_of_questions, lookahead):
+        if settings.QUESTION_PREFETCH != 'off':
+            data = await question_paper_cache.aserve(username, no_of_questions, lookahead)
+            if data is not None:
+                return data
+
+        response = await async_question_bank_network_call(
+            question_request(username, no_of_questions),
+            "GET",
+            "/question"
+        )
+
+        data = None if response.get("error") else await question_content_cache.afrom_response(response)
+        if data is None:
+            return {
+                'error': response.get("error") or QUESTION_CONTENT_MISSING,
+                'is_success': False
+            }
+
+        return data
+
+
+class AsyncAddQuestionsView(View):
+    async def post(self, request):
+        if 'file' in request.FILES:
+            return await self.bulk(request, upload=request.FILES['file'])
+
+        try:
+            body_data = read_json_body(request)
+            if isinstance(body_data, list):
+                return await self.bulk(request, questions=body_data)
+
+            response = await async_question_bank_network_call(body_data, "POST", "/question/add")
+            return FastJsonResponse(
+                response,
+                status=status.HTTP_200_OK if response.get("message") else status.HTTP_400_BAD_REQUEST
+            )
+
+        except Exception as e:
+            return FastJsonResponse(
+                {"error": str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+    @staticmethod
+    async def bulk(request, questions=None, upload=None):
+        try:
+            batch_size = max(int(request.GET.get('batch_size', INGEST_BATCH_SIZE)), 1)
+
+        except ValueError:
+            batch_size = INGEST_BATCH_SIZE
+
+        if questions is not None:
+            args = {'format': 'json', 'batch_size': batch_size}
+            as_job = run_as_job(request.GET, len(questions), JOB_INLINE_MAX_QUESTIONS)
+            rows = json_rows(questions)
+
+        else:
+            args = {'format': upload_format(upload, request.POST.get('format')), 'batch_size': batch_size}
+            as_job = run_as_job(request.GET, upload.size, JOB_INLINE_MAX_BYTES)
+            rows = upload_rows(upload, args['format'])
+
+        if as_job:
+            if upload is not None and upload.size > JOB_MAX_INPUT_BYTES:
+                return FastJsonResponse({
+                    "error": JOB_INPUT_TOO_LARGE,
+                    "is_success": False
+                },
+                    status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+                )
+
+            chunks = [dumps(questions)] if questions is not None else upload.chunks()
+            try:
+                job_id = await sync_to_async(job_queue.submit)('ingest_questions', args, chunks)
+                data = accepted_response_data(job_id)
+                return FastJsonResponse(data, status=status.HTTP_202_ACCEPTED, headers={'Location': data['status_url']})
+
+            except redis.RedisError as e:
+                # run it in the request like before
+                logger.info(e)
+
+        try:
+            # batches already go out on a thread pool, keep the event loop free while they do
+            summary = await sync_to_async(ingest_questions, thread_sensitive=False)(rows, batch_size=batch_size)
+
+        except Exception as e:
+            return FastJsonResponse(
+                {"error": str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        data, response_status = ingest_summary_response(summary)
+        return FastJsonResponse(data, status=response_status)
+
+
+class AsyncStoreResponseView(View):
+    async def post(self, request):
+        body_data = read_json_body(request)
+
+        if not body_data:
+            return FastJsonResponse({
+                    "error": "No data to submit",
+                    "status": status.HTTP_400_BAD_REQUEST
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if settings.EXAM_TIMER:
+            missing = [field for field in ('username', 'question_id') if not body_data.get(field)]
+            if missing:
+                return FastJsonResponse({
+                    'error': MISSING_REQUIRED_FIELD.format(', '.join(missing)),
+                    'is_success': False
+                },
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            verdict = await exam_timer.acheck_answer(body_data['username'], body_data['question_id'])
+            if not verdict.allowed:
+                return FastJsonResponse({
+                    'error': verdict.error,
+                    'is_success': False
+                },
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        if settings.ANSWER_WRITE_BEHIND:
+            try:
+                key = await aenqueue_answer(async_redis_client.client, body_data)
+                return FastJsonResponse({
+                    "status": "queued",
+                    "is_success": True,
+                    "idempotency_key": key
+                },
+                    status=status.HTTP_202_ACCEPTED
+                )
+
+            except redis.RedisError as e:
+                # never drop an answer, forward it synchronously instead
+                logger.info(e)
+
+        response = await async_question_bank_network_call(body_data, "POST", "/answer/submit")
+
+        if response.get("error"):
+            return FastJsonResponse({
+                    "error": response.get("error")
+                },
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        return FastJsonResponse(response)
+
+
+class AsyncStoreFeedbackView(View):
+    async def post(self, request):
+        response = {
+            "status": "success",
+            "message": "Feedback submitted successfully"
+        }
+
+        try:
+            body_data = read_json_body(request)
+            response = await async_question_bank_network_call(
+                body_data,
+                "POST",
+                "/submit/feedback"
+            )
+
+        except ValueError:
+            pass
+
+        return FastJsonResponse(response)
@@ -1,14 +1,468 @@
+import asyncio
+import functools
 import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
 
 import redis
+import redis.asyncio
+import redis.asyncio.cluster
+import redis.asyncio.sentinel
+import redis.cluster
+import redis.sentinel
+
+from .metrics import dependency_timer
+
+import logging
+logger = logging.getLogger()
+
+INVALIDATION_CHANNEL = "cache:invalidate"
+
+REDIS_MODE = os.getenv("REDIS_MODE", "standalone")  # standalone, sentinel or cluster
+REDIS_SENTINELS = os.getenv("REDIS_SENTINELS", "")  # host:port,host:port
+REDIS_SENTINEL_MASTER = os.getenv("REDIS_SENTINEL_MASTER", "mymaster")
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", 50))
+REDIS_POOL_TIMEOUT = float(os.getenv("REDIS_POOL_TIMEOUT", 1))  # seconds to wait for a free connection
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", 1))
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv("REDIS_HEALTH_CHECK_INTERVAL", 30))
+REDIS_BREAKER_THRESHOLD = int(os.getenv("REDIS_BREAKER_THRESHOLD", 5))
+REDIS_BREAKER_COOLDOWN = float(os.getenv("REDIS_BREAKER_COOLDOWN", 10))
+
+
+POOL_EXHAUSTED = "No connection available."  # BlockingConnectionPool timeout
+
+
+class CircuitOpenError(redis.ConnectionError):
+    pass
+
+
+class CircuitBreaker:
+    """
+    Opens after `threshold` consecutive connection errors or timeouts. While
+    open every call fails right away with CircuitOpenError (a RedisError, so
+    the existing fallbacks apply). After `cooldown` one call is let through
+    as a probe, it closes the breaker or opens it again.
+    """
+
+    def __init__(self, threshold=REDIS_BREAKER_THRESHOLD, cooldown=REDIS_BREAKER_COOLDOWN):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+
+        return "half-open" if self.probing else "open"
+
+    def _before(self):
+        with self._lock:
+            if self.opened_at is None:
+                return
+
+            if self.probing or time.monotonic() - self.opened_at < self.cooldown:
+                raise CircuitOpenError("redis circuit breaker is open")
+
+            self.probing = True
+
+    def _success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def _end_probe(self):
+        # any other outcome (ResponseError, NoScriptError, a cancelled task) says
+        # nothing about reachability, the breaker stays as it was and the next
+        # call may probe again
+        with self._lock:
+            self.probing = False
+
+    def _failure(self, error):
+        if str(error) == POOL_EXHAUSTED:
+            # a full pool means load, not an unreachable server
+            with self._lock:
+                self.probing = False
+            return
+
+        with self._lock:
+            self.failures += 1
+            self.probing = False
+            if self.failures >= self.threshold or self.opened_at is not None:
+                if self.opened_at is None:
+                    logger.info(f"redis circuit breaker opened after {self.failures} failures")
+                self.opened_at = time.monotonic()
+
+    def call(self, func, *args, **kwargs):
+        self._before()
+        try:
+            result = func(*args, **kwargs)
+
+        except (redis.ConnectionError, redis.TimeoutError) as e:
+            self._failure(e)
+            raise
+
+        except BaseException:
+            self._end_probe()
+            raise
+
+        self._success()
+        return result
+
+    async def acall(self, func, *args, **kwargs):
+        self._before()
+        try:
+            result = await func(*args, **kwargs)
+
+        except (redis.ConnectionError, redis.TimeoutError) as e:
+            self._failure(e)
+            raise
+
+        except BaseException:
+            self._end_probe()
+            raise
+
+        self._success()
+        return result
+
+
+# one breaker per process, every client talks to the same redis deployment
+redis_breaker = CircuitBreaker()
+
+
+def _guarded_call(func, *args, **kwargs):
+    with dependency_timer("redis"):
+        return redis_breaker.call(func, *args, **kwargs)
+
+
+async def _aguarded_call(func, *args, **kwargs):
+    with dependency_timer("redis"):
+        return await redis_breaker.acall(func, *args, **kwargs)
+
+
+class BreakerMixin:
+
+    def execute_command(self, *args, **options):
+        return _guarded_call(super().execute_command, *args, **options)
+
+    def pipeline(self, *args, **kwargs):
+        pipe = super().pipeline(*args, **kwargs)
+        pipe.execute = functools.partial(_guarded_call, pipe.execute)
+        return pipe
+
+    def get_many(self, keys):
+        # values in key order, None for misses
+        return self.mget(keys) if keys else []
+
+    def set_many(self, mapping, ex=None):
+        pipe = self.pipeline(transaction=False)
+        for key, value in mapping.items():
+            pipe.set(key, value, ex=ex)
+        pipe.execute()
+
+
+class BreakerRedis(BreakerMixin, redis.Redis):
+    pass
+
+
+class BreakerRedisCluster(BreakerMixin, redis.cluster.RedisCluster):
+
+    def get_many(self, keys):
+        # MGET needs every key in one slot, this splits it per node
+        return self.mget_nonatomic(keys) if keys else []
+
+
+class AsyncBreakerMixin:
+
+    async def execute_command(self, *args, **options):
+        return await _aguarded_call(super().execute_command, *args, **options)
+
+    def pipeline(self, *args, **kwargs):
+        pipe = super().pipeline(*args, **kwargs)
+        pipe.execute = functools.partial(_aguarded_call, pipe.execute)
+        return pipe
+
+    async def get_many(self, keys):
+        return await self.mget(keys) if keys else []
+
+    async def set_many(self, mapping, ex=None):
+        pipe = self.pipeline(transaction=False)
+        for key, value in mapping.items():
+            pipe.set(key, value, ex=ex)
+        await pipe.execute()
+
+
+class AsyncBreakerRedis(AsyncBreakerMixin, redis.asyncio.Redis):
+    pass
+
+
+class AsyncBreakerRedisCluster(AsyncBreakerMixin, redis.asyncio.cluster.RedisCluster):
+
+    async def get_many(self, keys):
+        return await self.mget_nonatomic(keys) if keys else []
+
+
+def _connection_kwargs(socket_timeout):
+    return {
+        "password": os.getenv("REDIS_PASSWORD"),
+        "socket_timeout": socket_timeout,
+        "socket_connect_timeout": REDIS_CONNECT_TIMEOUT,
+        "health_check_interval": REDIS_HEALTH_CHECK_INTERVAL,
+    }
+
+
+def _sentinel_hosts():
+    hosts = []
+    for item in REDIS_SENTINELS.split(","):
+        host, _, port = item.strip().rpartition(":")
+        if host:
+            hosts.append((host, int(port)))
+    return hosts
+
+
+def redis_health(client):
+    """PING with its latency plus the breaker state, for the health endpoint."""
+    started = time.perf_counter()
+    try:
+        client.ping()
+        error = None
+
+    except redis.RedisError as e:
+        error = str(e)
+
+    return {
+        "ok": error is None,
+        "error": error,
+        "latency_ms": round((time.perf_counter() - started) * 1000, 2),
+        "mode": REDIS_MODE,
+        "breaker": redis_breaker.state(),
+        "max_connections": REDIS_MAX_CONNECTIONS,
+    }
 
 
 class RedisManagerClient:
+    """
+    Clients are shared per socket timeout within a process, so every caller
+    draws from one bounded pool and waits up to REDIS_POOL_TIMEOUT for a free
+    connection instead of opening new ones. REDIS_MODE picks a standalone
+    server, a sentinel managed master or a cluster.
+    """
+
+    _clients = {}
+    _clients_lock = threading.Lock()
+
+    def __init__(self, socket_timeout=1):
+        # 1sec by default, workers doing blocking reads pass more
+        with self._clients_lock:
+            client = self._clients.get(socket_timeout)
+            if client is None:
+                client = self._clients[socket_timeout] = self._build(socket_timeout)
+
+        self.client = client
+
+    @staticmethod
+    def _build(socket_timeout):
+        kwargs = _connection_kwargs(socket_timeout)
+
+        if REDIS_MODE == "sentinel":
+            sentinel = redis.sentinel.Sentinel(
+                _sentinel_hosts(),
+                sentinel_kwargs={"password": os.getenv("REDIS_SENTINEL_PASSWORD"), "socket_timeout": socket_timeout},
+                **kwargs
+            )
+            return sentinel.master_for(
+                REDIS_SENTINEL_MASTER,
+                redis_class=BreakerRedis,
+                max_connections=REDIS_MAX_CONNECTIONS
+            )
+
+        if REDIS_MODE == "cluster":
+            return BreakerRedisCluster(
+                host=os.getenv("REDIS_HOST"),
+                port=os.getenv("REDIS_PORT"),
+                max_connections=REDIS_MAX_CONNECTIONS,
+                **kwargs
+            )
+
+        pool = redis.BlockingConnectionPool(
+            host=os.getenv("REDIS_HOST"),
+            port=os.getenv("REDIS_PORT"),
+            max_connections=REDIS_MAX_CONNECTIONS,
+            timeout=REDIS_POOL_TIMEOUT,
+            **kwargs
+        )
+        return BreakerRedis(connection_pool=pool)
+
+    def health(self):
+        return redis_health(self.client)
+
+
+class AsyncRedisManagerClient:
+    # redis.asyncio connections belong to the event loop that opened them,
+    # so one client (and pool) is kept per running loop
 
     def __init__(self):
-        self.client = redis.Redis(
+        self._clients = weakref.WeakKeyDictionary()
+
+    @property
+    def client(self):
+        loop = asyncio.get_running_loop()
+        client = self._clients.get(loop)
+        if client is None:
+            client = self._clients[loop] = self._build(socket_timeout=1)  # 1sec
+        return client
+
+    @staticmethod
+    def _build(socket_timeout):
+        kwargs = _connection_kwargs(socket_timeout)
+
+        if REDIS_MODE == "sentinel":
+            sentinel = redis.asyncio.sentinel.Sentinel(
+                _sentinel_hosts(),
+                sentinel_kwargs={"password": os.getenv("REDIS_SENTINEL_PASSWORD"), "socket_timeout": socket_timeout},
+                **kwargs
+            )
+            return sentinel.master_for(
+                REDIS_SENTINEL_MASTER,
+                redis_class=AsyncBreakerRedis,
+                max_connections=REDIS_MAX_CONNECTIONS
+            )
+
+        if REDIS_MODE == "cluster":
+            return AsyncBreakerRedisCluster(
+                host=os.getenv("REDIS_HOST"),
+                port=os.getenv("REDIS_PORT"),
+                max_connections=REDIS_MAX_CONNECTIONS,
+                **kwargs
+            )
+
+        pool = redis.asyncio.BlockingConnectionPool(
             host=os.getenv("REDIS_HOST"),
-            password=os.getenv("REDIS_PASSWORD"),
             port=os.getenv("REDIS_PORT"),
-            socket_timeout=1  # 1sec
+            max_connections=REDIS_MAX_CONNECTIONS,
+            timeout=REDIS_POOL_TIMEOUT,
+            **kwargs
         )
+        return AsyncBreakerRedis(connection_pool=pool)
+
+
+async_redis_client = AsyncRedisManagerClient()
+
+
+class LocalCache:
+    """
+    Bounded in-process LRU with a per entry TTL. Entries are evicted in every
+    worker when an invalidation for this cache name is published on redis.
+    """
+
+    def __init__(self, name, max_size=10000, ttl=60):
+        self.name = name
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        _local_caches[name] = self
+
+    def get(self, key):
+        _ensure_invalidation_listener()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (ttl or self.ttl)
+        with self._lock:
+            self._data[key] = (value, expires_at)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+_local_caches = {}
+_listener_lock = threading.Lock()
+_listener_pid = None
+
+
+def publish_invalidation(redis_client, cache_name, key):
+    # evict from this process right away, other workers evict on the message
+    cache = _local_caches.get(cache_name)
+    if cache is not None:
+        cache.delete(key)
+
+    try:
+        redis_client.publish(INVALIDATION_CHANNEL, f"{cache_name}|{key}")
+
+    except redis.RedisError as e:
+        logger.info(e)
+
+
+def _ensure_invalidation_listener():
+    global _listener_pid
+
+    # started lazily and per pid, so forked workers each get their own thread
+    if _listener_pid == os.getpid():
+        return
+
+    with _listener_lock:
+        if _listener_pid == os.getpid():
+            return
+
+        _listener_pid = os.getpid()
+        threading.Thread(
+            target=_listen_for_invalidations,
+            name="cache-invalidation-listener",
+            daemon=True
+        ).start()
+
+
+def _listen_for_invalidations():
+    redis_client = RedisManagerClient().client
+    connected = True
+
+    while True:
+        try:
+            pubsub = redis_client.pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(INVALIDATION_CHANNEL)
+            connected = True
+
+            while True:
+                message = pubsub.get_message(timeout=1.0)
+                if message is None:
+                    continue
+
+                cache_name, _, key = message["data"].decode("utf-8").partition("|")
+                cache = _local_caches.get(cache_name)
+                if cache is not None:
+                    cache.delete(key)
+
+        except (redis.RedisError, OSError) as e:
+            if connected:
+                # messages may have been missed while disconnected
+                logger.info(e)
+                for cache in list(_local_caches.values()):
+                    cache.clear()
+                connected = False
+
+            time.sleep(1)
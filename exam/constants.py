@@ -1,3 +1,5 @@
+from rest_framework.exceptions import APIException
+
 USER_ALREADY_EXISTS = "users already exists."
 USER_CREATED_SUCCESSFULLY = "users created successfully."
 EXAM_PREFIX_NOT_FOUND = "Exam prefix not found!"
@@ -6,8 +8,31 @@ ALREADY_LOGGED_IN = 'Already logged in'
 INVALID_CREDENTIALS = 'Invalid credentials'
 USERNAME_MISSING = 'Username is missing in payload'
 USER_NOT_LOGGED_IN = 'User not logged in / or invalid token'
+TOO_MANY_REQUESTS = 'Too many requests, retry after the given delay'
+USER_NOT_FOUND = 'User not found'
+ADMIN_TOKEN_NOT_CONFIGURED = 'ADMIN_TOKEN is not configured on this server'
+INVALID_SCORES = 'Expected username and integer marks for every score'
+EXAM_OVER = 'Exam is over'
+NO_QUESTION_SERVED = 'This question was not served in this session'
+ANSWER_TOO_LATE = 'Time for this question is up'
+ALL_QUESTIONS_SERVED = 'All questions of the exam have been served'
+QUESTION_STILL_OPEN = 'Answer the current question before fetching the next one'
+QUESTION_CONTENT_MISSING = 'Question content not found in the question bank'
+QUESTIONS_ADDED = 'Questions added'
+NO_VALID_QUESTIONS = 'No valid questions to add'
+JOB_NOT_FOUND = 'Job not found or expired'
+JOB_NOT_FINISHED = 'Job has not finished yet'
+JOB_INPUT_TOO_LARGE = 'Input is too large for a background job'
+INVALID_CURSOR = 'Invalid cursor, expected <marks>:<user_id>'
 
 
 class CustomRedisException(Exception):
     def __init__(self):
         pass
+
+
+class PrefixPoolExhausted(APIException):
+    status_code = 503
+    default_detail = 'No free exam prefix left, recycle expired exams or raise EXAM_PREFIX_LENGTH.'
+    default_code = 'prefix_pool_exhausted'
+
@@ -0,0 +1,193 @@
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+
+import redis
+from asgiref.sync import sync_to_async
+from dateutil import parser
+
+from .cache import LocalCache, RedisManagerClient, async_redis_client, publish_invalidation
+from .models import Exam
+
+import logging
+logger = logging.getLogger()
+
+EXAM_CONFIG_TTL = int(os.getenv('EXAM_CONFIG_CACHE_TTL', 15 * 60))
+EXAM_CONFIG_LOCAL_TTL = int(os.getenv('EXAM_CONFIG_LOCAL_CACHE_TTL', 60))
+EXAM_CONFIG_MISS_TTL = int(os.getenv('EXAM_CONFIG_MISS_CACHE_TTL', 10))  # prefixes without a live exam
+EXAM_CONFIG_LOCK_STRIPES = 64
+EXAM_CONFIG_LOCK_MS = 5000
+EXAM_CONFIG_LOCK_WAIT = 2.0  # seconds a process waits on another one loading the same exam
+
+ExamSettings = namedtuple('ExamSettings', ['time_per_question', 'no_of_questions', 'valid_till'])
+# cached for an unknown or released prefix, get() raises Exam.DoesNotExist for it
+NO_EXAM = ExamSettings(None, None, None)
+
+
+class ExamConfigCache:
+    """
+    Exam settings by prefix: process memory, then redis, then postgres. Misses
+    are single-flighted, one thread per process (local lock) and one process
+    overall (redis SET NX lock) runs the DB query while the rest wait for it.
+    Prefixes without a live exam are cached too, for EXAM_CONFIG_MISS_TTL.
+    """
+
+    def __init__(self, redis_client, async_redis):
+        self.redis = redis_client
+        self.async_redis = async_redis
+        self.local = LocalCache('exam_config', max_size=2000, ttl=EXAM_CONFIG_LOCAL_TTL)
+        # striped by prefix, a lock per prefix would grow with every prefix clients send
+        self._locks = [threading.Lock() for _ in range(EXAM_CONFIG_LOCK_STRIPES)]
+
+    @staticmethod
+    def key(exam_prefix):
+        return f"exam:{exam_prefix}"
+
+    @staticmethod
+    def encode(exam_settings):
+        if exam_settings is NO_EXAM:
+            return json.dumps(None)
+
+        return json.dumps([
+            exam_settings.time_per_question,
+            exam_settings.no_of_questions,
+            exam_settings.valid_till.isoformat()
+        ])
+
+    @staticmethod
+    def decode(raw):
+        value = json.loads(raw)
+        if value is None:
+            return NO_EXAM
+
+        time_per_question, no_of_questions, valid_till = value
+        return ExamSettings(time_per_question, no_of_questions, parser.isoparse(valid_till))
+
+    @staticmethod
+    def _ttl(exam_settings, ttl):
+        return EXAM_CONFIG_MISS_TTL if exam_settings is NO_EXAM else ttl
+
+    @staticmethod
+    def _found(exam_prefix, exam_settings):
+        if exam_settings is NO_EXAM:
+            raise Exam.DoesNotExist(f"no exam with prefix {exam_prefix}")
+        return exam_settings
+
+    def cache_locally(self, exam_prefix, exam_settings):
+        self.local.set(exam_prefix, exam_settings, ttl=self._ttl(exam_settings, EXAM_CONFIG_LOCAL_TTL))
+
+    def get(self, exam_prefix):
+        exam_settings = self.local.get(exam_prefix)
+        if exam_settings is not None:
+            return self._found(exam_prefix, exam_settings)
+
+        exam_settings = self._from_redis(exam_prefix)
+        if exam_settings is not None:
+            self.cache_locally(exam_prefix, exam_settings)
+            return self._found(exam_prefix, exam_settings)
+
+        with self._lock_for(exam_prefix):
+            exam_settings = self.local.get(exam_prefix)
+            if exam_settings is None:
+                exam_settings = self._load_single_flight(exam_prefix)
+                self.cache_locally(exam_prefix, exam_settings)
+
+            return self._found(exam_prefix, exam_settings)
+
+    async def aget(self, exam_prefix):
+        exam_settings = self.local.get(exam_prefix)
+        if exam_settings is not None:
+            return self._found(exam_prefix, exam_settings)
+
+        try:
+            raw = await self.async_redis.client.get(self.key(exam_prefix))
+
+        except redis.RedisError as e:
+            logger.info(e)
+            raw = None
+
+        if raw is not None:
+            exam_settings = self.decode(raw)
+            self.cache_locally(exam_prefix, exam_settings)
+            return self._found(exam_prefix, exam_settings)
+
+        return await sync_to_async(self.get)(exam_prefix)
+
+    def invalidate(self, exam_prefix):
+        try:
+            self.redis.delete(self.key(exam_prefix))
+
+        except redis.RedisError as e:
+            logger.info(e)
+
+        publish_invalidation(self.redis, self.local.name, exam_prefix)
+
+    def _lock_for(self, exam_prefix):
+        return self._locks[hash(exam_prefix) % len(self._locks)]
+
+    def _from_redis(self, exam_prefix):
+        try:
+            raw = self.redis.get(self.key(exam_prefix))
+
+        except redis.RedisError as e:
+            logger.info(e)
+            return None
+
+        return self.decode(raw) if raw is not None else None
+
+    def _load_single_flight(self, exam_prefix):
+        lock_key = f"{self.key(exam_prefix)}:lock"
+        try:
+            owner = self.redis.set(lock_key, 1, nx=True, px=EXAM_CONFIG_LOCK_MS)
+
+        except redis.RedisError as e:
+            logger.info(e)
+            return self._from_db(exam_prefix)
+
+        if not owner:
+            deadline = time.monotonic() + EXAM_CONFIG_LOCK_WAIT
+            while time.monotonic() < deadline:
+                time.sleep(0.05)
+                exam_settings = self._from_redis(exam_prefix)
+                if exam_settings is not None:
+                    return exam_settings
+
+        exam_settings = None
+        try:
+            exam_settings = self._from_db(exam_prefix)
+
+        finally:
+            # the lock goes even when the query failed, waiters must not sit out EXAM_CONFIG_LOCK_MS
+            try:
+                pipe = self.redis.pipeline()
+                if exam_settings is not None:
+                    pipe.set(
+                        self.key(exam_prefix),
+                        self.encode(exam_settings),
+                        ex=self._ttl(exam_settings, EXAM_CONFIG_TTL)
+                    )
+                if owner:
+                    pipe.delete(lock_key)
+                pipe.execute()
+
+            except redis.RedisError as e:
+                logger.info(e)
+
+        return exam_settings
+
+    @staticmethod
+    def _from_db(exam_prefix):
+        try:
+            exam = Exam.objects.only(
+                'time_per_question', 'no_of_questions', 'valid_till'
+            ).get(prefix=exam_prefix, prefix_released=False)
+
+        except Exam.DoesNotExist:
+            return NO_EXAM
+
+        return ExamSettings(exam.time_per_question, exam.no_of_questions, exam.valid_till)
+
+
+exam_config_cache = ExamConfigCache(RedisManagerClient().client, async_redis_client)
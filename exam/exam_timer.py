@@ -0,0 +1,286 @@
+import os
+from collections import namedtuple
+
+import redis
+
+from .cache import RedisManagerClient, async_redis_client
+from .constants import (ALL_QUESTIONS_SERVED, ANSWER_TOO_LATE, EXAM_OVER, NO_QUESTION_SERVED,
+                        QUESTION_STILL_OPEN)
+from .sessions import SESSION_TTL
+
+import logging
+logger = logging.getLogger()
+
+EXAM_TIMER_GRACE_MS = int(os.getenv('EXAM_TIMER_GRACE_MS', 2000))  # network slack on every deadline
+EXAM_TIMER_RESERVE_MS = int(os.getenv('EXAM_TIMER_RESERVE_MS', 15000))  # longest a question fetch may take
+
+# Reserves the next fetch: {-1, 0} when the session has no timer, {0, reason}
+# when refused (1 exam over, 4 all questions served, 5 a question is still
+# open or another fetch is running), else {1, questions left}.
+BEGIN_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {-1, 0}
+end
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'exam_deadline', 'idx', 'total', 'pending', 'last_deadline', 'reserved_until')
+if now > tonumber(state[1]) + tonumber(ARGV[1]) then
+    return {0, 1}
+end
+local remaining = tonumber(state[3]) - tonumber(state[2])
+if remaining <= 0 then
+    return {0, 4}
+end
+if (tonumber(state[4]) > 0 and now <= tonumber(state[5])) or now <= tonumber(state[6]) then
+    return {0, 5}
+end
+redis.call('HSET', KEYS[1], 'reserved_until', now + tonumber(ARGV[2]))
+return {1, remaining}
+"""
+
+# Records the questions ARGV[2..] a reserved fetch served, in the order they
+# are to be answered, and ends the reservation. Each gets its own deadline,
+# one time_per_question after the previous one. Returns the deadlines.
+SERVED_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {}
+end
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'exam_deadline', 'idx', 'total', 'time_per_question')
+local grace = tonumber(ARGV[1])
+local count = math.max(0, math.min(#ARGV - 1, tonumber(state[3]) - tonumber(state[2])))
+local deadlines = {}
+local deadline = 0
+for i = 1, count do
+    deadline = math.min(now + i * tonumber(state[4]) * 1000 + grace, tonumber(state[1]) + grace)
+    redis.call('HSET', KEYS[1], 'q:' .. ARGV[i + 1], deadline)
+    deadlines[i] = deadline
+end
+redis.call('HINCRBY', KEYS[1], 'idx', count)
+redis.call('HSET', KEYS[1], 'pending', count, 'last_deadline', deadline, 'reserved_until', 0)
+return deadlines
+"""
+
+# Ends a reservation whose fetch served nothing, the index is untouched.
+RELEASE_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 1 then
+    redis.call('HSET', KEYS[1], 'reserved_until', 0)
+end
+return 1
+"""
+
+# Answer to question ARGV[2]: {-1, 0} without a timer, {1, its deadline} when in
+# time, else {0, reason}: 1 exam over, 2 question not served, 3 its time is up.
+CHECK_ANSWER_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {-1, 0}
+end
+local time = redis.call('TIME')
+local now = tonumber(time[1]) * 1000 + math.floor(tonumber(time[2]) / 1000)
+local state = redis.call('HMGET', KEYS[1], 'exam_deadline', 'q:' .. ARGV[2])
+if now > tonumber(state[1]) + tonumber(ARGV[1]) then
+    return {0, 1}
+end
+if not state[2] then
+    return {0, 2}
+end
+local deadline = tonumber(state[2])
+if now > deadline then
+    return {0, 3}
+end
+if redis.call('HSETNX', KEYS[1], 'a:' .. ARGV[2], 1) == 1 then
+    redis.call('HINCRBY', KEYS[1], 'pending', -1)
+end
+return {1, deadline}
+"""
+
+REJECTIONS = {
+    1: EXAM_OVER,
+    2: NO_QUESTION_SERVED,
+    3: ANSWER_TOO_LATE,
+    4: ALL_QUESTIONS_SERVED,
+    5: QUESTION_STILL_OPEN,
+}
+
+# error is None when allowed, deadline is None when the session is not timed
+TimerVerdict = namedtuple('TimerVerdict', ['allowed', 'error', 'deadline'])
+UNTIMED = TimerVerdict(True, None, None)
+
+# remaining is None when the session is not timed, nothing to record then
+Reservation = namedtuple('Reservation', ['allowed', 'error', 'remaining'])
+UNRESERVED = Reservation(True, None, None)
+
+
+class ExamTimer:
+    """
+    Server side timing of an exam session: one redis hash per student with
+    the questions handed out (idx out of total), a deadline per served
+    question (q:<question_id>) and the exam deadline (Exam.valid_till).
+    A fetch is reserved before the question is looked up and recorded once
+    it was served, or released when it was not; a new question is refused
+    while a served one is still open. Every step is one Lua call, postgres
+    is never read. Sessions without a hash (and any redis failure) are not
+    timed.
+    """
+
+    def __init__(self, redis_client, async_redis):
+        self.redis = redis_client
+        self.async_redis = async_redis
+        self.begin_script = redis_client.register_script(BEGIN_SCRIPT)
+        self.served_script = redis_client.register_script(SERVED_SCRIPT)
+        self.release_script = redis_client.register_script(RELEASE_SCRIPT)
+        self.check_script = redis_client.register_script(CHECK_ANSWER_SCRIPT)
+
+    @staticmethod
+    def key(username):
+        return f"timer:{username}"
+
+    def start(self, username, exam_settings):
+        try:
+            pipe = self.redis.pipeline()
+            pipe.delete(self.key(username))
+            pipe.hset(self.key(username), mapping={
+                'idx': 0,
+                'total': exam_settings.no_of_questions,
+                'pending': 0,
+                'last_deadline': 0,
+                'reserved_until': 0,
+                'time_per_question': exam_settings.time_per_question,
+                'exam_deadline': int(exam_settings.valid_till.timestamp() * 1000),
+            })
+            pipe.expire(self.key(username), SESSION_TTL)
+            pipe.execute()
+
+        except redis.RedisError as e:
+            logger.info(e)
+
+    @staticmethod
+    def _reservation(result):
+        status, value = int(result[0]), int(result[1])
+        if status == -1:
+            return UNRESERVED
+
+        if status == 0:
+            return Reservation(False, REJECTIONS[value], None)
+
+        return Reservation(True, None, value)
+
+    @staticmethod
+    def _verdict(result):
+        status, value = int(result[0]), int(result[1])
+        if status == -1:
+            return UNTIMED
+
+        if status == 0:
+            return TimerVerdict(False, REJECTIONS[value], None)
+
+        return TimerVerdict(True, None, value)
+
+    @staticmethod
+    def served_ids(data):
+        # the question and the lookahead ones, in the order they are answered
+        return [data['question_id']] + [question['question_id'] for question in data.get('upcoming', [])]
+
+    @staticmethod
+    def _stamp(data, deadlines):
+        for question, deadline in zip([data] + data.get('upcoming', []), deadlines):
+            question['answer_by'] = int(deadline)
+
+    def begin(self, username):
+        try:
+            return self._reservation(self.begin_script(
+                keys=[self.key(username)], args=[EXAM_TIMER_GRACE_MS, EXAM_TIMER_RESERVE_MS]
+            ))
+
+        except redis.RedisError as e:
+            logger.info(e)
+            return UNRESERVED
+
+    async def abegin(self, username):
+        begin_script = self.async_redis.client.register_script(BEGIN_SCRIPT)
+        try:
+            return self._reservation(await begin_script(
+                keys=[self.key(username)], args=[EXAM_TIMER_GRACE_MS, EXAM_TIMER_RESERVE_MS]
+            ))
+
+        except redis.RedisError as e:
+            logger.info(e)
+            return UNRESERVED
+
+    def served(self, username, data):
+        """Records the questions of a served /api/question response and adds their answer_by."""
+        try:
+            deadlines = self.served_script(
+                keys=[self.key(username)], args=[EXAM_TIMER_GRACE_MS, *self.served_ids(data)]
+            )
+
+        except redis.RedisError as e:
+            # the reservation runs out after EXAM_TIMER_RESERVE_MS
+            logger.info(e)
+            return
+
+        self._stamp(data, deadlines)
+
+    async def aserved(self, username, data):
+        served_script = self.async_redis.client.register_script(SERVED_SCRIPT)
+        try:
+            deadlines = await served_script(
+                keys=[self.key(username)], args=[EXAM_TIMER_GRACE_MS, *self.served_ids(data)]
+            )
+
+        except redis.RedisError as e:
+            logger.info(e)
+            return
+
+        self._stamp(data, deadlines)
+
+    def release(self, username):
+        try:
+            self.release_script(keys=[self.key(username)])
+
+        except redis.RedisError as e:
+            logger.info(e)
+
+    async def arelease(self, username):
+        release_script = self.async_redis.client.register_script(RELEASE_SCRIPT)
+        try:
+            await release_script(keys=[self.key(username)])
+
+        except redis.RedisError as e:
+            logger.info(e)
+
+    def check_answer(self, username, question_id):
+        try:
+            return self._verdict(self.check_script(
+                keys=[self.key(username)], args=[EXAM_TIMER_GRACE_MS, question_id]
+            ))
+
+        except redis.RedisError as e:
+            logger.info(e)
+            return UNTIMED
+
+    async def acheck_answer(self, username, question_id):
+        check_script = self.async_redis.client.register_script(CHECK_ANSWER_SCRIPT)
+        try:
+            return self._verdict(await check_script(
+                keys=[self.key(username)], args=[EXAM_TIMER_GRACE_MS, question_id]
+            ))
+
+        except redis.RedisError as e:
+            logger.info(e)
+            return UNTIMED
+
+    def invalidate(self, username):
+        try:
+            self.redis.delete(self.key(username))
+
+        except redis.RedisError as e:
+            logger.info(e)
+
+    def invalidate_many(self, pipe, usernames):
+        for username in usernames:
+            pipe.delete(self.key(username))
+
+
+exam_timer = ExamTimer(RedisManagerClient().client, async_redis_client)
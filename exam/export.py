@@ -0,0 +1,68 @@
+import csv
+import os
+
+from django.db.models import Q
+
+from Saraswati.db_router import replica_reads
+
+from .models import User
+from .serializers import values_serializer
+
+EXPORT_COLUMNS = ('student_name', 'university_email', 'university_id', 'marks')
+EXPORT_CHUNK_SIZE = int(os.getenv('EXPORT_CHUNK_SIZE', 2000))
+EXPORT_PAGE_LIMIT = 1000
+
+export_serializer = values_serializer(User, EXPORT_COLUMNS)
+
+
+class Echo:
+    # file-like object for csv.writer, hands every formatted row straight back
+    def write(self, value):
+        return value
+
+
+def parse_cursor(cursor: str):
+    # cursor is "<marks>:<user_id>" of the last row already sent
+    marks, _, user_id = cursor.partition(':')
+    return int(marks), int(user_id)
+
+
+def encode_cursor(marks, user_id) -> str:
+    return f"{marks}:{user_id}"
+
+
+def export_queryset(exam_prefix=None, cursor=None):
+    users = User.objects.all()
+    if exam_prefix:
+        users = users.filter(exam_prefix=exam_prefix)
+
+    if cursor:
+        marks, user_id = cursor
+        # keyset on (marks DESC, user_id ASC): everything strictly after the cursor row
+        users = users.filter(Q(marks__lt=marks) | Q(marks=marks, user_id__gt=user_id))
+
+    return users.order_by('-marks', 'user_id').values_list(*EXPORT_COLUMNS, 'user_id')
+
+
+@replica_reads()
+def export_page(exam_prefix=None, cursor=None, limit=100):
+    # next_cursor is None once the last page has been read
+    rows = list(export_queryset(exam_prefix, cursor)[:limit])
+    next_cursor = None
+    if len(rows) == limit:
+        next_cursor = (rows[-1][3], rows[-1][4])
+
+    return list(export_serializer.rows(row[:4] for row in rows)), next_cursor
+
+
+def stream_users_csv(exam_prefix=None, cursor=None, chunk_size=EXPORT_CHUNK_SIZE):
+    # Walks the result in keyset windows instead of one long server side cursor,
+    # so memory stays flat and no transaction is held open behind pgbouncer.
+    writer = csv.writer(Echo())
+    while True:
+        rows, cursor = export_page(exam_prefix, cursor, chunk_size)
+        if rows:
+            yield ''.join(writer.writerow(row) for row in rows)
+
+        if cursor is None:
+            return
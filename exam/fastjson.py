@@ -0,0 +1,66 @@
+import json
+
+from django.http import HttpResponse
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+from rest_framework.renderers import BaseRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # stdlib json, same output shape, slower
+    orjson = None
+
+# DRF's encoder covers what orjson does not know natively (Decimal, lazy strings, ...)
+_drf_encoder = JSONEncoder()
+
+
+def dumps(data) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(data, default=_drf_encoder.default)
+
+    return json.dumps(data, cls=JSONEncoder, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def loads(raw):
+    if orjson is not None:
+        return orjson.loads(raw)
+
+    return json.loads(raw)
+
+
+class FastJSONParser(BaseParser):
+    media_type = 'application/json'
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        try:
+            return loads(stream.read() if stream is not None else b'')
+
+        except ValueError as e:
+            raise ParseError(f'JSON parse error - {e}')
+
+
+class FastJSONRenderer(BaseRenderer):
+    media_type = 'application/json'
+    format = 'json'
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+
+        return dumps(data)
+
+
+class FastJsonResponse(HttpResponse):
+    """JsonResponse rendered with dumps(), for the async views outside DRF."""
+
+    def __init__(self, data, **kwargs):
+        kwargs.setdefault('content_type', 'application/json')
+        super().__init__(content=dumps(data), **kwargs)
+
+
+def read_json_body(request):
+    # plain Django views get the same parser as the DRF ones
+    return loads(request.body or b'{}')
+
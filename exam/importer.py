@@ -0,0 +1,164 @@
+import csv
+import io
+import os
+import re
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from rest_framework import status
+
+from .constants import MISSING_REQUIRED_FIELD, USER_ALREADY_EXISTS, USER_CREATED_SUCCESSFULLY
+from .models import User
+
+IMPORT_BATCH_SIZE = int(os.getenv('IMPORT_BATCH_SIZE', 1000))
+REQUIRED_COLUMNS = ('student_name', 'university_email', 'university_id')
+UPDATE_FIELDS = ['student_name', 'university_email', 'university_id', 'exam_prefix']
+USERNAME_MAX_LENGTH = User._meta.get_field('username').max_length
+
+
+def import_users_csv(binary_file, exam_prefix, batch_size=IMPORT_BATCH_SIZE, on_conflict='skip'):
+    """
+    Streams the csv and inserts it chunk by chunk, each chunk in its own
+    transaction. Rows are reported as inserted, updated, skipped or rejected
+    so an upload can be re-run after a partial failure.
+    """
+    summary = {
+        'inserted': [],
+        'updated': [],
+        'skipped': [],
+        'rejected': [],
+    }
+    text = io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
+
+    try:
+        reader = csv.DictReader(text)
+        missing = [column for column in REQUIRED_COLUMNS if column not in (reader.fieldnames or [])]
+        if missing:
+            summary['error'] = MISSING_REQUIRED_FIELD.format(', '.join(missing))
+            return summary
+
+        seen = set()
+        chunk = []
+        for row in reader:
+            chunk.append((reader.line_num, row))
+            if len(chunk) >= batch_size:
+                _import_chunk(chunk, exam_prefix, on_conflict, seen, summary)
+                chunk = []
+
+        if chunk:
+            _import_chunk(chunk, exam_prefix, on_conflict, seen, summary)
+
+    except (UnicodeDecodeError, csv.Error) as e:
+        # chunks before the bad line are already committed
+        summary['error'] = f"line {reader.line_num}: {e}"
+
+    finally:
+        text.detach()
+
+    return summary
+
+
+def import_summary_response(summary):
+    """(response data, status code) of an import summary."""
+    written = len(summary['inserted']) + len(summary['updated'])
+    if written:
+        message, response_status = USER_CREATED_SUCCESSFULLY, status.HTTP_201_CREATED
+
+    elif summary['skipped'] and not summary.get('error'):
+        message, response_status = USER_ALREADY_EXISTS, status.HTTP_200_OK
+
+    else:
+        message, response_status = summary.get('error', 'No valid rows to import'), status.HTTP_400_BAD_REQUEST
+
+    return {
+        "message": message,
+        "error": summary.get('error'),
+        "inserted_count": len(summary['inserted']),
+        "updated_count": len(summary['updated']),
+        "skipped_count": len(summary['skipped']),
+        "rejected_count": len(summary['rejected']),
+        "inserted": summary['inserted'],
+        "updated": summary['updated'],
+        "skipped": summary['skipped'],
+        "rejected": summary['rejected']
+    }, response_status
+
+
+def _import_chunk(chunk, exam_prefix, on_conflict, seen, summary):
+    users = {}
+    for line, row in chunk:
+        reason = _validate_row(row)
+        username = exam_prefix + (row.get('university_id') or '').strip()
+
+        if reason is None and len(username) > USERNAME_MAX_LENGTH:
+            reason = f'username {username} is longer than {USERNAME_MAX_LENGTH} characters'
+
+        if reason is not None:
+            summary['rejected'].append({'line': line, 'reason': reason})
+            continue
+
+        if username in seen:
+            summary['skipped'].append({'line': line, 'username': username, 'reason': 'duplicate row in file'})
+            continue
+
+        seen.add(username)
+        users[username] = (line, User(
+            student_name=row['student_name'].strip(),
+            university_email=row['university_email'].strip(),
+            university_id=int(row['university_id']),
+            exam_prefix=exam_prefix,
+            username=username
+        ))
+
+    if not users:
+        return
+
+    with transaction.atomic():
+        existing = set(
+            User.objects.filter(username__in=users.keys()).values_list('username', flat=True)
+        )
+
+        if on_conflict == 'update':
+            User.objects.bulk_create(
+                [user for _, user in users.values()],
+                batch_size=len(users),
+                update_conflicts=True,
+                unique_fields=['username'],
+                update_fields=UPDATE_FIELDS
+            )
+
+        else:
+            User.objects.bulk_create(
+                [user for username, (_, user) in users.items() if username not in existing],
+                batch_size=len(users),
+                ignore_conflicts=True
+            )
+
+    for username, (line, _) in users.items():
+        if username not in existing:
+            summary['inserted'].append(username)
+
+        elif on_conflict == 'update':
+            summary['updated'].append(username)
+
+        else:
+            summary['skipped'].append({'line': line, 'username': username, 'reason': USER_ALREADY_EXISTS})
+
+
+def _validate_row(row):
+    for column in REQUIRED_COLUMNS:
+        if not (row.get(column) or '').strip():
+            return MISSING_REQUIRED_FIELD.format(column)
+
+    # isdigit() also takes unicode digits like '²', which int() then refuses
+    if not re.fullmatch(r'[0-9]+', row['university_id'].strip()):
+        return 'university_id must be numeric'
+
+    try:
+        validate_email(row['university_email'].strip())
+
+    except ValidationError:
+        return 'university_email is not a valid email'
+
+    return None
@@ -0,0 +1,218 @@
+import csv
+import io
+import json
+import os
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from rest_framework import status
+
+from .constants import MISSING_REQUIRED_FIELD, NO_VALID_QUESTIONS, QUESTIONS_ADDED
+from .utils import question_bank_client, question_bank_headers
+
+# Batches are POSTed as {"questions": [...]}. The question bank must accept that
+# body on this path (the loadtest stub does), point it at its bulk endpoint if
+# /question/add only takes a single question.
+QUESTION_ADD_PATH = os.getenv('QUESTION_ADD_PATH', '/question/add')
+INGEST_BATCH_SIZE = int(os.getenv('QUESTION_INGEST_BATCH_SIZE', 200))
+INGEST_CONCURRENCY = int(os.getenv('QUESTION_INGEST_CONCURRENCY', 4))
+MIN_OPTIONS = 2
+
+
+def json_rows(questions):
+    # (line, row) pairs, "line" is the 1-based position in the array
+    return enumerate(questions, start=1)
+
+
+def ndjson_rows(binary_file):
+    text = io.TextIOWrapper(binary_file, encoding='utf-8-sig')
+    try:
+        for line, raw in enumerate(text, start=1):
+            if not raw.strip():
+                continue
+
+            try:
+                yield line, json.loads(raw)
+
+            except ValueError as e:
+                yield line, f'invalid JSON: {e}'
+
+    finally:
+        text.detach()
+
+
+def csv_rows(binary_file):
+    """
+    One question per row: text, answer and the options either as option_1,
+    option_2, ... columns or as one "options" column separated by "|".
+    Other columns are passed through to the question bank.
+    """
+    text = io.TextIOWrapper(binary_file, encoding='utf-8-sig', newline='')
+    try:
+        reader = csv.DictReader(text)
+        option_columns = [column for column in (reader.fieldnames or []) if column.startswith('option_')]
+
+        for row in reader:
+            question = {
+                column: value for column, value in row.items()
+                if column and column not in option_columns and column != 'options'
+            }
+            if option_columns:
+                question['options'] = [row[column] for column in option_columns if (row[column] or '').strip()]
+            else:
+                question['options'] = [option for option in (row.get('options') or '').split('|') if option.strip()]
+
+            yield reader.line_num, question
+
+    finally:
+        text.detach()
+
+
+def upload_format(upload, file_format=None):
+    # NDJSON when asked for or named / typed so, CSV otherwise
+    name = (upload.name or '').lower()
+    if file_format in ('ndjson', 'jsonl') or name.endswith(('.ndjson', '.jsonl')) \
+            or upload.content_type == 'application/x-ndjson':
+        return 'ndjson'
+    return 'csv'
+
+
+def upload_rows(upload, file_format=None):
+    if upload_format(upload, file_format) == 'ndjson':
+        return ndjson_rows(upload.file)
+    return csv_rows(upload.file)
+
+
+def validate_question(row):
+    """Returns (question, None) or (None, reason)."""
+    if not isinstance(row, dict):
+        return None, row if isinstance(row, str) else 'expected a JSON object'
+
+    text = row.get('text')
+    if not isinstance(text, str) or not text.strip():
+        return None, MISSING_REQUIRED_FIELD.format('text')
+
+    options = row.get('options')
+    if not isinstance(options, list) or len(options) < MIN_OPTIONS:
+        return None, f'at least {MIN_OPTIONS} options are required'
+
+    if any(not isinstance(option, str) or not option.strip() for option in options):
+        return None, 'options must be non-empty strings'
+
+    if len(set(options)) != len(options):
+        return None, 'options must be unique'
+
+    if row.get('answer') not in options:
+        return None, 'answer must be one of the options'
+
+    return dict(row, text=text.strip()), None
+
+
+def _send_batch(number, lines, questions):
+    result = {
+        'batch': number,
+        'first_line': lines[0],
+        'last_line': lines[-1],
+        'count': len(questions),
+        'is_success': False,
+    }
+    try:
+        response = question_bank_client.request(
+            'POST',
+            QUESTION_ADD_PATH,
+            headers=question_bank_headers(),
+            json={"questions": questions}
+        )
+        # a 4xx / 5xx is a failed batch whatever its body says
+        response.raise_for_status()
+        body = response.json()
+
+    except Exception as e:
+        result['error'] = str(e)
+        return result
+
+    if isinstance(body, dict) and body.get('error'):
+        result['error'] = body['error']
+        return result
+
+    result['is_success'] = True
+    return result
+
+
+def ingest_questions(rows, batch_size=INGEST_BATCH_SIZE, concurrency=INGEST_CONCURRENCY):
+    """
+    Validates (line, row) pairs locally and posts the valid ones to the
+    question bank in batches, at most `concurrency` batches in flight. Rows
+    are read as batches go out, a large upload is never held in memory
+    whole. POSTs are not retried, a failed batch is reported with its line
+    range so just those lines can be sent again. A file that cannot be read
+    to the end stops the ingest with summary['error'], the rows read before
+    it are still sent and reported.
+    """
+    summary = {'batches': [], 'rejected': []}
+    lines, questions, number, last_line = [], [], 0, 0
+    in_flight = set()
+
+    def collect(done):
+        for future in done:
+            summary['batches'].append(future.result())
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='question-ingest') as executor:
+        def submit():
+            nonlocal lines, questions, number, in_flight
+            if len(in_flight) >= concurrency:
+                done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                collect(done)
+
+            number += 1
+            in_flight.add(executor.submit(_send_batch, number, lines, questions))
+            lines, questions = [], []
+
+        rows = iter(rows)
+        while True:
+            try:
+                line, row = next(rows)
+
+            except StopIteration:
+                break
+
+            except (ValueError, csv.Error) as e:
+                # a broken upload (bad encoding, malformed csv): stop reading, the
+                # batches already sent are still reported
+                summary['error'] = f"after line {last_line}: {e}"
+                break
+
+            last_line = line
+            question, reason = validate_question(row)
+            if reason is not None:
+                summary['rejected'].append({'line': line, 'reason': reason})
+                continue
+
+            lines.append(line)
+            questions.append(question)
+            if len(questions) >= batch_size:
+                submit()
+
+        if questions:
+            submit()
+
+        collect(wait(in_flight).done)
+
+    summary['batches'].sort(key=lambda batch: batch['batch'])
+    summary['accepted'] = sum(batch['count'] for batch in summary['batches'] if batch['is_success'])
+    summary['failed'] = sum(batch['count'] for batch in summary['batches'] if not batch['is_success'])
+    return summary
+
+
+def ingest_summary_response(summary):
+    """(response data, status code) of an ingest summary."""
+    data = {
+        "message": QUESTIONS_ADDED if summary['accepted'] else summary.get('error', NO_VALID_QUESTIONS),
+        "error": summary.get('error'),
+        "is_success": bool(summary['accepted']) and not summary['failed'] and not summary.get('error'),
+        "accepted_count": summary['accepted'],
+        "failed_count": summary['failed'],
+        "rejected_count": len(summary['rejected']),
+        "batches": summary['batches'],
+        "rejected": summary['rejected']
+    }
+    return data, status.HTTP_201_CREATED if summary['accepted'] else status.HTTP_400_BAD_REQUEST
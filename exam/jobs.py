@@ -0,0 +1,351 @@
+import io
+import json
+import os
+import threading
+import time
+import uuid
+
+import redis
+from django.conf import settings
+from django.db import close_old_connections
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import status
+
+from Saraswati.db_router import reset_pinning
+
+from .cache import RedisManagerClient
+from .export import stream_users_csv
+from .importer import import_summary_response, import_users_csv
+from .ingest import csv_rows, ingest_questions, ingest_summary_response, json_rows, ndjson_rows
+
+import logging
+logger = logging.getLogger()
+
+JOB_STREAM = os.getenv('JOB_STREAM', 'jobs:pending')
+JOB_GROUP = os.getenv('JOB_GROUP', 'job-workers')
+JOB_TTL = int(os.getenv('JOB_TTL', 24 * 60 * 60))  # status, input and result of a job
+JOB_STALE_MS = int(os.getenv('JOB_STALE_MS', 60 * 60 * 1000))
+JOB_SOCKET_TIMEOUT = int(os.getenv('JOB_SOCKET_TIMEOUT', 30))
+JOB_MAX_INPUT_BYTES = int(os.getenv('JOB_MAX_INPUT_BYTES', 64 * 1024 * 1024))
+JOB_RESULT_CHUNK = 256 * 1024
+
+# inputs above these run as a job when BACKGROUND_JOBS is on
+JOB_INLINE_MAX_BYTES = int(os.getenv('JOB_INLINE_MAX_BYTES', 2 * 1024 * 1024))
+JOB_INLINE_MAX_QUESTIONS = int(os.getenv('JOB_INLINE_MAX_QUESTIONS', 1000))
+JOB_INLINE_MAX_ROWS = int(os.getenv('JOB_INLINE_MAX_ROWS', 50000))
+
+QUEUED, RUNNING, FINISHED, FAILED = 'queued', 'running', 'finished', 'failed'
+JOB_INTERRUPTED = 'Worker stopped while running the job, submit it again'
+
+
+def run_as_job(params, size, inline_max):
+    """
+    async=true / false in the query string decides, otherwise inputs larger
+    than inline_max do. `size` may be a callable, it is only called when needed.
+    """
+    if not settings.BACKGROUND_JOBS:
+        return False
+
+    flag = (params.get('async') or '').lower()
+    if flag in ('1', 'true'):
+        return True
+
+    if flag in ('0', 'false'):
+        return False
+
+    return (size() if callable(size) else size) > inline_max
+
+
+class JobQueue:
+    """
+    Long admin operations (csv import / export, bulk question ingestion) run
+    by `manage.py run_jobs` workers. A job is a redis hash with its status
+    and result, its input and file result are plain strings next to it and
+    all three expire after JOB_TTL. Job ids go through a stream read by a
+    consumer group, like the answer queue.
+    """
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+
+    @staticmethod
+    def key(job_id):
+        return f"job:{{{job_id}}}"
+
+    @staticmethod
+    def input_key(job_id):
+        return f"job:{{{job_id}}}:input"
+
+    @staticmethod
+    def result_key(job_id):
+        return f"job:{{{job_id}}}:result"
+
+    def ensure_group(self):
+        try:
+            self.redis.xgroup_create(JOB_STREAM, JOB_GROUP, id='0', mkstream=True)
+
+        except redis.ResponseError as e:
+            if 'BUSYGROUP' not in str(e):
+                raise
+
+    def submit(self, kind, args, chunks=()):
+        """Queues a job, `chunks` are the bytes of its input. Returns the job id."""
+        job_id = uuid.uuid4().hex
+        for index, chunk in enumerate(chunks):
+            self.redis.append(self.input_key(job_id), chunk)
+            if index == 0:
+                # an upload cut short by a redis error still expires
+                self.redis.expire(self.input_key(job_id), JOB_TTL)
+
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.hset(self.key(job_id), mapping={
+            'kind': kind,
+            'status': QUEUED,
+            'args': json.dumps(args),
+            'created_at': timezone.now().isoformat(),
+        })
+        pipe.expire(self.key(job_id), JOB_TTL)
+        pipe.xadd(JOB_STREAM, {'job_id': job_id})
+        pipe.execute()
+        return job_id
+
+    def get(self, job_id):
+        raw = self.redis.hgetall(self.key(job_id))
+        if not raw:
+            return None
+
+        job = {key.decode('utf-8'): value.decode('utf-8') for key, value in raw.items()}
+        job['job_id'] = job_id
+        job['args'] = json.loads(job['args'])
+        if 'result' in job:
+            job['result'] = json.loads(job['result'])
+        return job
+
+    def update(self, job_id, **fields):
+        self.redis.hset(self.key(job_id), mapping=fields)
+
+    def read_input(self, job_id):
+        return self.redis.get(self.input_key(job_id)) or b''
+
+    def append_result(self, job_id, chunk):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.append(self.result_key(job_id), chunk)
+        pipe.expire(self.result_key(job_id), JOB_TTL)
+        pipe.execute()
+
+    def iter_result(self, job_id, chunk_size=JOB_RESULT_CHUNK):
+        # the file result in GETRANGE windows, never whole in memory
+        start = 0
+        while True:
+            chunk = self.redis.getrange(self.result_key(job_id), start, start + chunk_size - 1)
+            if not chunk:
+                return
+
+            yield chunk
+            start += len(chunk)
+
+    def stats(self) -> dict:
+        pending = self.redis.xpending(JOB_STREAM, JOB_GROUP)
+        return {
+            'stream_length': self.redis.xlen(JOB_STREAM),
+            'pending': pending['pending'],
+            'consumers': {
+                consumer['name'].decode('utf-8'): consumer['pending'] for consumer in pending['consumers']
+            },
+        }
+
+
+def accepted_response_data(job_id):
+    # body of the 202 returned when a request is turned into a job
+    return {
+        'job_id': job_id,
+        'status': QUEUED,
+        'status_url': reverse('job_status', args=[job_id]),
+        'result_url': reverse('job_result', args=[job_id]),
+    }
+
+
+def _import_users(queue, job_id, args):
+    summary = import_users_csv(
+        io.BytesIO(queue.read_input(job_id)),
+        args['exam_prefix'],
+        batch_size=args['batch_size'],
+        on_conflict=args['on_conflict']
+    )
+    return import_summary_response(summary)
+
+
+def _ingest_questions(queue, job_id, args):
+    data = queue.read_input(job_id)
+    if args['format'] == 'json':
+        rows = json_rows(json.loads(data))
+    elif args['format'] == 'ndjson':
+        rows = ndjson_rows(io.BytesIO(data))
+    else:
+        rows = csv_rows(io.BytesIO(data))
+
+    return ingest_summary_response(ingest_questions(rows, batch_size=args['batch_size']))
+
+
+def _export_users(queue, job_id, args):
+    size = 0
+    for chunk in stream_users_csv(args['exam_prefix'], tuple(args['cursor']) if args['cursor'] else None):
+        encoded = chunk.encode('utf-8')
+        queue.append_result(job_id, encoded)
+        size += len(encoded)
+
+    queue.update(job_id, result_file='users.csv', result_type='text/csv')
+    return {'bytes': size}, status.HTTP_200_OK
+
+
+JOB_HANDLERS = {
+    'import_users': _import_users,
+    'ingest_questions': _ingest_questions,
+    'export_users': _export_users,
+}
+
+
+class JobWorker:
+    """
+    Runs jobs from the stream one at a time. While a job runs its worker
+    heartbeats: it re-claims the stream entry (so it never looks idle) and
+    extends the job's lease. A job whose entry stays pending for
+    JOB_STALE_MS belonged to a worker that died: it is re-run when it never
+    started and marked failed once its lease ran out, imports and ingests
+    are not safe to run twice.
+    """
+
+    def __init__(self, queue, consumer, block_ms=5000, stale_ms=JOB_STALE_MS):
+        self.queue = queue
+        self.redis = queue.redis
+        self.consumer = consumer
+        self.block_ms = block_ms
+        self.stale_ms = stale_ms
+
+    def work_once(self):
+        """Handles at most one job, returns its id or None."""
+        claimed = self.redis.xautoclaim(
+            JOB_STREAM,
+            JOB_GROUP,
+            self.consumer,
+            min_idle_time=self.stale_ms,
+            start_id='0-0',
+            count=1
+        )
+        entries = claimed[1]
+
+        if not entries:
+            response = self.redis.xreadgroup(
+                JOB_GROUP,
+                self.consumer,
+                {JOB_STREAM: '>'},
+                count=1,
+                block=self.block_ms
+            )
+            entries = response[0][1] if response else []
+
+        if not entries:
+            return None
+
+        entry_id, fields = entries[0]
+        job_id = fields[b'job_id'].decode('utf-8')
+        # a redis error out of _run leaves the entry pending, it is claimed again
+        # after JOB_STALE_MS instead of being dropped with the job still queued
+        if self._run(job_id, entry_id):
+            pipe = self.redis.pipeline()
+            pipe.xack(JOB_STREAM, JOB_GROUP, entry_id)
+            pipe.xdel(JOB_STREAM, entry_id)
+            pipe.execute()
+
+        return job_id
+
+    @staticmethod
+    def _now_ms():
+        return int(time.time() * 1000)
+
+    def _heartbeat(self, job_id, entry_id, stopped):
+        while not stopped.wait(self.stale_ms / 3000):
+            try:
+                self.redis.xclaim(JOB_STREAM, JOB_GROUP, self.consumer, 0, [entry_id], justid=True)
+                self.queue.update(job_id, lease_until=self._now_ms() + self.stale_ms)
+
+            except redis.RedisError as e:
+                logger.info(e)
+
+    def _run(self, job_id, entry_id):
+        """False when the entry must stay pending: its job is alive on another worker."""
+        job = self.queue.get(job_id)
+        if job is None:
+            # expired before a worker got to it
+            return True
+
+        if job['status'] == RUNNING:
+            if int(job.get('lease_until', 0)) > self._now_ms():
+                # a late heartbeat, the owner claims the entry back on its next one
+                return False
+
+            self.queue.update(job_id, status=FAILED, error=JOB_INTERRUPTED, finished_at=timezone.now().isoformat())
+            return True
+
+        if job['status'] != QUEUED:
+            return True
+
+        self.queue.update(
+            job_id,
+            status=RUNNING,
+            started_at=timezone.now().isoformat(),
+            worker=self.consumer,
+            lease_until=self._now_ms() + self.stale_ms
+        )
+        stopped = threading.Event()
+        threading.Thread(
+            target=self._heartbeat, args=(job_id, entry_id, stopped), name=f'job-heartbeat-{job_id}', daemon=True
+        ).start()
+        close_old_connections()
+        # like a request, a job starts unpinned from the primary
+        reset_pinning()
+        try:
+            result, result_status = JOB_HANDLERS[job['kind']](self.queue, job_id, job['args'])
+
+        except Exception as e:
+            logger.info(f"job {job_id} ({job['kind']}) failed: {e}")
+            self.queue.update(job_id, status=FAILED, error=str(e), finished_at=timezone.now().isoformat())
+            return True
+
+        finally:
+            stopped.set()
+            close_old_connections()
+
+        self.queue.update(
+            job_id,
+            status=FINISHED,
+            result=json.dumps(result),
+            result_status=result_status,
+            finished_at=timezone.now().isoformat()
+        )
+        self.redis.delete(self.queue.input_key(job_id))
+        return True
+
+    def run(self, stop=None, once=False):
+        self.queue.ensure_group()
+
+        while stop is None or not stop.is_set():
+            try:
+                job_id = self.work_once()
+
+            except redis.RedisError as e:
+                logger.info(e)
+                if once:
+                    raise
+                time.sleep(1)
+                continue
+
+            if job_id:
+                logger.info(f"job worker {self.consumer}: ran job {job_id}")
+
+            if once:
+                return job_id
+
+
+job_queue = JobQueue(RedisManagerClient(socket_timeout=JOB_SOCKET_TIMEOUT).client)
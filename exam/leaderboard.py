@@ -0,0 +1,177 @@
+import os
+import uuid
+
+import redis
+from django.db import transaction
+
+from Saraswati.db_router import replica_reads
+
+from .cache import RedisManagerClient
+from .models import User
+
+import logging
+logger = logging.getLogger()
+
+LEADERBOARD_TOP_MAX = int(os.getenv('LEADERBOARD_TOP_MAX', 100))
+LEADERBOARD_REBUILD_CHUNK = 5000
+
+
+def exam_prefix_of(username):
+    return username.split('_')[0] + '_'
+
+
+class Leaderboard:
+    """
+    One sorted set per exam prefix, member username, score marks. Ranks are
+    competition ranks (1 + students with strictly more marks), so ties share
+    a rank and rank / percentile are two ZCOUNTs, O(log n). When redis is
+    down every read falls back to the (exam_prefix, -marks) index.
+    """
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+
+    @staticmethod
+    def key(exam_prefix):
+        return f"leaderboard:{{{exam_prefix}}}"
+
+    def record(self, scores):
+        """
+        Writes {username: marks} from the question bank's scoring callback to
+        postgres, then to the sorted sets. Returns the usernames that exist.
+        """
+        updated = {}
+        with transaction.atomic():
+            for username, marks in scores.items():
+                if User.objects.filter(username=username).update(marks=marks):
+                    updated[username] = marks
+
+        self.set_marks(updated)
+        return updated
+
+    def set_marks(self, scores):
+        """scores: {username: marks}, already written to postgres."""
+        if not scores:
+            return
+
+        try:
+            pipe = self.redis.pipeline(transaction=False)
+            self.queue_marks(pipe, scores)
+            pipe.execute()
+
+        except redis.RedisError as e:
+            # the next rebuild picks the marks up from postgres
+            logger.info(e)
+
+    @classmethod
+    def queue_marks(cls, pipe, scores):
+        for username, marks in scores.items():
+            pipe.zadd(cls.key(exam_prefix_of(username)), {username: marks})
+
+    def rebuild(self, exam_prefix):
+        # filled under a temporary key and swapped in, readers never see a partial set
+        key = self.key(exam_prefix)
+        building = f"{key}:rebuild:{uuid.uuid4().hex}"
+        users = User.objects.filter(exam_prefix=exam_prefix).order_by('user_id').values_list('user_id', 'username', 'marks')
+
+        count, last_id = 0, 0
+        try:
+            while True:
+                rows = list(users.filter(user_id__gt=last_id)[:LEADERBOARD_REBUILD_CHUNK])
+                if not rows:
+                    break
+
+                self.redis.zadd(building, {username: marks for _, username, marks in rows})
+                count += len(rows)
+                last_id = rows[-1][0]
+
+            if count:
+                self.redis.rename(building, key)
+            else:
+                self.redis.delete(key)
+
+        except Exception:
+            self.redis.delete(building)
+            raise
+
+        return count
+
+    def _top(self, exam_prefix, limit):
+        pipe = self.redis.pipeline(transaction=False)
+        pipe.zrevrange(self.key(exam_prefix), 0, limit - 1, withscores=True)
+        pipe.zcard(self.key(exam_prefix))
+        return pipe.execute()
+
+    def top(self, exam_prefix, limit=10):
+        limit = max(1, min(limit, LEADERBOARD_TOP_MAX))
+
+        try:
+            leaders, total = self._top(exam_prefix, limit)
+            # an exam never built (or lost with a redis flush) is built on first read
+            if not total and self.rebuild(exam_prefix):
+                leaders, total = self._top(exam_prefix, limit)
+            leaders = [(username.decode('utf-8'), int(marks)) for username, marks in leaders]
+
+        except redis.RedisError as e:
+            logger.info(e)
+            with replica_reads():
+                users = User.objects.filter(exam_prefix=exam_prefix)
+                leaders = list(users.order_by('-marks', 'user_id').values_list('username', 'marks')[:limit])
+                total = users.count()
+
+        ranked, rank = [], 0
+        for position, (username, marks) in enumerate(leaders, start=1):
+            if not ranked or ranked[-1]['marks'] != marks:
+                rank = position
+            ranked.append({'rank': rank, 'username': username, 'marks': marks})
+
+        return {'exam_prefix': exam_prefix, 'total': total, 'leaders': ranked}
+
+    def standing(self, username):
+        """Rank and percentile of one student, None when the user does not exist."""
+        exam_prefix = exam_prefix_of(username)
+        key = self.key(exam_prefix)
+
+        try:
+            marks = self.redis.zscore(key, username)
+            if marks is None and not self.redis.exists(key):
+                self.rebuild(exam_prefix)
+                marks = self.redis.zscore(key, username)
+
+            if marks is None:
+                # uploaded after the last rebuild and never scored yet
+                marks = User.objects.filter(username=username).values_list('marks', flat=True).first()
+                if marks is None:
+                    return None
+                self.redis.zadd(key, {username: marks})
+
+            pipe = self.redis.pipeline(transaction=False)
+            pipe.zcount(key, f'({marks}', '+inf')
+            pipe.zcount(key, '-inf', f'({marks}')
+            pipe.zcard(key)
+            above, below, total = pipe.execute()
+
+        except redis.RedisError as e:
+            logger.info(e)
+            with replica_reads():
+                marks = User.objects.filter(username=username).values_list('marks', flat=True).first()
+                if marks is None:
+                    return None
+
+                users = User.objects.filter(exam_prefix=exam_prefix)
+                above = users.filter(marks__gt=marks).count()
+                below = users.filter(marks__lt=marks).count()
+                total = users.count()
+
+        return {
+            'username': username,
+            'exam_prefix': exam_prefix,
+            'marks': int(marks),
+            'rank': above + 1,
+            'total': total,
+            # share of the exam scoring strictly below this student
+            'percentile': round(below * 100 / total, 2) if total else 0.0,
+        }
+
+
+leaderboard = Leaderboard(RedisManagerClient().client)
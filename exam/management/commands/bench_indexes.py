@@ -0,0 +1,122 @@
+import re
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from exam.export import export_queryset
+from exam.models import Exam, User
+
+# seeded rows use a '~' prefixed username, which real rosters never produce
+BENCH_USERNAME_PREFIX = '~'
+BENCH_INDEXES = ['user_active_token_idx', 'user_prefix_marks_idx', 'user_marks_idx', 'user_university_id_idx']
+EXECUTION_TIME = re.compile(r'Execution Time: ([\d.]+) ms')
+
+
+def seed_bench_users(count, prefixes):
+    """Inserts `count` synthetic users spread over `prefixes` exams in one statement."""
+    table = connection.ops.quote_name(User._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {table} (university_id, auth_token, last_logged_in, cdate, marks, student_name,
+                                 university_email, reset_count, exam_prefix, username)
+            SELECT n,
+                   CASE WHEN n %% 10 = 0 THEN md5(n::text) END,
+                   CASE WHEN n %% 10 = 0 THEN now() END,
+                   current_date,
+                   (random() * 100)::int,
+                   'Bench ' || n,
+                   'bench' || n || '@example.edu',
+                   0,
+                   '~' || substr('0123456789abcdefghijklmnopqrstuvwxyz', (n %% %s) + 1, 1) || '_',
+                   %s || n
+            FROM generate_series(1, %s) AS n
+            ON CONFLICT (username) DO NOTHING
+            """,
+            [prefixes, BENCH_USERNAME_PREFIX, count]
+        )
+        cursor.execute(f'ANALYZE {table}')
+
+
+class Command(BaseCommand):
+    help = ('Seed synthetic users and show query plans and timings of the exam hot paths '
+            'without (rolled back DROP INDEX) and with the indexes from migration 0036.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1_000_000)
+        parser.add_argument('--prefixes', type=int, default=30, help='Synthetic exams to spread the users over (<= 36).')
+        parser.add_argument('--runs', type=int, default=5, help='Timed executions per query.')
+        parser.add_argument('--plans', action='store_true', help='Print the full EXPLAIN ANALYZE output.')
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse users seeded by an earlier run.')
+        parser.add_argument('--cleanup', action='store_true', help='Delete the seeded users and exit.')
+
+    def handle(self, *args, **options):
+        if options['cleanup']:
+            deleted, _ = User.objects.filter(username__startswith=BENCH_USERNAME_PREFIX).delete()
+            self.stdout.write(f'deleted {deleted} seeded users')
+            return
+
+        if not options['skip_seed']:
+            prefixes = min(options['prefixes'], 36)
+            self.stdout.write(f"seeding {options['users']} users over {prefixes} exam prefixes ...")
+            seed_bench_users(options['users'], prefixes)
+
+        queries = self.queries()
+        self.stdout.write('DROP INDEX takes an ACCESS EXCLUSIVE lock, run this against a benchmark database only.')
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                for index in BENCH_INDEXES:
+                    cursor.execute(f'DROP INDEX IF EXISTS {connection.ops.quote_name(index)}')
+            before = self.measure(queries, options)
+            transaction.set_rollback(True)
+
+        after = self.measure(queries, options)
+
+        self.stdout.write(f"\n{'query':<34}{'before ms':>12}{'after ms':>12}{'speedup':>10}")
+        for name in queries:
+            speedup = before[name] / after[name] if after[name] else float('inf')
+            self.stdout.write(f'{name:<34}{before[name]:>12.2f}{after[name]:>12.2f}{speedup:>9.1f}x')
+
+    @staticmethod
+    def queries():
+        sample = User.objects.filter(
+            username__startswith=BENCH_USERNAME_PREFIX,
+            auth_token__isnull=False
+        ).values('username', 'auth_token', 'exam_prefix', 'university_id', 'marks', 'user_id').first()
+        exam_prefix = sample['exam_prefix']
+        cursor = (sample['marks'], sample['user_id'])
+
+        return {
+            'token check (username, token)': User.objects.filter(
+                username=sample['username'], auth_token=sample['auth_token']),
+            'token lookup (token only)': User.objects.filter(auth_token=sample['auth_token']),
+            'exam by prefix': Exam.objects.filter(prefix=exam_prefix),
+            'leaderboard top 100 of exam': User.objects.filter(
+                exam_prefix=exam_prefix).order_by('-marks', 'user_id')[:100],
+            'export keyset window of exam': export_queryset(exam_prefix, cursor)[:2000],
+            'export keyset window, all': export_queryset(None, cursor)[:2000],
+            'user by university_id': User.objects.filter(university_id=sample['university_id']),
+        }
+
+    def measure(self, queries, options):
+        timings = {}
+        for name, queryset in queries.items():
+            plan = queryset.explain(analyze=True, buffers=True)
+            if options['plans']:
+                self.stdout.write(f'\n-- {name}\n{plan}')
+
+            samples = []
+            for _ in range(options['runs']):
+                started = time.perf_counter()
+                list(queryset.all())
+                samples.append((time.perf_counter() - started) * 1000)
+
+            match = EXECUTION_TIME.search(plan)
+            timings[name] = statistics.median(samples)
+            if match and not options['plans']:
+                self.stdout.write(f'{name:<34} planner execution {float(match.group(1)):>9.2f} ms')
+
+        return timings
@@ -0,0 +1,71 @@
+import io
+import json
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from exam.fastjson import FastJSONParser, FastJSONRenderer, orjson
+
+
+def question_payload(options, option_length):
+    return {
+        'question_id': 123456,
+        'text': 'Which of the following statements about the given passage is correct? ' * 3,
+        'options': [f'{index}: ' + 'option text with unicode – ünïcödé ' * (option_length // 36 + 1)
+                    for index in range(options)],
+        'cursor': 7,
+        'upcoming': [],
+    }
+
+
+class Command(BaseCommand):
+    help = ('Per request JSON cost of the stdlib DRF parser / renderer against exam.fastjson '
+            'on question payloads with long option lists.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--options', type=int, nargs='+', default=[4, 50, 500],
+                            help='Option list lengths to measure.')
+        parser.add_argument('--option-length', type=int, default=120, help='Characters per option.')
+        parser.add_argument('--iterations', type=int, default=2000)
+        parser.add_argument('--runs', type=int, default=5)
+
+    def handle(self, *args, **options):
+        backend = 'orjson' if orjson is not None else 'stdlib json (orjson not installed)'
+        self.stdout.write(f'fast backend: {backend}')
+        self.stdout.write(f"\n{'options':>8}{'bytes':>9}{'case':>10}{'drf us':>10}{'fast us':>10}{'speedup':>10}")
+
+        for count in options['options']:
+            payload = question_payload(count, options['option_length'])
+            body = json.dumps(payload).encode('utf-8')
+            cases = {
+                'render': (
+                    lambda: JSONRenderer().render(payload),
+                    lambda: FastJSONRenderer().render(payload),
+                ),
+                'parse': (
+                    lambda: JSONParser().parse(io.BytesIO(body)),
+                    lambda: FastJSONParser().parse(io.BytesIO(body)),
+                ),
+            }
+
+            for case, (drf, fast) in cases.items():
+                drf_us = self.measure(drf, options)
+                fast_us = self.measure(fast, options)
+                self.stdout.write(
+                    f'{count:>8}{len(body):>9}{case:>10}{drf_us:>10.2f}{fast_us:>10.2f}{drf_us / fast_us:>9.1f}x'
+                )
+
+    @staticmethod
+    def measure(func, options):
+        # median over runs of the mean microseconds per call
+        samples = []
+        for _ in range(options['runs']):
+            started = time.perf_counter()
+            for _ in range(options['iterations']):
+                func()
+            samples.append((time.perf_counter() - started) * 1_000_000 / options['iterations'])
+
+        return statistics.median(samples)
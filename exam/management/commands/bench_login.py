@@ -0,0 +1,106 @@
+import statistics
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from exam.exam_config import exam_config_cache
+from exam.models import Exam, User
+from exam.sessions import claim_login
+
+BENCH_EXAM_NAME = 'login benchmark'
+
+
+def legacy_login(username, exam_prefix):
+    # the select_for_update login this command compares against
+    with transaction.atomic():
+        user = User.objects.select_for_update().get(username=username)
+        if user.last_logged_in is not None:
+            return False
+
+        user.last_logged_in = timezone.now()
+        user.auth_token = uuid.uuid4().hex
+        user.save()
+        Exam.objects.get(prefix=exam_prefix)
+        return True
+
+
+def lock_free_login(username, exam_prefix):
+    exam_config_cache.get(exam_prefix)
+    return claim_login(username) is not None
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the select_for_update login against the conditional UPDATE login (p50/p95/p99 and logins/sec).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=2000)
+        parser.add_argument('--concurrency', type=int, default=32, help='Parallel logins, keep below the DB pool size.')
+        parser.add_argument('--prefix', default='bm_', help='3 character exam prefix used for the seeded users.')
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded exam and users.')
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        existing = Exam.objects.filter(prefix=prefix).exclude(exam_name=BENCH_EXAM_NAME)
+        if existing.exists():
+            raise CommandError(f'prefix {prefix} belongs to a real exam, pick another with --prefix')
+
+        self.seed(prefix, options['users'])
+        try:
+            for name, login in (('select_for_update', legacy_login), ('conditional UPDATE', lock_free_login)):
+                self.reset(prefix)
+                self.report(name, self.run(login, prefix, options['users'], options['concurrency']))
+
+        finally:
+            if not options['keep']:
+                User.objects.filter(exam_prefix=prefix).delete()
+                Exam.objects.filter(prefix=prefix, exam_name=BENCH_EXAM_NAME).delete()
+
+    def seed(self, prefix, count):
+        Exam.objects.get_or_create(
+            prefix=prefix,
+            defaults={'exam_name': BENCH_EXAM_NAME, 'created_for': 0}
+        )
+        User.objects.bulk_create(
+            [
+                User(username=f'{prefix}{index}', exam_prefix=prefix, university_id=index)
+                for index in range(count)
+            ],
+            batch_size=5000,
+            ignore_conflicts=True
+        )
+
+    @staticmethod
+    def reset(prefix):
+        User.objects.filter(exam_prefix=prefix).update(last_logged_in=None, auth_token=None)
+
+    @staticmethod
+    def run(login, prefix, users, concurrency):
+        def timed_login(index):
+            started = time.perf_counter()
+            try:
+                login(f'{prefix}{index}', prefix)
+                return time.perf_counter() - started
+
+            finally:
+                close_old_connections()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            latencies = list(pool.map(timed_login, range(users)))
+        elapsed = time.perf_counter() - started
+
+        return latencies, elapsed
+
+    def report(self, name, result):
+        latencies, elapsed = result
+        cut_points = statistics.quantiles(latencies, n=100)
+        self.stdout.write(
+            f'{name:>20}: {len(latencies) / elapsed:8.1f} logins/s  '
+            f'p50 {cut_points[49] * 1000:7.2f} ms  '
+            f'p95 {cut_points[94] * 1000:7.2f} ms  '
+            f'p99 {cut_points[98] * 1000:7.2f} ms'
+        )
@@ -0,0 +1,73 @@
+import csv
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from exam.export import Echo, export_serializer
+from exam.management.commands.bench_indexes import BENCH_USERNAME_PREFIX, seed_bench_users
+from exam.models import User
+from exam.serializers import UserCSVSerializer
+
+
+class Command(BaseCommand):
+    help = ('Rows/sec of the export serialization: UserCSVSerializer over model instances (the old '
+            'path) against the compiled values_list serializer, on synthetic users.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100_000)
+        parser.add_argument('--runs', type=int, default=3)
+        parser.add_argument('--skip-seed', action='store_true', help='Reuse users seeded by an earlier run.')
+
+    def handle(self, *args, **options):
+        count = options['users']
+        users = User.objects.filter(username__startswith=BENCH_USERNAME_PREFIX).order_by('user_id')
+
+        if not options['skip_seed'] and users.count() < count:
+            self.stdout.write(f'seeding {count} users ...')
+            seed_bench_users(count, 30)
+
+        users = users[:count]
+        instances = list(users)
+        if not instances:
+            self.stdout.write('no seeded users to serialize')
+            return
+
+        values = list(export_serializer.queryset(users))
+        writer = csv.writer(Echo())
+
+        def model_serializer(rows):
+            for user in UserCSVSerializer(rows, many=True).data:
+                writer.writerow([
+                    user.get('student_name', ''),
+                    user.get('university_email', ''),
+                    user.get('university_id', ''),
+                    user.get('marks', '')
+                ])
+
+        def compiled(rows):
+            for row in export_serializer.rows(rows):
+                writer.writerow(row)
+
+        cases = [
+            ('serialize only', lambda: model_serializer(instances), lambda: compiled(values)),
+            ('fetch + serialize', lambda: model_serializer(users.all()),
+             lambda: compiled(export_serializer.queryset(users.all()))),
+        ]
+
+        self.stdout.write(f"\n{len(instances)} users")
+        self.stdout.write(f"{'case':<20}{'model rows/s':>16}{'compiled rows/s':>18}{'speedup':>10}")
+        for name, old, new in cases:
+            old_rate = len(instances) / self.measure(old, options['runs'])
+            new_rate = len(instances) / self.measure(new, options['runs'])
+            self.stdout.write(f'{name:<20}{old_rate:>16,.0f}{new_rate:>18,.0f}{new_rate / old_rate:>9.1f}x')
+
+    @staticmethod
+    def measure(func, runs):
+        samples = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - started)
+
+        return statistics.median(samples)
@@ -0,0 +1,55 @@
+import json
+import os
+import socket
+import time
+
+from django.core.management.base import BaseCommand
+
+from exam.answer_queue import AnswerDrainer
+from exam.cache import RedisManagerClient
+
+
+class Command(BaseCommand):
+    help = 'Drain write-behind answers from the redis stream to the question bank, or show the queue state.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=200)
+        parser.add_argument('--block-ms', type=int, default=1000, help='How long XREADGROUP waits for new answers.')
+        parser.add_argument('--min-idle-ms', type=int, default=30000,
+                            help='Pending answers idle this long are re-claimed and retried.')
+        parser.add_argument('--consumer', default=f'{socket.gethostname()}-{os.getpid()}')
+        parser.add_argument('--once', action='store_true', help='Drain a single batch and exit.')
+        parser.add_argument('--stats', action='store_true', help='Print queue length, pending and dead-letter counts.')
+        parser.add_argument('--watch', type=int, default=0, metavar='SECONDS',
+                            help='With --stats, refresh every SECONDS.')
+        parser.add_argument('--requeue-dead', action='store_true', help='Move dead-lettered answers back to the stream.')
+
+    def handle(self, *args, **options):
+        drainer = AnswerDrainer(
+            RedisManagerClient(socket_timeout=options['block_ms'] / 1000 + 5).client,
+            consumer=options['consumer'],
+            batch_size=options['batch_size'],
+            block_ms=options['block_ms'],
+            min_idle_ms=options['min_idle_ms']
+        )
+        drainer.ensure_group()
+
+        if options['requeue_dead']:
+            self.stdout.write(f"requeued {drainer.requeue_dead_letters()} dead-lettered answers")
+            return
+
+        if options['stats']:
+            while True:
+                self.stdout.write(json.dumps(drainer.stats()))
+                if not options['watch']:
+                    return
+                time.sleep(options['watch'])
+
+        self.stdout.write(f"draining answers as consumer {options['consumer']}")
+        try:
+            result = drainer.run(once=options['once'])
+            if options['once']:
+                self.stdout.write(json.dumps(result))
+
+        except KeyboardInterrupt:
+            self.stdout.write('stopped')
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from exam.leaderboard import leaderboard
+from exam.models import User
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the redis leaderboard sorted sets from the marks in postgres.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--exam-prefix', action='append', default=[],
+                            help='Only this exam, can be repeated. Every exam with users by default.')
+
+    def handle(self, *args, **options):
+        prefixes = options['exam_prefix'] or User.objects.order_by().values_list('exam_prefix', flat=True).distinct()
+
+        for exam_prefix in sorted(prefixes):
+            self.stdout.write(f'{exam_prefix}: {leaderboard.rebuild(exam_prefix)} students')
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from exam.prefixes import PREFIX_RECYCLE_AFTER_DAYS, prefix_allocator
+
+
+class Command(BaseCommand):
+    help = 'Return prefixes of long expired exams to the free pool and rebuild the redis free set.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=PREFIX_RECYCLE_AFTER_DAYS,
+                            help='Only exams whose valid_till passed this many days ago.')
+        parser.add_argument('--dry-run', action='store_true')
+        parser.add_argument('--refill', action='store_true', help='Rebuild the free set from the DB afterwards.')
+
+    def handle(self, *args, **options):
+        released, blocked = prefix_allocator.release_expired(options['days'], dry_run=options['dry_run'])
+        self.stdout.write(f"{'would release' if options['dry_run'] else 'released'} {len(released)}: {sorted(released)}")
+        if blocked:
+            self.stdout.write(f"kept {len(blocked)} still referenced by users: {sorted(blocked)}")
+
+        if options['refill'] and not options['dry_run']:
+            self.stdout.write('free set rebuilt' if prefix_allocator.refill() else 'free set rebuild already running')
@@ -0,0 +1,60 @@
+import json
+import os
+import socket
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+
+from exam.jobs import JobWorker, job_queue
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (csv import / export, bulk question ingestion), or show the queue state.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Jobs run in parallel by this process.')
+        parser.add_argument('--block-ms', type=int, default=5000, help='How long XREADGROUP waits for new jobs.')
+        parser.add_argument('--consumer', default=f'{socket.gethostname()}-{os.getpid()}')
+        parser.add_argument('--once', action='store_true', help='Run a single job and exit.')
+        parser.add_argument('--stats', action='store_true', help='Print queue length and pending jobs per worker.')
+        parser.add_argument('--watch', type=int, default=0, metavar='SECONDS',
+                            help='With --stats, refresh every SECONDS.')
+
+    def handle(self, *args, **options):
+        job_queue.ensure_group()
+
+        if options['stats']:
+            while True:
+                self.stdout.write(json.dumps(job_queue.stats()))
+                if not options['watch']:
+                    return
+                time.sleep(options['watch'])
+
+        if options['once']:
+            self.stdout.write(f"ran job {JobWorker(job_queue, options['consumer']).run(once=True)}")
+            return
+
+        stop = threading.Event()
+        workers = [
+            threading.Thread(
+                target=JobWorker(job_queue, f"{options['consumer']}-{index}", block_ms=options['block_ms']).run,
+                kwargs={'stop': stop},
+                name=f'job-worker-{index}'
+            )
+            for index in range(max(options['workers'], 1))
+        ]
+        for worker in workers:
+            worker.start()
+
+        self.stdout.write(f"running jobs with {len(workers)} workers as {options['consumer']}")
+        try:
+            while any(worker.is_alive() for worker in workers):
+                time.sleep(1)
+
+        except KeyboardInterrupt:
+            # running jobs finish first, idle workers stop after their next XREADGROUP
+            stop.set()
+            for worker in workers:
+                worker.join()
+            self.stdout.write('stopped')
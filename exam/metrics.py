@@ -0,0 +1,155 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Per process histograms, rendered in the Prometheus text format by
+# /api/metrics. Every worker keeps its own, the `pid` label keeps the series
+# of different workers apart.
+
+DEPENDENCIES = ('db', 'redis', 'upstream')
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+_current = ContextVar('request_timings', default=None)
+
+
+class RequestTimings:
+    """Time spent in each dependency while serving one request."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.ms = dict.fromkeys(DEPENDENCIES, 0.0)
+        self.queries = 0
+
+    def add(self, dependency, ms):
+        self.ms[dependency] += ms
+
+    def total_ms(self):
+        return (time.perf_counter() - self.started) * 1000
+
+    def server_timing(self):
+        parts = [f'{dependency};dur={self.ms[dependency]:.1f}' for dependency in DEPENDENCIES]
+        parts[0] += f';desc="{self.queries} queries"'
+        parts.append(f'total;dur={self.total_ms():.1f}')
+        return ', '.join(parts)
+
+
+def start_request():
+    timings = RequestTimings()
+    return timings, _current.set(timings)
+
+
+def end_request(token):
+    _current.reset(token)
+
+
+def current_timings():
+    return _current.get()
+
+
+@contextmanager
+def dependency_timer(dependency):
+    # a no-op outside a request, e.g. in the answer drainer
+    timings = _current.get()
+    if timings is None:
+        yield
+        return
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings.add(dependency, (time.perf_counter() - started) * 1000)
+
+
+def query_timer(execute, sql, params, many, context):
+    """Database execute wrapper, installed on every connection by exam.signals."""
+    timings = _current.get()
+    if timings is None:
+        return execute(sql, params, many, context)
+
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        timings.queries += 1
+        timings.add('db', (time.perf_counter() - started) * 1000)
+
+
+class Histogram:
+
+    def __init__(self, name, documentation, label_names, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = label_names
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+
+            series[0][bisect.bisect_left(self.buckets, value)] += 1
+            series[1] += value
+
+    def render(self, pid):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} histogram']
+        with self._lock:
+            series = {labels: ([*counts], total) for labels, (counts, total) in self._series.items()}
+
+        for labels, (counts, total) in sorted(series.items()):
+            label_text = ','.join(
+                f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels)
+            ) + f',pid="{pid}"'
+
+            cumulative = 0
+            for bound, count in zip([*self.buckets, '+Inf'], counts):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{label_text},le="{bound}"}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{label_text}}} {total}')
+            lines.append(f'{self.name}_count{{{label_text}}} {cumulative}')
+
+        return lines
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+request_duration = Histogram(
+    'saraswati_request_duration_seconds',
+    'Time to serve a request.',
+    ('endpoint', 'method', 'status'),
+    LATENCY_BUCKETS
+)
+dependency_duration = Histogram(
+    'saraswati_request_dependency_seconds',
+    'Time a request spent in the database, redis or the question bank.',
+    ('endpoint', 'dependency'),
+    LATENCY_BUCKETS
+)
+request_queries = Histogram(
+    'saraswati_request_queries',
+    'Database queries run by a request.',
+    ('endpoint',),
+    QUERY_BUCKETS
+)
+
+
+def observe_request(endpoint, method, status_code, timings):
+    request_duration.observe((endpoint, method, f'{status_code // 100}xx'), timings.total_ms() / 1000)
+    for dependency in DEPENDENCIES:
+        dependency_duration.observe((endpoint, dependency), timings.ms[dependency] / 1000)
+    request_queries.observe((endpoint,), timings.queries)
+
+
+def render_metrics(pid):
+    lines = []
+    for histogram in (request_duration, dependency_duration, request_queries):
+        lines.extend(histogram.render(pid))
+    return '\n'.join(lines) + '\n'
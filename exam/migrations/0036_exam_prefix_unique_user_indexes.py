@@ -0,0 +1,70 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def check_duplicate_prefixes(apps, schema_editor):
+    Exam = apps.get_model("exam", "Exam")
+    duplicates = list(
+        Exam.objects.exclude(prefix="")
+        .values("prefix")
+        .annotate(exams=Count("exam_id"))
+        .filter(exams__gt=1)
+        .values_list("prefix", flat=True)
+    )
+    if duplicates:
+        raise RuntimeError(
+            f"Exam prefixes {duplicates} are used by more than one exam, "
+            f"rename the stale exams before adding exam_prefix_unique."
+        )
+
+
+class Migration(migrations.Migration):
+    # user indexes are built CONCURRENTLY so the table stays writable, which
+    # cannot run inside a transaction
+    atomic = False
+
+    dependencies = [
+        ("exam", "0035_alter_exam_valid_till"),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicate_prefixes, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="exam",
+            constraint=models.UniqueConstraint(
+                condition=~Q(prefix=""),
+                fields=("prefix",),
+                name="exam_prefix_unique",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="user",
+            index=models.Index(
+                condition=Q(auth_token__isnull=False),
+                fields=["auth_token"],
+                name="user_active_token_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="user",
+            index=models.Index(
+                fields=["exam_prefix", "-marks", "user_id"],
+                name="user_prefix_marks_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="user",
+            index=models.Index(
+                fields=["-marks", "user_id"],
+                name="user_marks_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="user",
+            index=models.Index(
+                fields=["university_id"],
+                name="user_university_id_idx",
+            ),
+        ),
+    ]
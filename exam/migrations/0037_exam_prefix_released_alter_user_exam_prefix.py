@@ -0,0 +1,33 @@
+from django.db import migrations, models
+from django.db.models import Q
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("exam", "0036_exam_prefix_unique_user_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="exam",
+            name="prefix_released",
+            field=models.BooleanField(default=False),
+        ),
+        migrations.RemoveConstraint(
+            model_name="exam",
+            name="exam_prefix_unique",
+        ),
+        migrations.AddConstraint(
+            model_name="exam",
+            constraint=models.UniqueConstraint(
+                condition=Q(prefix_released=False) & ~Q(prefix=""),
+                fields=("prefix",),
+                name="exam_prefix_unique",
+            ),
+        ),
+        migrations.AlterField(
+            model_name="user",
+            name="exam_prefix",
+            field=models.CharField(default="NA", max_length=5),
+        ),
+    ]
@@ -2,6 +2,7 @@ import random
 from datetime import timedelta
 
 from django.db import models
+from django.db.models import Q
 from django.utils import timezone
 from rest_framework.authtoken.models import Token
 
@@ -16,6 +17,17 @@ class Exam(models.Model):
     valid_till = models.DateTimeField(default=timezone.now() + timedelta(days=14))
     prefix = models.CharField(max_length=5, default="")
     time_per_question = models.IntegerField(default=30)
+    prefix_released = models.BooleanField(default=False)  # expired exam whose prefix went back to the pool
+
+    class Meta:
+        constraints = [
+            # login and question fetch resolve the exam with get(prefix=...)
+            models.UniqueConstraint(
+                fields=['prefix'],
+                condition=Q(prefix_released=False) & ~Q(prefix=''),
+                name='exam_prefix_unique'
+            ),
+        ]
 
     def save(self, *args, **kwargs):
         if not self.pk:
@@ -37,8 +49,18 @@ class User(models.Model):
     student_name = models.CharField(max_length=50, default="None")
     university_email = models.EmailField(default="None")
     reset_count = models.IntegerField(default=0)
-    exam_prefix = models.CharField(max_length=3, default="NA")
+    exam_prefix = models.CharField(max_length=5, default="NA")
     username = models.CharField(max_length=15, default="NA", unique=True)
 
+    class Meta:
+        indexes = [
+            # only logged in students carry a token
+            models.Index(fields=['auth_token'], condition=Q(auth_token__isnull=False), name='user_active_token_idx'),
+            # per exam leaderboard and export, keyset order (-marks, user_id)
+            models.Index(fields=['exam_prefix', '-marks', 'user_id'], name='user_prefix_marks_idx'),
+            models.Index(fields=['-marks', 'user_id'], name='user_marks_idx'),
+            models.Index(fields=['university_id'], name='user_university_id_idx'),
+        ]
+
     def __str__(self):
         return self.username
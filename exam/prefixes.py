@@ -0,0 +1,146 @@
+import itertools
+import os
+import random
+import time
+from datetime import timedelta
+
+import redis
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .cache import RedisManagerClient
+from .constants import PrefixPoolExhausted
+from .models import Exam, User
+
+import logging
+logger = logging.getLogger()
+
+PREFIX_ALPHABET = 'abcdefghijklmnopqrstuvwxyz0123456789'
+PREFIX_LENGTH = int(os.getenv('EXAM_PREFIX_LENGTH', 2))  # up to 4, User.exam_prefix holds 5 chars
+PREFIX_RECYCLE_AFTER_DAYS = int(os.getenv('EXAM_PREFIX_RECYCLE_AFTER_DAYS', 30))
+PREFIX_ALLOCATE_ATTEMPTS = 10
+PREFIX_FREE_SET = f'exam:prefixes:free:{PREFIX_LENGTH}'
+PREFIX_REFILL_LOCK = f'{PREFIX_FREE_SET}:lock'
+
+
+def all_prefixes():
+    return {''.join(letters) + '_' for letters in itertools.product(PREFIX_ALPHABET, repeat=PREFIX_LENGTH)}
+
+
+class PrefixAllocator:
+    """
+    Hands out exam prefixes from a redis free set (SPOP, O(1)). The unique
+    exam_prefix_unique index is the source of truth, a stale free set only
+    costs a retry. The set is rebuilt from the DB when it runs dry.
+    """
+
+    def __init__(self, redis_client):
+        self.redis = redis_client
+
+    @staticmethod
+    def allocated_prefixes():
+        # users outlive their exam, their usernames still carry the prefix
+        exams = Exam.objects.filter(prefix_released=False).values_list('prefix', flat=True)
+        users = User.objects.order_by().values_list('exam_prefix', flat=True).distinct()
+        return set(exams) | set(users)
+
+    def refill(self):
+        # False when another process is already rebuilding the set
+        if not self.redis.set(PREFIX_REFILL_LOCK, 1, nx=True, ex=30):
+            return False
+
+        try:
+            free = all_prefixes() - self.allocated_prefixes()
+            pipe = self.redis.pipeline()
+            pipe.delete(PREFIX_FREE_SET)
+            if free:
+                pipe.sadd(PREFIX_FREE_SET, *free)
+            pipe.execute()
+
+        finally:
+            self.redis.delete(PREFIX_REFILL_LOCK)
+
+        return True
+
+    def _candidate(self):
+        try:
+            prefix = self.redis.spop(PREFIX_FREE_SET)
+            if prefix is None and not self.refill():
+                deadline = time.monotonic() + 2
+                while prefix is None and time.monotonic() < deadline:
+                    time.sleep(0.05)
+                    prefix = self.redis.spop(PREFIX_FREE_SET)
+
+            elif prefix is None:
+                prefix = self.redis.spop(PREFIX_FREE_SET)
+
+            return prefix.decode('utf-8') if prefix is not None else None
+
+        except redis.RedisError as e:
+            # without redis fall back to random picks, the unique index still guards
+            logger.info(e)
+            return random.choice(sorted(all_prefixes()))
+
+    def _give_back(self, prefix):
+        try:
+            self.redis.sadd(PREFIX_FREE_SET, prefix)
+
+        except redis.RedisError as e:
+            logger.info(e)
+
+    def allocate(self, create):
+        """
+        Calls create(prefix) with free prefixes until one sticks and returns
+        its result. create must write the Exam row.
+        """
+        for _ in range(PREFIX_ALLOCATE_ATTEMPTS):
+            prefix = self._candidate()
+            if prefix is None:
+                break
+
+            try:
+                with transaction.atomic():
+                    return create(prefix)
+
+            except IntegrityError as e:
+                if 'exam_prefix_unique' not in str(e):
+                    self._give_back(prefix)
+                    raise
+                # already taken, the free set was stale
+
+            except Exception:
+                self._give_back(prefix)
+                raise
+
+        raise PrefixPoolExhausted()
+
+    def release_expired(self, older_than_days=PREFIX_RECYCLE_AFTER_DAYS, dry_run=False):
+        """
+        Returns prefixes of exams expired for older_than_days to the pool. An
+        exam whose students are still in the users table keeps its prefix,
+        their usernames would collide with the next roster.
+        """
+        released, blocked = [], []
+        expired = Exam.objects.filter(
+            prefix_released=False,
+            valid_till__lt=timezone.now() - timedelta(days=older_than_days)
+        ).exclude(prefix='')
+
+        for exam in expired:
+            if User.objects.filter(exam_prefix=exam.prefix).exists():
+                blocked.append(exam.prefix)
+                continue
+
+            released.append(exam.prefix)
+            if dry_run:
+                continue
+
+            exam.prefix_released = True
+            exam.save(update_fields=['prefix_released'])
+            if len(exam.prefix) == PREFIX_LENGTH + 1:
+                self._give_back(exam.prefix)
+
+        return released, blocked
+
+
+prefix_allocator = PrefixAllocator(RedisManagerClient().client)
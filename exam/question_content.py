@@ -0,0 +1,197 @@
+import json
+import os
+
+import redis
+
+from .async_utils import async_question_bank_network_call
+from .cache import LocalCache, RedisManagerClient, async_redis_client
+from .question_paper import question_fields
+from .utils import question_bank_network_call
+
+import logging
+logger = logging.getLogger()
+
+QUESTION_CONTENT_TTL = int(os.getenv('QUESTION_CONTENT_CACHE_TTL', 24 * 60 * 60))
+QUESTION_LOCAL_TTL = int(os.getenv('QUESTION_LOCAL_CACHE_TTL', 10 * 60))
+QUESTION_LOCAL_MAX_SIZE = int(os.getenv('QUESTION_LOCAL_CACHE_SIZE', 20000))
+QUESTION_CONTENT_PATH = os.getenv('QUESTION_CONTENT_PATH', '/question/content')
+QUESTION_POOL_PATH = os.getenv('QUESTION_POOL_PATH', '/question/pool')
+QUESTION_IDS_ONLY = os.getenv('QUESTION_IDS_ONLY', 'false').lower() == 'true'
+
+
+def question_request(username, no_of_questions):
+    # params of the per question /question proxy call
+    params = {
+        "username": username,
+        "question_limit": no_of_questions
+    }
+    if QUESTION_IDS_ONLY:
+        # the question bank only picks the id, the content comes from the cache
+        params["ids_only"] = "true"
+    return params
+
+
+class QuestionContentCache:
+    """
+    Question text and options by question_id, shared by every student of a
+    hall: process memory, then redis (one MGET for all misses), then one
+    batched question bank call for whatever is still missing. Questions do
+    not change once an exam is running, entries only expire.
+    """
+
+    def __init__(self, redis_client, async_redis):
+        self.redis = redis_client
+        self.async_redis = async_redis
+        self.local = LocalCache('question', max_size=QUESTION_LOCAL_MAX_SIZE, ttl=QUESTION_LOCAL_TTL)
+
+    @staticmethod
+    def key(question_id):
+        return f"question:{question_id}"
+
+    def _from_local(self, question_ids):
+        found, missing = {}, []
+        for question_id in question_ids:
+            question = self.local.get(question_id)
+            if question is None:
+                missing.append(question_id)
+            else:
+                found[question_id] = question
+        return found, missing
+
+    def _remember(self, found, missing, raws):
+        # fills found from redis values, returns the ids redis did not have either
+        upstream = []
+        for question_id, raw in zip(missing, raws):
+            if raw is None:
+                upstream.append(question_id)
+                continue
+
+            found[question_id] = json.loads(raw)
+            self.local.set(question_id, found[question_id])
+        return upstream
+
+    @staticmethod
+    def _fetched(response):
+        if not isinstance(response, dict) or response.get('error'):
+            return []
+        return [question_fields(question) for question in response.get('questions', [])]
+
+    def _keep_local(self, questions):
+        for question in questions:
+            self.local.set(question['question_id'], question)
+        return {self.key(question['question_id']): json.dumps(question) for question in questions}
+
+    def put_many(self, questions):
+        encoded = self._keep_local(questions)
+        if not encoded:
+            return
+
+        try:
+            self.redis.set_many(encoded, ex=QUESTION_CONTENT_TTL)
+
+        except redis.RedisError as e:
+            logger.info(e)
+
+    async def aput_many(self, questions):
+        encoded = self._keep_local(questions)
+        if not encoded:
+            return
+
+        try:
+            await self.async_redis.client.set_many(encoded, ex=QUESTION_CONTENT_TTL)
+
+        except redis.RedisError as e:
+            logger.info(e)
+
+    def get_many(self, question_ids):
+        """{question_id: question} for every id the cache or the question bank knows."""
+        found, missing = self._from_local(question_ids)
+        if not missing:
+            return found
+
+        try:
+            missing = self._remember(found, missing, self.redis.get_many([self.key(i) for i in missing]))
+
+        except redis.RedisError as e:
+            logger.info(e)
+
+        if missing:
+            questions = self._fetched(question_bank_network_call(
+                {"question_ids": ','.join(str(question_id) for question_id in missing)},
+                "GET",
+                QUESTION_CONTENT_PATH
+            ))
+            self.put_many(questions)
+            found.update((question['question_id'], question) for question in questions)
+
+        return found
+
+    async def aget_many(self, question_ids):
+        found, missing = self._from_local(question_ids)
+        if not missing:
+            return found
+
+        try:
+            raws = await self.async_redis.client.get_many([self.key(i) for i in missing])
+            missing = self._remember(found, missing, raws)
+
+        except redis.RedisError as e:
+            logger.info(e)
+
+        if missing:
+            questions = self._fetched(await async_question_bank_network_call(
+                {"question_ids": ','.join(str(question_id) for question_id in missing)},
+                "GET",
+                QUESTION_CONTENT_PATH
+            ))
+            await self.aput_many(questions)
+            found.update((question['question_id'], question) for question in questions)
+
+        return found
+
+    def get(self, question_id):
+        return self.get_many([question_id]).get(question_id)
+
+    async def aget(self, question_id):
+        return (await self.aget_many([question_id])).get(question_id)
+
+    def from_response(self, response):
+        """
+        The question of a /question response: ids only responses are looked up,
+        full ones are cached on the way through. None when the content is unknown.
+        Returns a copy, callers may add fields to it.
+        """
+        if 'text' not in response:
+            question = self.get(response['question_id'])
+            return dict(question) if question is not None else None
+
+        question = question_fields(response)
+        if self.local.get(question['question_id']) is None:
+            self.put_many([question])
+        return dict(question)
+
+    async def afrom_response(self, response):
+        if 'text' not in response:
+            question = await self.aget(response['question_id'])
+            return dict(question) if question is not None else None
+
+        question = question_fields(response)
+        if self.local.get(question['question_id']) is None:
+            await self.aput_many([question])
+        return dict(question)
+
+    def warm_exam(self, exam_prefix):
+        """
+        Loads the whole question pool of an exam before it opens. Returns the
+        number of questions cached, None when the question bank failed.
+        """
+        response = question_bank_network_call({"exam_prefix": exam_prefix}, "GET", QUESTION_POOL_PATH)
+        if not isinstance(response, dict) or response.get('error'):
+            return None
+
+        questions = self._fetched(response)
+        self.put_many(questions)
+        return len(questions)
+
+
+question_content_cache = QuestionContentCache(RedisManagerClient().client, async_redis_client)
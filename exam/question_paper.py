@@ -0,0 +1,181 @@
+import json
+import os
+
+import redis
+
+from .async_utils import async_question_bank_network_call
+from .cache import RedisManagerClient, async_redis_client
+from .sessions import SESSION_TTL
+from .utils import question_bank_network_call
+
+import logging
+logger = logging.getLogger()
+
+QUESTION_PAPER_PATH = os.getenv('QUESTION_PAPER_PATH', '/question/paper')
+QUESTION_LOOKAHEAD_MAX = int(os.getenv('QUESTION_LOOKAHEAD_MAX', 5))
+NO_MORE_QUESTIONS = 'No more questions'
+
+# Pops the question at the cursor plus up to ARGV[1] following ones in one round
+# trip. Returns {-1} when the paper is not cached, else {index, question...}.
+NEXT_QUESTIONS_SCRIPT = """
+if redis.call('EXISTS', KEYS[1]) == 0 then
+    return {-1}
+end
+local index = redis.call('INCR', KEYS[2]) - 1
+local items = redis.call('LRANGE', KEYS[1], index, index + tonumber(ARGV[1]))
+if #items > 1 then
+    redis.call('INCRBY', KEYS[2], #items - 1)
+end
+redis.call('EXPIRE', KEYS[2], ARGV[2])
+local result = {index}
+for _, item in ipairs(items) do
+    table.insert(result, item)
+end
+return result
+"""
+
+
+def question_fields(question):
+    return {
+        'question_id': question['question_id'],
+        'text': question['text'],
+        'options': question['options']
+    }
+
+
+class QuestionPaperCache:
+    """
+    A student's whole ordered paper, fetched from the question bank in one
+    call and kept in redis next to the session. /api/question then walks it
+    with a server side cursor instead of proxying every question.
+    """
+
+    def __init__(self, redis_client, async_redis):
+        self.redis = redis_client
+        self.async_redis = async_redis
+        self.next_script = redis_client.register_script(NEXT_QUESTIONS_SCRIPT)
+
+    @staticmethod
+    def key(username):
+        # the {username} hash tag keeps both keys in one slot under redis cluster
+        return f"paper:{{{username}}}"
+
+    @staticmethod
+    def cursor_key(username):
+        return f"paper:{{{username}}}:cursor"
+
+    @staticmethod
+    def _paper(response):
+        if not isinstance(response, dict) or response.get('error') or not response.get('questions'):
+            return None
+
+        return [json.dumps(question_fields(question)) for question in response['questions']]
+
+    def _store(self, pipe, username, paper):
+        pipe.delete(self.key(username), self.cursor_key(username))
+        pipe.rpush(self.key(username), *paper)
+        pipe.expire(self.key(username), SESSION_TTL)
+
+    def prefetch(self, username, no_of_questions):
+        paper = self._paper(question_bank_network_call({
+                "username": username,
+                "question_limit": no_of_questions
+            },
+            "GET",
+            QUESTION_PAPER_PATH
+        ))
+        if paper is None:
+            return False
+
+        try:
+            pipe = self.redis.pipeline()
+            self._store(pipe, username, paper)
+            pipe.execute()
+            return True
+
+        except redis.RedisError as e:
+            logger.info(e)
+            return False
+
+    async def aprefetch(self, username, no_of_questions):
+        paper = self._paper(await async_question_bank_network_call({
+                "username": username,
+                "question_limit": no_of_questions
+            },
+            "GET",
+            QUESTION_PAPER_PATH
+        ))
+        if paper is None:
+            return False
+
+        try:
+            pipe = self.async_redis.client.pipeline()
+            self._store(pipe, username, paper)
+            await pipe.execute()
+            return True
+
+        except redis.RedisError as e:
+            logger.info(e)
+            return False
+
+    @staticmethod
+    def _response(result):
+        # None: paper not cached, use the per question proxy
+        if result[0] == -1:
+            return None
+
+        if len(result) == 1:
+            return {
+                'error': NO_MORE_QUESTIONS,
+                'is_success': False
+            }
+
+        questions = [json.loads(item) for item in result[1:]]
+        data = dict(questions[0], cursor=result[0])
+        if len(questions) > 1:
+            data['upcoming'] = questions[1:]
+
+        return data
+
+    def serve(self, username, no_of_questions, lookahead=0):
+        lookahead = max(0, min(lookahead, QUESTION_LOOKAHEAD_MAX))
+        keys = [self.key(username), self.cursor_key(username)]
+
+        try:
+            data = self._response(self.next_script(keys=keys, args=[lookahead, SESSION_TTL]))
+            if data is None and self.prefetch(username, no_of_questions):
+                data = self._response(self.next_script(keys=keys, args=[lookahead, SESSION_TTL]))
+            return data
+
+        except redis.RedisError as e:
+            logger.info(e)
+            return None
+
+    async def aserve(self, username, no_of_questions, lookahead=0):
+        lookahead = max(0, min(lookahead, QUESTION_LOOKAHEAD_MAX))
+        keys = [self.key(username), self.cursor_key(username)]
+        next_script = self.async_redis.client.register_script(NEXT_QUESTIONS_SCRIPT)
+
+        try:
+            data = self._response(await next_script(keys=keys, args=[lookahead, SESSION_TTL]))
+            if data is None and await self.aprefetch(username, no_of_questions):
+                data = self._response(await next_script(keys=keys, args=[lookahead, SESSION_TTL]))
+            return data
+
+        except redis.RedisError as e:
+            logger.info(e)
+            return None
+
+    def invalidate(self, username):
+        try:
+            self.redis.delete(self.key(username), self.cursor_key(username))
+
+        except redis.RedisError as e:
+            logger.info(e)
+
+    def invalidate_many(self, pipe, usernames):
+        for username in usernames:
+            pipe.delete(self.key(username), self.cursor_key(username))
+
+
+question_paper_cache = QuestionPaperCache(RedisManagerClient().client, async_redis_client)
@@ -0,0 +1,81 @@
+import os
+
+import redis
+from django.db import connection
+
+from Saraswati.db_router import pin_to_primary
+
+from .cache import RedisManagerClient
+from .exam_timer import exam_timer
+from .leaderboard import leaderboard
+from .models import User
+from .question_paper import question_paper_cache
+from .sessions import session_cache
+from .utils import question_bank_network_call
+
+import logging
+logger = logging.getLogger()
+
+RESET_BULK_PATH = os.getenv('RESET_BULK_PATH', '/reset/student/answers/bulk')
+RESET_BULK_MAX = int(os.getenv('RESET_BULK_MAX', 5000))  # usernames per api/exam/rest/bulk call
+
+redis_client = RedisManagerClient().client
+
+
+def _reset_sql(by_usernames, by_exam_prefix):
+    qn = connection.ops.quote_name
+
+    def column(name):
+        return qn(User._meta.get_field(name).column)
+
+    conditions = [f"{column('last_logged_in')} IS NOT NULL"]
+    if by_usernames:
+        conditions.append(f"{column('username')} = ANY(%s)")
+    if by_exam_prefix:
+        conditions.append(f"{column('exam_prefix')} = %s")
+
+    # reset_count = reset_count + 1 is F('reset_count') + 1, written out because
+    # QuerySet.update() cannot return the rows it touched
+    return (
+        f"UPDATE {qn(User._meta.db_table)} SET {column('last_logged_in')} = NULL, "
+        f"{column('auth_token')} = NULL, {column('marks')} = 0, "
+        f"{column('reset_count')} = {column('reset_count')} + 1 "
+        f"WHERE {' AND '.join(conditions)} "
+        f"RETURNING {column('username')}"
+    )
+
+
+def reset_students(usernames=None, exam_prefix=None):
+    """
+    Resets every logged in student among `usernames` and / or of `exam_prefix`
+    with one UPDATE, drops their sessions, papers, timers and leaderboard
+    marks in one redis pipeline and resets their answers with one question
+    bank call.
+    Returns (reset usernames, question bank response or None).
+    """
+    params = [list(usernames)] if usernames else []
+    if exam_prefix:
+        params.append(exam_prefix)
+
+    with connection.cursor() as cursor:
+        cursor.execute(_reset_sql(bool(usernames), bool(exam_prefix)), params)
+        reset = [row[0] for row in cursor.fetchall()]
+
+    pin_to_primary()
+
+    if not reset:
+        return reset, None
+
+    try:
+        pipe = redis_client.pipeline(transaction=False)
+        session_cache.invalidate_many(pipe, reset)
+        question_paper_cache.invalidate_many(pipe, reset)
+        exam_timer.invalidate_many(pipe, reset)
+        leaderboard.queue_marks(pipe, dict.fromkeys(reset, 0))
+        pipe.execute()
+
+    except redis.RedisError as e:
+        # like a failed single reset, cached sessions then live until their TTL
+        logger.info(e)
+
+    return reset, question_bank_network_call({"usernames": reset}, "POST", RESET_BULK_PATH)
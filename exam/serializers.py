@@ -1,9 +1,12 @@
+from functools import lru_cache
+
 from rest_framework import serializers
 
 from .models import Exam, User
 
 
 class UserCSVSerializer(serializers.ModelSerializer):
+    # full model serializer, kept for comparison in `manage.py bench_serializers`
     class Meta:
         model = User
         fields = '__all__'
@@ -17,3 +20,69 @@ class ExamSerializer(serializers.ModelSerializer):
     class Meta:
         model = Exam
         fields = '__all__'
+        # both are managed by exam.prefixes, a client set prefix_released would
+        # put the exam outside the unique prefix constraint exam_config relies on
+        read_only_fields = ['prefix', 'prefix_released']
+
+
+def _datetime(value):
+    # same output as DRF's DateTimeField
+    value = value.isoformat()
+    return value[:-6] + 'Z' if value.endswith('+00:00') else value
+
+
+def _date(value):
+    return value.isoformat()
+
+
+def _converter(field):
+    internal_type = field.get_internal_type()
+    if internal_type == 'DateTimeField':
+        return _datetime
+    if internal_type == 'DateField':
+        return _date
+    if internal_type == 'DecimalField':
+        return str
+    return None
+
+
+class ValuesSerializer:
+    """
+    Read only serializer over values_list() tuples. The converter of every
+    field is looked up once from the model's _meta, rows then cost one tuple
+    (or nothing at all when no field needs converting), no model instances,
+    field introspection or validation per row.
+    """
+
+    def __init__(self, model, fields):
+        self.model = model
+        self.fields = tuple(fields)
+        self.converters = tuple(_converter(model._meta.get_field(name)) for name in self.fields)
+        self.passthrough = not any(self.converters)
+
+    def queryset(self, queryset):
+        return queryset.values_list(*self.fields)
+
+    def row(self, values):
+        if self.passthrough:
+            return values
+
+        return tuple(
+            value if convert is None or value is None else convert(value)
+            for convert, value in zip(self.converters, values)
+        )
+
+    def rows(self, rows):
+        if self.passthrough:
+            return rows
+
+        return map(self.row, rows)
+
+    def dicts(self, rows):
+        return (dict(zip(self.fields, row)) for row in self.rows(rows))
+
+
+@lru_cache(maxsize=None)
+def values_serializer(model, fields) -> ValuesSerializer:
+    # compiled once per (model, fields), fields must be a tuple
+    return ValuesSerializer(model, fields)
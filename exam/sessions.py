@@ -0,0 +1,240 @@
+import os
+import uuid
+from collections import namedtuple
+
+import redis
+from django.db import connection
+from django.utils import timezone
+
+from Saraswati.db_router import areplica_first, pin_to_primary, replica_first
+
+from .cache import LocalCache, RedisManagerClient, async_redis_client, publish_invalidation
+from .exam_config import exam_config_cache
+from .models import User
+
+import logging
+logger = logging.getLogger()
+
+SESSION_TTL = int(os.getenv("SESSION_CACHE_TTL", 6 * 60 * 60))  # 6 hours
+SESSION_LOCAL_TTL = int(os.getenv("SESSION_LOCAL_CACHE_TTL", 300))
+SESSION_LOCAL_MAX_SIZE = int(os.getenv("SESSION_LOCAL_CACHE_SIZE", 50000))
+
+SessionRecord = namedtuple("SessionRecord", ["token", "exam_prefix"])
+
+
+def _claim_login_sql():
+    qn = connection.ops.quote_name
+    table = qn(User._meta.db_table)
+    last_logged_in = qn(User._meta.get_field('last_logged_in').column)
+    auth_token = qn(User._meta.get_field('auth_token').column)
+    username = qn(User._meta.get_field('username').column)
+    exam_prefix = qn(User._meta.get_field('exam_prefix').column)
+
+    return (
+        f"UPDATE {table} SET {last_logged_in} = %s, {auth_token} = %s "
+        f"WHERE {username} = %s AND {last_logged_in} IS NULL "
+        f"RETURNING {auth_token}, {exam_prefix}"
+    )
+
+
+def claim_login(username):
+    """
+    Issues a token with a single conditional UPDATE, no row lock is held
+    across other work. Returns (token, exam_prefix), or None when the user
+    does not exist or is already logged in.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(_claim_login_sql(), [timezone.now(), uuid.uuid4().hex, username])
+        row = cursor.fetchone()
+
+    pin_to_primary()
+
+    return tuple(row) if row else None
+
+
+class SessionCache:
+    """
+    Token checks resolve from process memory, then redis and only then
+    postgres. A record is only ever trusted when its token matches, any
+    mismatch falls through to the next tier.
+    """
+
+    def __init__(self, redis_client, async_redis):
+        self.redis = redis_client
+        self.async_redis = async_redis
+        self.local = LocalCache("session", max_size=SESSION_LOCAL_MAX_SIZE, ttl=SESSION_LOCAL_TTL)
+
+    @staticmethod
+    def key(username):
+        return f"session:{username}"
+
+    @staticmethod
+    def encode(record):
+        return f"{record.token}|{record.exam_prefix}"
+
+    @staticmethod
+    def decode(raw):
+        token, _, exam_prefix = raw.decode("utf-8").partition("|")
+        return SessionRecord(token, exam_prefix)
+
+    def store(self, username, token, exam_prefix):
+        record = SessionRecord(token, exam_prefix)
+        self.local.set(username, record)
+
+        try:
+            self.redis.set(self.key(username), self.encode(record), ex=SESSION_TTL)
+
+        except redis.RedisError as e:
+            logger.info(e)
+
+    def resolve(self, username, token):
+        if not username or not token:
+            return None
+
+        record = self.local.get(username)
+        if record is not None and record.token == token:
+            return record
+
+        try:
+            raw = self.redis.get(self.key(username))
+
+        except redis.RedisError as e:
+            logger.info(e)
+            raw = None
+
+        if raw is not None:
+            record = self.decode(raw)
+            if record.token == token:
+                self.local.set(username, record)
+                return record
+
+        # a replica may not have the token of a login that just happened, a miss is retried on the primary
+        exam_prefix, from_replica = replica_first(lambda: User.objects.filter(
+            username=username,
+            auth_token=token
+        ).values_list("exam_prefix", flat=True).first())
+
+        if exam_prefix is None:
+            return None
+
+        if from_replica:
+            # nor may it know of a reset that revoked the token, caching that hit
+            # would keep the token valid for SESSION_TTL instead of the lag
+            return SessionRecord(token, exam_prefix)
+
+        self.store(username, token, exam_prefix)
+        return SessionRecord(token, exam_prefix)
+
+    async def aresolve(self, username, token):
+        # same tiers as resolve() for the async views
+        if not username or not token:
+            return None
+
+        record = self.local.get(username)
+        if record is not None and record.token == token:
+            return record
+
+        try:
+            raw = await self.async_redis.client.get(self.key(username))
+
+        except redis.RedisError as e:
+            logger.info(e)
+            raw = None
+
+        if raw is not None:
+            record = self.decode(raw)
+            if record.token == token:
+                self.local.set(username, record)
+                return record
+
+        exam_prefix, from_replica = await areplica_first(lambda: User.objects.filter(
+            username=username,
+            auth_token=token
+        ).values_list("exam_prefix", flat=True).afirst())
+
+        if exam_prefix is None:
+            return None
+
+        record = SessionRecord(token, exam_prefix)
+        if from_replica:
+            return record
+
+        self.local.set(username, record)
+
+        try:
+            await self.async_redis.client.set(self.key(username), self.encode(record), ex=SESSION_TTL)
+
+        except redis.RedisError as e:
+            logger.info(e)
+
+        return record
+
+    def invalidate(self, username):
+        try:
+            self.redis.delete(self.key(username))
+
+        except redis.RedisError as e:
+            logger.info(e)
+
+        publish_invalidation(self.redis, self.local.name, username)
+
+    def invalidate_many(self, pipe, usernames):
+        # queued on the caller's pipeline, it runs (and handles errors of) the batch
+        for username in usernames:
+            pipe.delete(self.key(username))
+            publish_invalidation(pipe, self.local.name, username)
+
+
+session_cache = SessionCache(RedisManagerClient().client, async_redis_client)
+
+
+def _prime_request_caches(username, exam_prefix, raws):
+    raw_session, raw_exam = raws
+    if raw_session is not None:
+        # resolve() still compares the token, a stale record only falls through
+        session_cache.local.set(username, session_cache.decode(raw_session))
+    if raw_exam is not None:
+        exam_config_cache.cache_locally(exam_prefix, exam_config_cache.decode(raw_exam))
+
+
+def _request_cache_keys(username, exam_prefix):
+    # only worth a round trip when both are missing from process memory,
+    # a single miss is the plain GET in resolve() / get()
+    if session_cache.local.get(username) is not None or exam_config_cache.local.get(exam_prefix) is not None:
+        return None
+
+    return [session_cache.key(username), exam_config_cache.key(exam_prefix)]
+
+
+def warm_request_caches(username, exam_prefix):
+    """
+    Loads a question request's session and exam settings from redis in one
+    MGET, before session_cache.resolve() and exam_config_cache.get() run.
+    """
+    keys = _request_cache_keys(username, exam_prefix)
+    if keys is None:
+        return
+
+    try:
+        raws = session_cache.redis.get_many(keys)
+
+    except redis.RedisError as e:
+        logger.info(e)
+        return
+
+    _prime_request_caches(username, exam_prefix, raws)
+
+
+async def awarm_request_caches(username, exam_prefix):
+    keys = _request_cache_keys(username, exam_prefix)
+    if keys is None:
+        return
+
+    try:
+        raws = await session_cache.async_redis.client.get_many(keys)
+
+    except redis.RedisError as e:
+        logger.info(e)
+        return
+
+    _prime_request_caches(username, exam_prefix, raws)
@@ -0,0 +1,35 @@
+import os
+
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .exam_config import exam_config_cache
+from .metrics import query_timer
+from .models import Exam
+
+
+@receiver(connection_created)
+def install_query_timer(sender, connection, **kwargs):
+    # the wrapper object outlives its connection, every reconnect sends this again
+    if query_timer not in connection.execute_wrappers:
+        connection.execute_wrappers.append(query_timer)
+
+
+@receiver(connection_created)
+def set_search_path(sender, connection, **kwargs):
+    # runs once per new (persistent) connection instead of once per request
+    search_path = os.getenv("SERVICE_DATABASE_SEARCH_PATH")
+    if not search_path or connection.vendor != 'postgresql':
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(f'SET search_path TO {search_path}, public;')
+
+
+@receiver(post_save, sender=Exam)
+@receiver(post_delete, sender=Exam)
+def invalidate_exam_config(sender, instance, **kwargs):
+    # covers Exam.save() from ExamCreateView, the admin and the shell
+    transaction.on_commit(lambda: exam_config_cache.invalidate(instance.prefix))
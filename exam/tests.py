@@ -1,3 +1,1361 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import threading
+import time
+import uuid
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+import redis
+import requests
+from django.conf import settings
+from django.db import IntegrityError, connection, router, transaction
+from django.http import JsonResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from Saraswati.db_router import (ReplicaRouter, on_replica, pin_to_primary, replica_first, replica_reads,
+                                 reset_pinning)
+from Saraswati.middleware import AdmissionControlMiddleware, PrimaryPinningMiddleware
+
+from . import admission, exam_config, jobs, prefixes
+from .admission import admission_controller, retry_after_header
+from .cache import INVALIDATION_CHANNEL, POOL_EXHAUSTED, CircuitBreaker, CircuitOpenError, RedisManagerClient
+from .constants import (ALL_QUESTIONS_SERVED, ANSWER_TOO_LATE, EXAM_OVER, MISSING_REQUIRED_FIELD, NO_QUESTION_SERVED,
+                        NO_VALID_QUESTIONS, QUESTION_STILL_OPEN, USER_ALREADY_EXISTS, PrefixPoolExhausted)
+from .exam_config import EXAM_CONFIG_LOCK_STRIPES, ExamConfigCache, ExamSettings, exam_config_cache
+from .exam_timer import UNTIMED, exam_timer
+from .importer import import_summary_response, import_users_csv
+from .ingest import (QUESTION_ADD_PATH, csv_rows, ingest_questions, ingest_summary_response, json_rows,
+                     ndjson_rows, validate_question)
+from .jobs import FAILED, FINISHED, JOB_INTERRUPTED, RUNNING, JobQueue, JobWorker, run_as_job
+from .leaderboard import leaderboard
+from .models import Exam, User
+from .prefixes import PrefixAllocator, all_prefixes
+from .resets import RESET_BULK_PATH, reset_students
+from .sessions import SessionRecord, session_cache, warm_request_caches
+
+
+def redis_available():
+    try:
+        return RedisManagerClient().client.ping()
+
+    except redis.RedisError:
+        return False
+
+
+REDIS_AVAILABLE = redis_available()
+
+
+@skipUnless(REDIS_AVAILABLE, 'needs the redis server from REDIS_HOST')
+class ExamTimerTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = RedisManagerClient().client
+        self.username = f'tt_{uuid.uuid4().hex[:12]}'
+        self.key = exam_timer.key(self.username)
+        self.start()
+
+    def tearDown(self):
+        self.redis.delete(self.key)
+
+    def start(self, no_of_questions=3, valid_for=timedelta(hours=1)):
+        exam_timer.start(self.username, ExamSettings(30, no_of_questions, timezone.now() + valid_for))
+
+    def serve(self, *question_ids):
+        reservation = exam_timer.begin(self.username)
+        self.assertTrue(reservation.allowed, reservation.error)
+        data = {'question_id': question_ids[0], 'upcoming': [{'question_id': i} for i in question_ids[1:]]}
+        exam_timer.served(self.username, data)
+        return data
+
+    def test_answer_in_time_is_allowed(self):
+        data = self.serve(11)
+
+        verdict = exam_timer.check_answer(self.username, 11)
+
+        self.assertTrue(verdict.allowed)
+        self.assertEqual(verdict.deadline, data['answer_by'])
+
+    def test_lookahead_questions_get_their_own_later_deadlines(self):
+        data = self.serve(11, 12)
+
+        self.assertGreater(data['upcoming'][0]['answer_by'], data['answer_by'])
+        self.assertTrue(exam_timer.check_answer(self.username, 12).allowed)
+
+    def test_late_answer_is_rejected(self):
+        self.serve(11)
+        self.redis.hset(self.key, 'q:11', 1)
+
+        verdict = exam_timer.check_answer(self.username, 11)
+
+        self.assertFalse(verdict.allowed)
+        self.assertEqual(verdict.error, ANSWER_TOO_LATE)
+
+    def test_answer_after_the_exam_is_rejected(self):
+        self.serve(11)
+        self.redis.hset(self.key, 'exam_deadline', 1)
+
+        verdict = exam_timer.check_answer(self.username, 11)
+
+        self.assertFalse(verdict.allowed)
+        self.assertEqual(verdict.error, EXAM_OVER)
+        self.assertEqual(exam_timer.begin(self.username).error, EXAM_OVER)
+
+    def test_answer_to_an_unserved_question_is_rejected(self):
+        self.assertEqual(exam_timer.check_answer(self.username, 11).error, NO_QUESTION_SERVED)
+
+        self.serve(11)
+
+        self.assertEqual(exam_timer.check_answer(self.username, 12).error, NO_QUESTION_SERVED)
+
+    def test_next_question_is_refused_while_one_is_open(self):
+        self.serve(11)
+
+        self.assertEqual(exam_timer.begin(self.username).error, QUESTION_STILL_OPEN)
+
+        exam_timer.check_answer(self.username, 11)
+        self.assertTrue(exam_timer.begin(self.username).allowed)
+
+    def test_next_question_is_allowed_once_the_open_one_expired(self):
+        self.serve(11)
+        self.redis.hset(self.key, 'last_deadline', 1)
+
+        self.assertTrue(exam_timer.begin(self.username).allowed)
+
+    def test_concurrent_fetch_is_refused(self):
+        self.assertTrue(exam_timer.begin(self.username).allowed)
+
+        self.assertEqual(exam_timer.begin(self.username).error, QUESTION_STILL_OPEN)
+
+    def test_released_fetch_uses_up_nothing(self):
+        self.assertEqual(exam_timer.begin(self.username).remaining, 3)
+        exam_timer.release(self.username)
+
+        reservation = exam_timer.begin(self.username)
+
+        self.assertTrue(reservation.allowed)
+        self.assertEqual(reservation.remaining, 3)
+        self.assertEqual(int(self.redis.hget(self.key, 'idx')), 0)
+
+    def test_no_question_after_the_last_one(self):
+        self.start(no_of_questions=1)
+        self.serve(11)
+        exam_timer.check_answer(self.username, 11)
+
+        self.assertEqual(exam_timer.begin(self.username).error, ALL_QUESTIONS_SERVED)
+
+    def test_session_without_timer_is_not_timed(self):
+        self.redis.delete(self.key)
+
+        self.assertEqual(exam_timer.check_answer(self.username, 11), UNTIMED)
+        self.assertIsNone(exam_timer.begin(self.username).remaining)
+
+
+@skipUnless(REDIS_AVAILABLE, 'needs the redis server from REDIS_HOST')
+class AdmissionTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = RedisManagerClient().client
+        self.exam_prefix = f'at{uuid.uuid4().hex[:8]}_'
+        self.client_id = f'{self.exam_prefix}student'
+        # a private in-flight set, the real one may be in use
+        self.in_flight_key = f'{{admission}}:in-flight:{uuid.uuid4().hex}'
+        patcher = mock.patch.object(admission, 'IN_FLIGHT_KEY', self.in_flight_key)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        self.redis.delete(*admission_controller._keys(self.exam_prefix, self.client_id))
+
+    def test_admitted_request_holds_a_slot_until_released(self):
+        decision = admission_controller.admit(self.exam_prefix, self.client_id)
+
+        self.assertTrue(decision.admitted)
+        self.assertIsNotNone(self.redis.zscore(self.in_flight_key, decision.ticket))
+
+        admission_controller.release(decision)
+
+        self.assertIsNone(self.redis.zscore(self.in_flight_key, decision.ticket))
+
+    @mock.patch.object(admission, 'CLIENT_RATE', 0.1)
+    @mock.patch.object(admission, 'CLIENT_BURST', 1)
+    def test_client_over_its_rate_is_told_when_to_retry(self):
+        admission_controller.release(admission_controller.admit(self.exam_prefix, self.client_id))
+
+        decision = admission_controller.admit(self.exam_prefix, self.client_id)
+
+        # an empty bucket refills one token in 10s, plus up to RETRY_JITTER
+        self.assertFalse(decision.admitted)
+        self.assertIsNone(decision.ticket)
+        self.assertGreater(decision.retry_after, 9)
+        self.assertLessEqual(decision.retry_after, 10 + admission.RETRY_JITTER)
+        self.assertGreaterEqual(int(retry_after_header(decision.retry_after)), 10)
+
+    @mock.patch.object(admission, 'MAX_IN_FLIGHT', 1)
+    def test_request_is_rejected_while_every_slot_is_taken(self):
+        held = admission_controller.admit(self.exam_prefix, self.client_id)
+
+        decision = admission_controller.admit(self.exam_prefix, self.client_id)
+
+        self.assertFalse(decision.admitted)
+        self.assertGreaterEqual(decision.retry_after, admission.RETRY_AFTER)
+        self.assertLessEqual(decision.retry_after, admission.RETRY_AFTER + admission.RETRY_JITTER)
+
+        admission_controller.release(held)
+        self.assertTrue(admission_controller.admit(self.exam_prefix, self.client_id).admitted)
+
+    @mock.patch.object(admission, 'MAX_IN_FLIGHT', 1)
+    @mock.patch.object(admission, 'IN_FLIGHT_LEASE_MS', 100)
+    def test_slot_of_a_crashed_worker_expires_with_its_lease(self):
+        # admitted and never released
+        self.assertTrue(admission_controller.admit(self.exam_prefix, self.client_id).admitted)
+        self.assertFalse(admission_controller.admit(self.exam_prefix, self.client_id).admitted)
+
+        time.sleep(0.2)
+
+        self.assertTrue(admission_controller.admit(self.exam_prefix, self.client_id).admitted)
+
+    @override_settings(ADMISSION_CONTROL=True, ADMISSION_PATHS=['/api/question'])
+    @mock.patch.object(admission, 'CLIENT_RATE', 0.1)
+    @mock.patch.object(admission, 'CLIENT_BURST', 1)
+    def test_rejected_request_gets_429_with_retry_after(self):
+        middleware = AdmissionControlMiddleware(lambda request: JsonResponse({'is_success': True}))
+
+        def post(username):
+            return middleware(RequestFactory().post(
+                '/api/question',
+                json.dumps({'username': username}),
+                content_type='application/json',
+                REMOTE_ADDR=self.client_id
+            ))
+
+        self.assertEqual(post(f'{self.exam_prefix}a').status_code, 200)
+        # another username from the same address shares its bucket
+        response = post(f'{self.exam_prefix}b')
+
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 10)
+        self.assertFalse(json.loads(response.content)['is_success'])
+
+
+class AdmissionClientTests(SimpleTestCase):
+    @staticmethod
+    def identify(body=None, **meta):
+        request = RequestFactory().post(
+            '/api/login', json.dumps(body or {}), content_type='application/json', REMOTE_ADDR='10.0.0.1', **meta
+        )
+        return AdmissionControlMiddleware.identify(request)
+
+    def test_client_is_the_address_not_the_username(self):
+        self.assertEqual(self.identify({'username': 'ab1_victim'}), ('ab1_', '10.0.0.1'))
+        self.assertEqual(self.identify({'username': 'nounderscore'}), ('-', '10.0.0.1'))
+
+    def test_forwarded_for_is_ignored_without_proxies(self):
+        self.assertEqual(self.identify(HTTP_X_FORWARDED_FOR='1.2.3.4')[1], '10.0.0.1')
+
+    @override_settings(ADMISSION_PROXY_HOPS=1)
+    def test_only_the_entry_of_our_proxy_is_trusted(self):
+        self.assertEqual(self.identify(HTTP_X_FORWARDED_FOR='1.2.3.4, 5.6.7.8')[1], '5.6.7.8')
+
+    @override_settings(ADMISSION_PROXY_HOPS=2)
+    def test_request_past_the_proxies_uses_its_address(self):
+        self.assertEqual(self.identify(HTTP_X_FORWARDED_FOR='5.6.7.8')[1], '10.0.0.1')
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def setUp(self):
+        self.breaker = CircuitBreaker(threshold=2, cooldown=60)
+        self.calls = 0
+
+    def ok(self):
+        self.calls += 1
+        return 'ok'
+
+    def failing(self, error):
+        def func():
+            self.calls += 1
+            raise error
+        return func
+
+    def open_breaker(self):
+        for _ in range(self.breaker.threshold):
+            with self.assertRaises(redis.ConnectionError):
+                self.breaker.call(self.failing(redis.ConnectionError('down')))
+        self.calls = 0
+
+    def cool_down(self):
+        self.breaker.opened_at -= self.breaker.cooldown
+
+    def test_opens_after_threshold_connection_errors(self):
+        with self.assertRaises(redis.TimeoutError):
+            self.breaker.call(self.failing(redis.TimeoutError('slow')))
+        self.assertEqual(self.breaker.state(), 'closed')
+
+        with self.assertRaises(redis.ConnectionError):
+            self.breaker.call(self.failing(redis.ConnectionError('down')))
+
+        self.assertEqual(self.breaker.state(), 'open')
+
+    def test_open_breaker_fails_without_calling(self):
+        self.open_breaker()
+
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(self.ok)
+
+        self.assertEqual(self.calls, 0)
+
+    def test_other_errors_do_not_open_it(self):
+        for error in (redis.ResponseError('WRONGTYPE'), redis.ConnectionError(POOL_EXHAUSTED), KeyError('x')):
+            for _ in range(self.breaker.threshold):
+                with self.assertRaises(type(error)):
+                    self.breaker.call(self.failing(error))
+
+        self.assertEqual(self.breaker.state(), 'closed')
+
+    def test_success_resets_the_failure_count(self):
+        with self.assertRaises(redis.ConnectionError):
+            self.breaker.call(self.failing(redis.ConnectionError('down')))
+        self.breaker.call(self.ok)
+        with self.assertRaises(redis.ConnectionError):
+            self.breaker.call(self.failing(redis.ConnectionError('down')))
+
+        self.assertEqual(self.breaker.state(), 'closed')
+
+    def test_one_probe_after_the_cooldown(self):
+        self.open_breaker()
+        self.cool_down()
+
+        def probe():
+            self.assertEqual(self.breaker.state(), 'half-open')
+            # every other call keeps failing fast while the probe runs
+            with self.assertRaises(CircuitOpenError):
+                self.breaker.call(self.ok)
+            return 'ok'
+
+        self.assertEqual(self.breaker.call(probe), 'ok')
+        self.assertEqual(self.calls, 0)
+
+    def test_successful_probe_closes_it(self):
+        self.open_breaker()
+        self.cool_down()
+
+        self.assertEqual(self.breaker.call(self.ok), 'ok')
+
+        self.assertEqual(self.breaker.state(), 'closed')
+        self.assertEqual(self.breaker.failures, 0)
+        self.breaker.call(self.ok)
+        self.assertEqual(self.calls, 2)
+
+    def test_failed_probe_opens_it_again(self):
+        self.open_breaker()
+        self.cool_down()
+
+        with self.assertRaises(redis.ConnectionError):
+            self.breaker.call(self.failing(redis.ConnectionError('still down')))
+
+        self.assertEqual(self.breaker.state(), 'open')
+        with self.assertRaises(CircuitOpenError):
+            self.breaker.call(self.ok)
+
+    def test_probe_ending_in_another_error_is_not_stuck(self):
+        self.open_breaker()
+        self.cool_down()
+
+        with self.assertRaises(redis.ResponseError):
+            self.breaker.call(self.failing(redis.ResponseError('NOSCRIPT')))
+
+        self.assertEqual(self.breaker.state(), 'open')
+        self.assertEqual(self.breaker.call(self.ok), 'ok')
+        self.assertEqual(self.breaker.state(), 'closed')
+
+    def test_cancelled_async_probe_is_not_stuck(self):
+        self.open_breaker()
+        self.cool_down()
+
+        async def cancelled():
+            raise asyncio.CancelledError()
+
+        async def ok():
+            return 'ok'
+
+        with self.assertRaises(asyncio.CancelledError):
+            asyncio.run(self.breaker.acall(cancelled))
+
+        self.assertEqual(self.breaker.state(), 'open')
+        self.assertEqual(asyncio.run(self.breaker.acall(ok)), 'ok')
+        self.assertEqual(self.breaker.state(), 'closed')
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'])
+class ReplicaRouterTests(SimpleTestCase):
+    def setUp(self):
+        reset_pinning()
+        self.addCleanup(reset_pinning)
+
+    @staticmethod
+    def read_alias():
+        return router.db_for_read(User)
+
+    def test_reads_stay_on_the_primary_unless_they_opt_in(self):
+        self.assertEqual(self.read_alias(), 'default')
+
+        with replica_reads():
+            self.assertEqual(self.read_alias(), 'replica_0')
+
+        self.assertEqual(self.read_alias(), 'default')
+
+    def test_decorated_function_reads_from_a_replica(self):
+        self.assertEqual(replica_reads()(self.read_alias)(), 'replica_0')
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_without_replicas_everything_stays_on_the_primary(self):
+        with replica_reads():
+            self.assertEqual(self.read_alias(), 'default')
+
+    def test_reads_after_a_write_are_pinned_to_the_primary(self):
+        self.assertEqual(router.db_for_write(User), 'default')
+
+        with replica_reads():
+            self.assertEqual(self.read_alias(), 'default')
+
+        reset_pinning()
+        with replica_reads():
+            self.assertEqual(self.read_alias(), 'replica_0')
+
+    def test_raw_write_pins_too(self):
+        pin_to_primary()
+
+        with replica_reads():
+            self.assertEqual(self.read_alias(), 'default')
+
+    def test_replica_first_uses_the_replica_result(self):
+        aliases = []
+
+        def query():
+            aliases.append(self.read_alias())
+            return 'row'
+
+        self.assertEqual(replica_first(query), ('row', True))
+        self.assertEqual(aliases, ['replica_0'])
+
+    def test_replica_first_falls_back_to_the_primary(self):
+        aliases = []
+
+        def query():
+            aliases.append(self.read_alias())
+            # not replicated yet
+            return 'row' if aliases[-1] == 'default' else None
+
+        self.assertEqual(replica_first(query), ('row', False))
+        self.assertEqual(aliases, ['replica_0', 'default'])
+
+    def test_replica_first_after_a_write_reads_the_primary_once(self):
+        pin_to_primary()
+        aliases = []
+
+        def query():
+            aliases.append(self.read_alias())
+            return None
+
+        self.assertEqual(replica_first(query), (None, False))
+        self.assertEqual(aliases, ['default'])
+
+    def test_middleware_unpins_every_request(self):
+        pin_to_primary()
+        aliases = []
+
+        def view(request):
+            with replica_reads():
+                aliases.append(self.read_alias())
+            return JsonResponse({})
+
+        PrimaryPinningMiddleware(view)(RequestFactory().get('/'))
+
+        self.assertEqual(aliases, ['replica_0'])
+
+    def test_migrations_only_run_on_the_primary(self):
+        self.assertTrue(ReplicaRouter().allow_migrate('default', 'exam'))
+        self.assertFalse(ReplicaRouter().allow_migrate('replica_0', 'exam'))
+
+
+@skipUnless(settings.DATABASE_REPLICAS, 'needs SERVICE_DATABASE_REPLICAS')
+class ReplicaMirrorTests(TestCase):
+    # test replicas mirror "default" (TEST={"MIRROR": "default"}), they see its rows
+    databases = {'default', *settings.DATABASE_REPLICAS}
+
+    def setUp(self):
+        reset_pinning()
+        self.addCleanup(reset_pinning)
+
+    def test_replica_first_reads_a_row_written_on_the_primary(self):
+        User.objects.create(username='rm_student')
+        reset_pinning()
+
+        user, from_replica = replica_first(lambda: User.objects.filter(username='rm_student').first())
+
+        self.assertEqual(user.username, 'rm_student')
+        self.assertTrue(from_replica)
+
+    def test_replica_first_misses_on_both(self):
+        self.assertEqual(replica_first(lambda: User.objects.filter(username='rm_missing').first()), (None, False))
+
+
+def _echo_job(queue, job_id, args):
+    return {'input': queue.read_input(job_id).decode('utf-8'), 'args': args}, 200
+
+
+def _failing_job(queue, job_id, args):
+    raise ValueError('bad row')
+
+
+@skipUnless(REDIS_AVAILABLE, 'needs the redis server from REDIS_HOST')
+class JobWorkerTests(SimpleTestCase):
+    def setUp(self):
+        self.redis = RedisManagerClient().client
+        # a private stream, real workers may be reading the configured one
+        self.stream = f'jobs:test:{uuid.uuid4().hex}'
+        for patcher in (
+            mock.patch.object(jobs, 'JOB_STREAM', self.stream),
+            mock.patch.dict(jobs.JOB_HANDLERS, {'echo': _echo_job, 'fail': _failing_job}),
+        ):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        self.queue = JobQueue(self.redis)
+        self.queue.ensure_group()
+        self.job_ids = []
+
+    def tearDown(self):
+        self.redis.delete(self.stream)
+        for job_id in self.job_ids:
+            self.redis.delete(self.queue.key(job_id), self.queue.input_key(job_id), self.queue.result_key(job_id))
+
+    def submit(self, kind='echo', args=None, chunks=(b'abc',)):
+        job_id = self.queue.submit(kind, args or {'n': 1}, chunks)
+        self.job_ids.append(job_id)
+        return job_id
+
+    def worker(self, consumer='worker-1', stale_ms=60000):
+        return JobWorker(self.queue, consumer, block_ms=10, stale_ms=stale_ms)
+
+    def pending(self):
+        return self.redis.xpending(self.stream, jobs.JOB_GROUP)['pending']
+
+    def crash_while_reading(self):
+        # a worker that took the entry and died
+        self.redis.xreadgroup(jobs.JOB_GROUP, 'dead-worker', {self.stream: '>'}, count=1)
+        time.sleep(0.01)
+
+    def test_ensure_group_twice(self):
+        self.queue.ensure_group()
+
+    def test_nothing_to_do(self):
+        self.assertIsNone(self.worker().work_once())
+
+    def test_job_runs_and_finishes(self):
+        job_id = self.submit()
+
+        self.assertEqual(self.worker().work_once(), job_id)
+
+        job = self.queue.get(job_id)
+        self.assertEqual(job['status'], FINISHED)
+        self.assertEqual(job['result'], {'input': 'abc', 'args': {'n': 1}})
+        self.assertEqual(job['result_status'], '200')
+        self.assertFalse(self.redis.exists(self.queue.input_key(job_id)))
+        self.assertEqual(self.pending(), 0)
+        self.assertEqual(self.redis.xlen(self.stream), 0)
+
+    def test_failing_handler_fails_the_job(self):
+        job_id = self.submit('fail')
+
+        self.worker().work_once()
+
+        job = self.queue.get(job_id)
+        self.assertEqual(job['status'], FAILED)
+        self.assertEqual(job['error'], 'bad row')
+        self.assertEqual(self.pending(), 0)
+
+    def test_redis_error_leaves_the_entry_pending(self):
+        job_id = self.submit()
+        update = self.queue.update
+
+        def finishing_fails(job_id, **fields):
+            if fields.get('status') == FINISHED:
+                raise redis.ConnectionError('gone')
+            update(job_id, **fields)
+
+        with mock.patch.object(self.queue, 'update', side_effect=finishing_fails):
+            with self.assertRaises(redis.ConnectionError):
+                self.worker().work_once()
+
+        self.assertEqual(self.pending(), 1)
+
+    def test_stale_entry_of_a_job_never_started_is_run_again(self):
+        job_id = self.submit()
+        self.crash_while_reading()
+
+        self.assertEqual(self.worker(stale_ms=1).work_once(), job_id)
+
+        self.assertEqual(self.queue.get(job_id)['status'], FINISHED)
+        self.assertEqual(self.pending(), 0)
+
+    def test_stale_entry_with_an_expired_lease_fails_the_job(self):
+        job_id = self.submit()
+        self.crash_while_reading()
+        self.queue.update(job_id, status=RUNNING, lease_until=JobWorker._now_ms() - 1)
+
+        self.worker(stale_ms=1).work_once()
+
+        job = self.queue.get(job_id)
+        self.assertEqual(job['status'], FAILED)
+        self.assertEqual(job['error'], JOB_INTERRUPTED)
+        self.assertEqual(self.pending(), 0)
+
+    def test_stale_entry_with_a_live_lease_stays_pending(self):
+        job_id = self.submit()
+        self.crash_while_reading()
+        self.queue.update(job_id, status=RUNNING, lease_until=JobWorker._now_ms() + 60000)
+
+        self.worker(stale_ms=1).work_once()
+
+        self.assertEqual(self.queue.get(job_id)['status'], RUNNING)
+        self.assertEqual(self.pending(), 1)
+
+    def test_heartbeat_keeps_a_long_job_claimed(self):
+        seen = {}
+
+        def slow_job(queue, job_id, args):
+            started_lease = int(queue.get(job_id)['lease_until'])
+            time.sleep(0.5)
+            entry = self.redis.xpending_range(self.stream, jobs.JOB_GROUP, '-', '+', 1)[0]
+            seen['idle_ms'] = entry['time_since_delivered']
+            seen['lease_extended'] = int(queue.get(job_id)['lease_until']) > started_lease
+            return {}, 200
+
+        job_id = self.submit('slow')
+        with mock.patch.dict(jobs.JOB_HANDLERS, {'slow': slow_job}):
+            self.worker(stale_ms=300).work_once()
+
+        # stale_ms is 300, the heartbeat re-claims every 100ms
+        self.assertLess(seen['idle_ms'], 300)
+        self.assertTrue(seen['lease_extended'])
+        self.assertEqual(self.queue.get(job_id)['status'], FINISHED)
+
+    def test_result_is_read_back_in_chunks(self):
+        job_id = self.submit()
+        self.queue.append_result(job_id, b'id,name\n')
+        self.queue.append_result(job_id, b'1,a\n')
+
+        self.assertEqual(b''.join(self.queue.iter_result(job_id, chunk_size=4)), b'id,name\n1,a\n')
+
+
+class RunAsJobTests(SimpleTestCase):
+    @override_settings(BACKGROUND_JOBS=False)
+    def test_never_without_background_jobs(self):
+        self.assertFalse(run_as_job({'async': 'true'}, 10, 1))
+
+    @override_settings(BACKGROUND_JOBS=True)
+    def test_async_flag_decides(self):
+        self.assertTrue(run_as_job({'async': 'true'}, 0, 1))
+        self.assertFalse(run_as_job({'async': 'False'}, 10, 1))
+
+    @override_settings(BACKGROUND_JOBS=True)
+    def test_large_inputs_run_as_a_job(self):
+        self.assertTrue(run_as_job({}, 10, 1))
+        self.assertFalse(run_as_job({}, 1, 1))
+        self.assertTrue(run_as_job({}, lambda: 10, 1))
+
+    @override_settings(BACKGROUND_JOBS=True)
+    def test_size_is_not_computed_when_the_flag_decides(self):
+        size = mock.Mock(return_value=10)
+
+        run_as_job({'async': '0'}, size, 1)
+
+        size.assert_not_called()
+
+
+@skipUnless(REDIS_AVAILABLE, 'needs the redis server from REDIS_HOST')
+class ExamConfigCacheTests(TestCase):
+    def setUp(self):
+        self.redis = RedisManagerClient().client
+        self.prefix = f'{uuid.uuid4().hex[:3]}_'
+        self.lock_key = f'{exam_config_cache.key(self.prefix)}:lock'
+
+    def tearDown(self):
+        exam_config_cache.local.delete(self.prefix)
+        self.redis.delete(exam_config_cache.key(self.prefix), self.lock_key)
+
+    def create_exam(self, **fields):
+        return Exam.objects.create(exam_name='Test', created_for=2024, prefix=self.prefix, **fields)
+
+    def test_loads_from_the_db_once(self):
+        exam = self.create_exam(no_of_questions=12, time_per_question=45)
+
+        exam_settings = exam_config_cache.get(self.prefix)
+
+        self.assertEqual(exam_settings, ExamSettings(45, 12, exam.valid_till))
+        self.assertEqual(exam_config_cache.decode(self.redis.get(exam_config_cache.key(self.prefix))), exam_settings)
+        self.assertFalse(self.redis.exists(self.lock_key))
+        with self.assertNumQueries(0):
+            self.assertEqual(exam_config_cache.get(self.prefix), exam_settings)
+
+    def test_redis_hit_skips_the_db(self):
+        exam_settings = ExamSettings(30, 5, timezone.now())
+        self.redis.set(exam_config_cache.key(self.prefix), exam_config_cache.encode(exam_settings))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(exam_config_cache.get(self.prefix), exam_settings)
+        self.assertEqual(exam_config_cache.local.get(self.prefix), exam_settings)
+
+    def test_unknown_prefix_releases_the_lock_and_is_cached(self):
+        with self.assertRaises(Exam.DoesNotExist):
+            exam_config_cache.get(self.prefix)
+
+        self.assertFalse(self.redis.exists(self.lock_key))
+        self.assertLessEqual(self.redis.ttl(exam_config_cache.key(self.prefix)), exam_config.EXAM_CONFIG_MISS_TTL)
+
+        # another process finds the miss in redis right away
+        exam_config_cache.local.delete(self.prefix)
+        started = time.monotonic()
+        with self.assertNumQueries(0), self.assertRaises(Exam.DoesNotExist):
+            exam_config_cache.get(self.prefix)
+        self.assertLess(time.monotonic() - started, exam_config.EXAM_CONFIG_LOCK_WAIT)
+
+    def test_released_prefix_is_unknown(self):
+        self.create_exam(prefix_released=True)
+
+        with self.assertRaises(Exam.DoesNotExist):
+            exam_config_cache.get(self.prefix)
+
+    def test_unknown_prefix_async(self):
+        with self.assertRaises(Exam.DoesNotExist):
+            exam_config_cache.get(self.prefix)
+
+        with self.assertRaises(Exam.DoesNotExist):
+            asyncio.run(exam_config_cache.aget(self.prefix))
+
+    def test_failed_query_releases_the_lock(self):
+        with mock.patch.object(ExamConfigCache, '_from_db', side_effect=Exam.MultipleObjectsReturned):
+            with self.assertRaises(Exam.MultipleObjectsReturned):
+                exam_config_cache.get(self.prefix)
+
+        self.assertFalse(self.redis.exists(self.lock_key))
+        self.assertFalse(self.redis.exists(exam_config_cache.key(self.prefix)))
+
+    def test_waiter_gets_the_result_of_the_lock_owner(self):
+        exam_settings = ExamSettings(30, 5, timezone.now())
+        # another process holds the lock and stores its result a moment later
+        self.redis.set(self.lock_key, 1, px=5000)
+        threading.Timer(0.2, lambda: self.redis.set(
+            exam_config_cache.key(self.prefix), exam_config_cache.encode(exam_settings)
+        )).start()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(exam_config_cache.get(self.prefix), exam_settings)
+
+    @mock.patch.object(exam_config, 'EXAM_CONFIG_LOCK_WAIT', 0.1)
+    def test_waiter_loads_it_itself_when_the_owner_never_answers(self):
+        self.create_exam(no_of_questions=7)
+        self.redis.set(self.lock_key, 1, px=5000)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(exam_config_cache.get(self.prefix).no_of_questions, 7)
+
+    def test_saving_an_exam_invalidates_it(self):
+        exam = self.create_exam(no_of_questions=12)
+        exam_config_cache.get(self.prefix)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            exam.no_of_questions = 20
+            exam.save()
+
+        self.assertIsNone(exam_config_cache.local.get(self.prefix))
+        self.assertFalse(self.redis.exists(exam_config_cache.key(self.prefix)))
+        self.assertEqual(exam_config_cache.get(self.prefix).no_of_questions, 20)
+
+    def test_deleting_an_exam_invalidates_it(self):
+        exam = self.create_exam()
+        exam_config_cache.get(self.prefix)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            exam.delete()
+
+        with self.assertRaises(Exam.DoesNotExist):
+            exam_config_cache.get(self.prefix)
+
+    def test_creating_an_exam_replaces_a_cached_miss(self):
+        with self.assertRaises(Exam.DoesNotExist):
+            exam_config_cache.get(self.prefix)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.create_exam(no_of_questions=9)
+
+        self.assertEqual(exam_config_cache.get(self.prefix).no_of_questions, 9)
+
+    def test_locks_do_not_grow_with_prefixes(self):
+        for index in range(1000):
+            exam_config_cache._lock_for(f'x{index}_')
+
+        self.assertEqual(len(exam_config_cache._locks), EXAM_CONFIG_LOCK_STRIPES)
+        self.assertIs(exam_config_cache._lock_for(self.prefix), exam_config_cache._lock_for(self.prefix))
+
+
+@skipUnless(REDIS_AVAILABLE, 'needs the redis server from REDIS_HOST')
+class SessionCacheTests(TestCase):
+    def setUp(self):
+        self.redis = RedisManagerClient().client
+        self.username = f'ss_{uuid.uuid4().hex[:10]}'
+        self.user = User.objects.create(username=self.username, exam_prefix='ss_', auth_token='token-1')
+
+    def tearDown(self):
+        session_cache.local.delete(self.username)
+        self.redis.delete(session_cache.key(self.username))
+
+    def cached(self):
+        raw = self.redis.get(session_cache.key(self.username))
+        return session_cache.local.get(self.username), raw and session_cache.decode(raw)
+
+    def test_db_hit_is_cached_in_memory_and_redis(self):
+        record = session_cache.resolve(self.username, 'token-1')
+
+        self.assertEqual(record, SessionRecord('token-1', 'ss_'))
+        self.assertEqual(self.cached(), (record, record))
+        with self.assertNumQueries(0):
+            self.assertEqual(session_cache.resolve(self.username, 'token-1'), record)
+
+    def test_redis_hit_skips_the_db(self):
+        session_cache.store(self.username, 'token-2', 'ss_')
+        session_cache.local.delete(self.username)
+
+        with self.assertNumQueries(0):
+            self.assertEqual(session_cache.resolve(self.username, 'token-2'), SessionRecord('token-2', 'ss_'))
+        self.assertEqual(session_cache.local.get(self.username), SessionRecord('token-2', 'ss_'))
+
+    def test_redis_hit_async(self):
+        session_cache.store(self.username, 'token-2', 'ss_')
+        session_cache.local.delete(self.username)
+
+        self.assertEqual(
+            asyncio.run(session_cache.aresolve(self.username, 'token-2')), SessionRecord('token-2', 'ss_')
+        )
+
+    def test_wrong_token_is_rejected_and_not_cached(self):
+        self.assertIsNone(session_cache.resolve(self.username, 'guess'))
+
+        self.assertEqual(self.cached(), (None, None))
+
+    def test_missing_username_or_token(self):
+        with self.assertNumQueries(0):
+            self.assertIsNone(session_cache.resolve(self.username, None))
+            self.assertIsNone(session_cache.resolve('', 'token-1'))
+
+    def test_stale_cached_token_falls_through_to_the_db(self):
+        # memory and redis still hold the token of an earlier login
+        session_cache.store(self.username, 'old-token', 'ss_')
+
+        with self.assertNumQueries(1):
+            record = session_cache.resolve(self.username, 'token-1')
+
+        self.assertEqual(record, SessionRecord('token-1', 'ss_'))
+        self.assertEqual(self.cached(), (record, record))
+
+    def test_revoked_token_is_rejected_after_invalidate(self):
+        session_cache.resolve(self.username, 'token-1')
+        User.objects.filter(username=self.username).update(auth_token=None)
+
+        session_cache.invalidate(self.username)
+
+        self.assertEqual(self.cached(), (None, None))
+        self.assertIsNone(session_cache.resolve(self.username, 'token-1'))
+
+    def test_invalidate_many_runs_on_the_callers_pipeline(self):
+        other = f'ss_{uuid.uuid4().hex[:10]}'
+        self.addCleanup(self.redis.delete, session_cache.key(other))
+        session_cache.store(self.username, 'token-1', 'ss_')
+        session_cache.store(other, 'token-3', 'ss_')
+
+        pipe = self.redis.pipeline()
+        session_cache.invalidate_many(pipe, [self.username, other])
+        pipe.execute()
+
+        self.assertEqual(self.cached(), (None, None))
+        self.assertIsNone(session_cache.local.get(other))
+        self.assertFalse(self.redis.exists(session_cache.key(other)))
+
+    def test_invalidation_from_another_worker_evicts_memory(self):
+        record = SessionRecord('token-1', 'ss_')
+        session_cache.local.set(self.username, record)
+
+        # published by another process, this one only learns of it on the channel
+        deadline = time.monotonic() + 5
+        while session_cache.local.get(self.username) is not None and time.monotonic() < deadline:
+            self.redis.publish(INVALIDATION_CHANNEL, f'{session_cache.local.name}|{self.username}')
+            time.sleep(0.05)
+
+        self.assertIsNone(session_cache.local.get(self.username))
+
+    def test_replica_hit_is_not_cached(self):
+        with mock.patch('exam.sessions.replica_first', return_value=('ss_', True)):
+            self.assertEqual(session_cache.resolve(self.username, 'token-1'), SessionRecord('token-1', 'ss_'))
+
+        self.assertEqual(self.cached(), (None, None))
+
+    def test_warm_request_caches_loads_both_records_in_one_call(self):
+        prefix = f'{uuid.uuid4().hex[:3]}_'
+        exam_settings = ExamSettings(30, 5, timezone.now())
+        self.addCleanup(exam_config_cache.local.delete, prefix)
+        self.addCleanup(self.redis.delete, exam_config_cache.key(prefix))
+        session_cache.store(self.username, 'token-1', prefix)
+        session_cache.local.delete(self.username)
+        self.redis.set(exam_config_cache.key(prefix), exam_config_cache.encode(exam_settings))
+
+        warm_request_caches(self.username, prefix)
+
+        self.assertEqual(session_cache.local.get(self.username), SessionRecord('token-1', prefix))
+        self.assertEqual(exam_config_cache.local.get(prefix), exam_settings)
+        with self.assertNumQueries(0):
+            self.assertEqual(session_cache.resolve(self.username, 'token-1'), SessionRecord('token-1', prefix))
+
+    def test_warm_request_caches_skips_redis_when_memory_has_one(self):
+        session_cache.local.set(self.username, SessionRecord('token-1', 'ss_'))
+
+        with mock.patch.object(session_cache.redis, 'get_many') as get_many:
+            warm_request_caches(self.username, 'ss_')
+
+        get_many.assert_not_called()
+
+
+def _create_exam(prefix):
+    return Exam.objects.create(exam_name='Test', created_for=2024, prefix=prefix)
+
+
+@skipUnless(REDIS_AVAILABLE, 'needs the redis server from REDIS_HOST')
+class PrefixAllocatorTests(TestCase):
+    def setUp(self):
+        self.redis = RedisManagerClient().client
+        # one letter prefixes in a private free set: a pool of 36
+        self.free_set = f'exam:prefixes:free:test:{uuid.uuid4().hex}'
+        patcher = mock.patch.multiple(
+            prefixes, PREFIX_LENGTH=1, PREFIX_FREE_SET=self.free_set, PREFIX_REFILL_LOCK=f'{self.free_set}:lock'
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.redis.delete, self.free_set, f'{self.free_set}:lock')
+        self.allocator = PrefixAllocator(self.redis)
+
+    def test_hands_out_every_free_prefix_once(self):
+        _create_exam('a_')
+        User.objects.create(username='b_1', exam_prefix='b_')
+
+        allocated = [self.allocator.allocate(_create_exam).prefix for _ in range(34)]
+
+        self.assertEqual(set(allocated), all_prefixes() - {'a_', 'b_'})
+        with self.assertRaises(PrefixPoolExhausted):
+            self.allocator.allocate(_create_exam)
+
+    def test_stale_free_set_costs_a_retry(self):
+        _create_exam('a_')
+        self.redis.sadd(self.free_set, 'a_')
+
+        exam = self.allocator.allocate(_create_exam)
+
+        self.assertNotEqual(exam.prefix, 'a_')
+        self.assertEqual(Exam.objects.filter(prefix='a_').count(), 1)
+
+    def test_failed_create_gives_the_prefix_back(self):
+        self.redis.sadd(self.free_set, 'c_')
+
+        def create(prefix):
+            raise ValueError('bad exam')
+
+        with self.assertRaises(ValueError):
+            self.allocator.allocate(create)
+
+        self.assertTrue(self.redis.sismember(self.free_set, 'c_'))
+
+    def test_random_prefixes_without_redis(self):
+        with mock.patch.object(self.redis, 'spop', side_effect=redis.ConnectionError('down')):
+            exam = self.allocator.allocate(_create_exam)
+
+        self.assertIn(exam.prefix, all_prefixes())
+
+    def test_one_refill_at_a_time(self):
+        self.redis.set(f'{self.free_set}:lock', 1)
+
+        self.assertFalse(self.allocator.refill())
+        self.assertFalse(self.redis.exists(self.free_set))
+
+    def expired_exam(self, prefix, days=40):
+        exam = _create_exam(prefix)
+        # save() sets valid_till of a new exam
+        Exam.objects.filter(pk=exam.pk).update(valid_till=timezone.now() - timedelta(days=days))
+        return exam
+
+    def test_release_expired(self):
+        self.expired_exam('d_')
+        self.expired_exam('e_')
+        User.objects.create(username='e_1', exam_prefix='e_')
+        self.expired_exam('f_', days=1)
+
+        self.assertEqual(self.allocator.release_expired(dry_run=True), (['d_'], ['e_']))
+        self.assertFalse(Exam.objects.get(prefix='d_').prefix_released)
+
+        self.assertEqual(self.allocator.release_expired(), (['d_'], ['e_']))
+        self.assertTrue(Exam.objects.get(prefix='d_').prefix_released)
+        self.assertTrue(self.redis.sismember(self.free_set, 'd_'))
+        self.assertFalse(Exam.objects.get(prefix='e_').prefix_released)
+        self.assertFalse(Exam.objects.get(prefix='f_').prefix_released)
+
+    def test_released_prefix_is_reused(self):
+        self.expired_exam('d_')
+        self.allocator.release_expired()
+        # only the released prefix is free
+        self.redis.delete(self.free_set)
+        self.redis.sadd(self.free_set, 'd_')
+
+        exam = self.allocator.allocate(_create_exam)
+
+        self.assertEqual(exam.prefix, 'd_')
+        self.assertEqual(Exam.objects.filter(prefix='d_').count(), 2)
+
+    def test_prefix_is_unique_among_live_exams_only(self):
+        self.expired_exam('g_')
+        _create_exam('h_')
+        Exam.objects.filter(prefix='g_').update(prefix_released=True)
+
+        _create_exam('g_')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            _create_exam('h_')
+        # exams without a prefix are not constrained
+        _create_exam('')
+        _create_exam('')
+
+
+@skipUnless(connection.vendor == 'postgresql', 'the bulk reset UPDATE is written for postgres')
+@mock.patch('exam.resets.question_bank_network_call', return_value={'is_success': True})
+class ResetStudentsTests(TestCase):
+    def setUp(self):
+        now = timezone.now()
+        for username, exam_prefix, last_logged_in in (
+            ('rs_1', 'rs_', now), ('rs_2', 'rs_', now), ('rs_3', 'rs_', None), ('ot_1', 'ot_', now)
+        ):
+            User.objects.create(
+                username=username,
+                exam_prefix=exam_prefix,
+                last_logged_in=last_logged_in,
+                auth_token=f'token-{username}' if last_logged_in else None,
+                marks=5
+            )
+        reset_pinning()
+        self.addCleanup(reset_pinning)
+        if REDIS_AVAILABLE:
+            self.addCleanup(RedisManagerClient().client.delete, leaderboard.key('rs_'), leaderboard.key('ot_'))
+
+    def logged_in(self, username):
+        return User.objects.filter(username=username, last_logged_in__isnull=False).exists()
+
+    def test_reset_by_usernames(self, network_call):
+        reset, response = reset_students(['rs_1', 'rs_3'])
+
+        self.assertEqual(reset, ['rs_1'])
+        self.assertEqual(response, {'is_success': True})
+        network_call.assert_called_once_with({'usernames': ['rs_1']}, 'POST', RESET_BULK_PATH)
+        user = User.objects.get(username='rs_1')
+        self.assertEqual((user.last_logged_in, user.auth_token, user.marks, user.reset_count), (None, None, 0, 1))
+        # never logged in, nothing to reset
+        self.assertEqual(User.objects.get(username='rs_3').reset_count, 0)
+        self.assertTrue(self.logged_in('rs_2'))
+
+    def test_reset_by_exam_prefix(self, network_call):
+        reset, _ = reset_students(exam_prefix='rs_')
+
+        self.assertEqual(sorted(reset), ['rs_1', 'rs_2'])
+        self.assertTrue(self.logged_in('ot_1'))
+
+    def test_usernames_outside_the_prefix_are_not_reset(self, network_call):
+        reset, _ = reset_students(['rs_1', 'ot_1'], 'rs_')
+
+        self.assertEqual(reset, ['rs_1'])
+        self.assertTrue(self.logged_in('ot_1'))
+        self.assertEqual(User.objects.get(username='ot_1').auth_token, 'token-ot_1')
+
+    def test_nothing_to_reset(self, network_call):
+        self.assertEqual(reset_students(['rs_3', 'nobody']), ([], None))
+
+        network_call.assert_not_called()
+
+    def test_reset_revokes_cached_sessions(self, network_call):
+        session_cache.store('rs_1', 'token-rs_1', 'rs_')
+        self.addCleanup(session_cache.local.delete, 'rs_1')
+        self.assertIsNotNone(session_cache.resolve('rs_1', 'token-rs_1'))
+
+        reset_students(['rs_1'])
+
+        self.assertIsNone(session_cache.local.get('rs_1'))
+        self.assertIsNone(session_cache.resolve('rs_1', 'token-rs_1'))
+
+    @skipUnless(REDIS_AVAILABLE, 'needs the redis server from REDIS_HOST')
+    def test_reset_drops_redis_state(self, network_call):
+        redis_client = RedisManagerClient().client
+        session_cache.store('rs_1', 'token-rs_1', 'rs_')
+        exam_timer.start('rs_1', ExamSettings(30, 5, timezone.now() + timedelta(hours=1)))
+
+        reset_students(['rs_1'])
+
+        self.assertFalse(redis_client.exists(session_cache.key('rs_1'), exam_timer.key('rs_1')))
+        self.assertEqual(redis_client.zscore(leaderboard.key('rs_'), 'rs_1'), 0)
+
+    @override_settings(DATABASE_REPLICAS=['replica_0'])
+    def test_reset_pins_reads_to_the_primary(self, network_call):
+        reset_students(['rs_1'])
+
+        with replica_reads():
+            self.assertFalse(on_replica())
+
+
+class ImportUsersTests(TestCase):
+    HEADER = 'student_name,university_email,university_id\n'
+
+    def import_csv(self, rows, **kwargs):
+        return import_users_csv(io.BytesIO((self.HEADER + rows).encode('utf-8')), 'im_', **kwargs)
+
+    def test_inserts_in_chunks(self):
+        rows = ''.join(f'Student {i},s{i}@example.com,{100 + i}\n' for i in range(5))
+
+        summary = self.import_csv(rows, batch_size=2)
+
+        self.assertEqual(summary['inserted'], [f'im_{100 + i}' for i in range(5)])
+        user = User.objects.get(username='im_100')
+        self.assertEqual((user.student_name, user.university_id, user.exam_prefix), ('Student 0', 100, 'im_'))
+
+    def test_existing_users_are_skipped(self):
+        User.objects.create(username='im_1', student_name='Old')
+
+        summary = self.import_csv('New,a@example.com,1\nOther,b@example.com,2\n')
+
+        self.assertEqual(summary['inserted'], ['im_2'])
+        self.assertEqual(summary['skipped'], [{'line': 2, 'username': 'im_1', 'reason': USER_ALREADY_EXISTS}])
+        self.assertEqual(User.objects.get(username='im_1').student_name, 'Old')
+
+    def test_existing_users_are_updated(self):
+        User.objects.create(username='im_1', student_name='Old')
+
+        summary = self.import_csv('New,a@example.com,1\n', on_conflict='update')
+
+        self.assertEqual(summary['updated'], ['im_1'])
+        self.assertEqual(User.objects.get(username='im_1').student_name, 'New')
+
+    def test_duplicate_rows_in_the_file(self):
+        summary = self.import_csv('A,a@example.com,1\nB,b@example.com,1\n', batch_size=1)
+
+        self.assertEqual(summary['inserted'], ['im_1'])
+        self.assertEqual(summary['skipped'], [{'line': 3, 'username': 'im_1', 'reason': 'duplicate row in file'}])
+
+    def test_invalid_rows_are_reported_by_line(self):
+        summary = self.import_csv(
+            'A,,1\n'
+            'B,not-an-email,2\n'
+            'C,c@example.com,3a\n'
+            'D,d@example.com,12345678901234\n'
+            'E,e@example.com,4\n'
+        )
+
+        self.assertEqual(summary['inserted'], ['im_4'])
+        self.assertEqual(summary['rejected'], [
+            {'line': 2, 'reason': MISSING_REQUIRED_FIELD.format('university_email')},
+            {'line': 3, 'reason': 'university_email is not a valid email'},
+            {'line': 4, 'reason': 'university_id must be numeric'},
+            {'line': 5, 'reason': 'username im_12345678901234 is longer than 15 characters'},
+        ])
+
+    def test_only_ascii_digits_are_a_university_id(self):
+        # str.isdigit() takes these, int() refuses the superscript and reads the arabic-indic digits
+        summary = self.import_csv('A,a@example.com,\u00b2\nB,b@example.com,\u0661\u0662\n')
+
+        self.assertEqual(summary['inserted'], [])
+        self.assertEqual([row['reason'] for row in summary['rejected']], ['university_id must be numeric'] * 2)
+
+    def test_missing_columns(self):
+        summary = import_users_csv(io.BytesIO(b'student_name,university_id\nA,1\n'), 'im_')
+
+        self.assertEqual(summary['error'], MISSING_REQUIRED_FIELD.format('university_email'))
+        self.assertFalse(User.objects.filter(exam_prefix='im_').exists())
+
+    def test_broken_file_keeps_the_chunks_before_it(self):
+        # past the first 8KB the decoder reads, so the good rows are parsed first
+        rows = ''.join(f'Student {i},s{i}@example.com,{i}\n' for i in range(1, 500))
+        data = (self.HEADER + rows).encode('utf-8') + b'Bad,\xff@example.com,9999\n'
+
+        summary = import_users_csv(io.BytesIO(data), 'im_', batch_size=100)
+
+        self.assertTrue(summary['error'].startswith('line '))
+        self.assertTrue(summary['inserted'])
+        self.assertEqual(len(summary['inserted']) % 100, 0)
+        self.assertEqual(User.objects.filter(exam_prefix='im_').count(), len(summary['inserted']))
+
+    def test_summary_response_status(self):
+        empty = {'inserted': [], 'updated': [], 'skipped': [], 'rejected': []}
+
+        self.assertEqual(import_summary_response(dict(empty, inserted=['im_1']))[1], 201)
+        self.assertEqual(import_summary_response(dict(empty, skipped=[{'line': 2}]))[1], 200)
+        self.assertEqual(import_summary_response(dict(empty, rejected=[{'line': 2}]))[1], 400)
+        self.assertEqual(import_summary_response(dict(empty, skipped=[{'line': 2}], error='line 3: bad'))[1], 400)
+
+
+def _question(text, options=('a', 'b'), answer='a'):
+    return {'text': text, 'options': list(options), 'answer': answer}
+
+
+def _bank_response(status_code=200, body=None):
+    response = requests.Response()
+    response.status_code = status_code
+    response.url = f'http://question-bank{QUESTION_ADD_PATH}'
+    response._content = json.dumps(body if body is not None else {'count': 1}).encode('utf-8')
+    return response
+
+
+class ValidateQuestionTests(SimpleTestCase):
+    def test_valid_question(self):
+        self.assertEqual(validate_question(_question('  What?  ')), (_question('What?'), None))
+
+    def test_invalid_questions(self):
+        for row, reason in (
+            (['not', 'an', 'object'], 'expected a JSON object'),
+            ('invalid JSON: Expecting value', 'invalid JSON: Expecting value'),
+            ({'options': ['a', 'b'], 'answer': 'a'}, MISSING_REQUIRED_FIELD.format('text')),
+            (_question('Q', options=['a']), 'at least 2 options are required'),
+            (_question('Q', options=['a', 2]), 'options must be non-empty strings'),
+            (_question('Q', options=['a', ' ']), 'options must be non-empty strings'),
+            (_question('Q', options=['a', 'a']), 'options must be unique'),
+            (_question('Q', answer='c'), 'answer must be one of the options'),
+        ):
+            with self.subTest(row=row):
+                self.assertEqual(validate_question(row), (None, reason))
+
+
+class QuestionRowsTests(SimpleTestCase):
+    def test_csv_option_columns(self):
+        data = b'text,option_1,option_2,option_3,answer,topic\nQ1,a,b,,a,math\n'
+
+        self.assertEqual(list(csv_rows(io.BytesIO(data))), [
+            (2, {'text': 'Q1', 'answer': 'a', 'topic': 'math', 'options': ['a', 'b']}),
+        ])
+
+    def test_csv_options_column(self):
+        data = b'text,options,answer\nQ1,a|b|c,b\nQ2,x|y,y\n'
+
+        self.assertEqual(list(csv_rows(io.BytesIO(data))), [
+            (2, {'text': 'Q1', 'answer': 'b', 'options': ['a', 'b', 'c']}),
+            (3, {'text': 'Q2', 'answer': 'y', 'options': ['x', 'y']}),
+        ])
+
+    def test_ndjson(self):
+        data = b'{"text": "Q1"}\n\nnot json\n'
+
+        rows = list(ndjson_rows(io.BytesIO(data)))
+
+        self.assertEqual(rows[0], (1, {'text': 'Q1'}))
+        self.assertEqual(rows[1][0], 3)
+        self.assertTrue(rows[1][1].startswith('invalid JSON: '))
+
+
+@mock.patch('exam.ingest.question_bank_headers', return_value={'Authorization': 'Bearer test'})
+@mock.patch('exam.ingest.question_bank_client')
+class IngestQuestionsTests(SimpleTestCase):
+    @staticmethod
+    def sent(client):
+        return sorted(
+            (call.kwargs['json']['questions'] for call in client.request.call_args_list), key=lambda batch: batch[0]['text']
+        )
+
+    def test_valid_questions_go_out_in_batches(self, client, headers):
+        client.request.return_value = _bank_response()
+        questions = [_question(f'Q{i}') for i in range(5)]
+
+        summary = ingest_questions(json_rows(questions), batch_size=2, concurrency=2)
+
+        self.assertEqual(self.sent(client), [questions[0:2], questions[2:4], questions[4:]])
+        for call in client.request.call_args_list:
+            self.assertEqual(call.args, ('POST', QUESTION_ADD_PATH))
+            self.assertEqual(call.kwargs['headers'], {'Authorization': 'Bearer test'})
+        self.assertEqual(
+            [(batch['batch'], batch['first_line'], batch['last_line'], batch['count']) for batch in summary['batches']],
+            [(1, 1, 2, 2), (2, 3, 4, 2), (3, 5, 5, 1)]
+        )
+        self.assertEqual((summary['accepted'], summary['failed'], summary['rejected']), (5, 0, []))
+
+    def test_invalid_rows_are_rejected_by_line(self, client, headers):
+        client.request.return_value = _bank_response()
+
+        summary = ingest_questions(json_rows([_question('Q1'), _question('Q2', answer='z'), _question('Q3')]))
+
+        self.assertEqual(summary['rejected'], [{'line': 2, 'reason': 'answer must be one of the options'}])
+        self.assertEqual(self.sent(client), [[_question('Q1'), _question('Q3')]])
+
+    def test_failed_batches_are_reported_by_line_range(self, client, headers):
+        def respond(method, path, headers, json):
+            if json['questions'][0]['text'] == 'Q2':
+                return _bank_response(500, {'detail': 'boom'})
+            if json['questions'][0]['text'] == 'Q4':
+                return _bank_response(200, {'error': 'duplicate question'})
+            return _bank_response()
+
+        client.request.side_effect = respond
+
+        summary = ingest_questions(json_rows([_question(f'Q{i}') for i in range(6)]), batch_size=2)
+
+        failed = [(batch['first_line'], batch['last_line']) for batch in summary['batches'] if not batch['is_success']]
+        self.assertEqual(failed, [(3, 4), (5, 6)])
+        self.assertIn('500', summary['batches'][1]['error'])
+        self.assertEqual(summary['batches'][2]['error'], 'duplicate question')
+        self.assertEqual((summary['accepted'], summary['failed']), (2, 4))
+
+        data, response_status = ingest_summary_response(summary)
+        self.assertEqual((response_status, data['is_success']), (201, False))
+
+    def test_unreachable_question_bank(self, client, headers):
+        client.request.side_effect = requests.ConnectionError('refused')
+
+        summary = ingest_questions(json_rows([_question('Q1')]))
+
+        self.assertEqual((summary['accepted'], summary['failed']), (0, 1))
+        self.assertEqual(ingest_summary_response(summary)[1], 400)
+
+    def test_broken_upload_keeps_the_partial_summary(self, client, headers):
+        client.request.return_value = _bank_response()
+
+        def rows():
+            yield 1, _question('Q1')
+            yield 2, _question('Q2')
+            yield 3, _question('Q3', answer='z')
+            raise UnicodeDecodeError('utf-8', b'\xff', 0, 1, 'invalid start byte')
+
+        summary = ingest_questions(rows(), batch_size=1)
+
+        self.assertTrue(summary['error'].startswith('after line 3: '))
+        self.assertEqual(summary['accepted'], 2)
+        self.assertEqual(len(summary['rejected']), 1)
+
+        data, response_status = ingest_summary_response(summary)
+        self.assertEqual(response_status, 201)
+        self.assertFalse(data['is_success'])
+        self.assertEqual(data['error'], summary['error'])
+
+    def test_broken_csv_upload(self, client, headers):
+        client.request.return_value = _bank_response()
+        # past the first 8KB the decoder reads, so the good rows are parsed first
+        rows = ''.join(f'Q{i},a|b,a\n' for i in range(1, 1000))
+        data = ('text,options,answer\n' + rows).encode('utf-8') + b'\xff,a|b,a\n'
+
+        summary = ingest_questions(csv_rows(io.BytesIO(data)), batch_size=100)
+
+        self.assertIn('error', summary)
+        self.assertGreater(summary['accepted'], 0)
+        self.assertEqual(summary['accepted'], sum(batch['count'] for batch in summary['batches']))
+
+    def test_nothing_valid(self, client, headers):
+        summary = ingest_questions(json_rows([{'text': ''}]))
+
+        client.request.assert_not_called()
+        data, response_status = ingest_summary_response(summary)
+        self.assertEqual((response_status, data['message']), (400, NO_VALID_QUESTIONS))
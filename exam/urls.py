@@ -1,19 +1,47 @@
+from django.conf import settings
 from django.urls import path
+from django.views.decorators.csrf import csrf_exempt
 
+from .async_views import (AsyncAddQuestionsView, AsyncRequestQuestionsView, AsyncStoreFeedbackView,
+                          AsyncStoreResponseView)
 from .views import (AddQuestionsAPIView, ExamCreateView, LoginAPIView, Ping,
                     StoreFeedbackAPIView, StoreResponseAPIView, UserCSVExportView,
-                    UserCSVUploadView, RequestQuestionsAPIView, RestStudentExamView
+                    UserCSVUploadView, RequestQuestionsAPIView, RestStudentExamView,
+                    QuestionBankPoolStatsView, RedisHealthView, MetricsView, LeaderboardView,
+                    LeaderboardStandingView, MarksCallbackView, BulkResetStudentExamView, JobStatusView,
+                    JobResultView
 )
 
+if settings.ASYNC_EXAM_VIEWS:
+    request_questions_view = csrf_exempt(AsyncRequestQuestionsView.as_view())
+    add_questions_view = csrf_exempt(AsyncAddQuestionsView.as_view())
+    store_response_view = csrf_exempt(AsyncStoreResponseView.as_view())
+    store_feedback_view = csrf_exempt(AsyncStoreFeedbackView.as_view())
+
+else:
+    request_questions_view = RequestQuestionsAPIView.as_view()
+    add_questions_view = AddQuestionsAPIView.as_view()
+    store_response_view = StoreResponseAPIView.as_view()
+    store_feedback_view = StoreFeedbackAPIView.as_view()
+
 urlpatterns = [
     path('api/export/users', UserCSVExportView.as_view(), name='export_users_csv'),
     path('api/upload/users', UserCSVUploadView.as_view(), name='upload_users_csv'),
     path('api/create_exam/', ExamCreateView.as_view(), name='exam_create'),
     path('api/login', LoginAPIView.as_view(), name='login'),
-    path('api/question', RequestQuestionsAPIView.as_view(), name='fetch_questions'),
-    path('api/question/add', AddQuestionsAPIView.as_view(), name='add_questions'),
-    path('api/answer/submit', StoreResponseAPIView.as_view(), name='capture_response'),
-    path('api/submit/feedback', StoreFeedbackAPIView.as_view(), name='capture_response'),
+    path('api/question', request_questions_view, name='fetch_questions'),
+    path('api/question/add', add_questions_view, name='add_questions'),
+    path('api/answer/submit', store_response_view, name='capture_response'),
+    path('api/submit/feedback', store_feedback_view, name='capture_response'),
     path('api/exam/rest', RestStudentExamView.as_view(), name='reset_exam'),
+    path('api/exam/rest/bulk', BulkResetStudentExamView.as_view(), name='reset_exam_bulk'),
+    path('api/leaderboard', LeaderboardView.as_view(), name='leaderboard'),
+    path('api/leaderboard/standing', LeaderboardStandingView.as_view(), name='leaderboard_standing'),
+    path('api/leaderboard/marks', MarksCallbackView.as_view(), name='leaderboard_marks'),
+    path('api/jobs/<str:job_id>', JobStatusView.as_view(), name='job_status'),
+    path('api/jobs/<str:job_id>/result', JobResultView.as_view(), name='job_result'),
+    path('api/question-bank/pool', QuestionBankPoolStatsView.as_view(), name='question_bank_pool'),
+    path('api/health/redis', RedisHealthView.as_view(), name='redis_health'),
+    path('api/metrics', MetricsView.as_view(), name='metrics'),
     path('api/ping', Ping.as_view(), name='ping')
-]
\ No newline at end of file
+]
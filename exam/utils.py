@@ -1,13 +1,18 @@
 import os
+import threading
 from functools import wraps
 
 import requests
 from django.core.exceptions import FieldError
 from django.db import DatabaseError
+from rest_framework.exceptions import APIException
 from rest_framework.response import Response
 from rest_framework import status
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from .constants import INVALID_CREDENTIALS
+from .metrics import dependency_timer
 from .models import User, Exam
 
 import logging
@@ -17,70 +22,208 @@ logger = logging.getLogger()
 question_bank_uri = os.getenv('QuestionBankAppURI', "http://127.0.0.1:5012")
 
 
+def exception_response_data(e: Exception):
+    # (payload, status) for exceptions escaping a view, shared by the sync and async views
+    if isinstance(e, User.DoesNotExist):
+        return {
+            'error': INVALID_CREDENTIALS,
+            'is_success': False
+        }, status.HTTP_401_UNAUTHORIZED
+
+    if isinstance(e, Exam.MultipleObjectsReturned):
+        return {
+            'error': 'Multiple Exam entries found with the given prefix.',
+            'is_success': False
+        }, status.HTTP_409_CONFLICT
+
+    if isinstance(e, FieldError):
+        return {
+            'error': 'Field error in query.',
+            'is_success': False
+        }, status.HTTP_404_NOT_FOUND
+
+    if isinstance(e, APIException):
+        return {
+            'error': str(e.detail),
+            'is_success': False
+        }, e.status_code
+
+    if isinstance(e, DatabaseError):
+        return {
+            'error': 'Database error occurred.',
+            'is_success': False
+        }, status.HTTP_404_NOT_FOUND
+
+    return {
+        'error': str(e),
+        'is_success': False
+    }, status.HTTP_500_INTERNAL_SERVER_ERROR
+
+
 def exception_handler_decorator(func):
     @wraps(func)
     def wrapper(*args, **kwargs):
         try:
             return func(*args, **kwargs)
 
-        except User.DoesNotExist as e:
+        except Exception as e:
             logger.info(e)
-            return Response({
-                'error': INVALID_CREDENTIALS,
-                'is_success': False
-            }, status=status.HTTP_401_UNAUTHORIZED)
+            data, response_status = exception_response_data(e)
+            return Response(data, status=response_status)
 
-        except Exam.MultipleObjectsReturned as e:
-            logger.info(e)
-            return Response({
-                'error': 'Multiple Exam entries found with the given prefix.',
-                'is_success': False
-            }, status=status.HTTP_409_CONFLICT)
+    return wrapper
 
-        except FieldError as e:
-            logger.info(e)
-            return Response({
-                'error': 'Field error in query.',
-                'is_success': False
-            }, status=status.HTTP_404_NOT_FOUND)
 
-        except DatabaseError as e:
-            logger.info(e)
-            return Response({
-                'error': 'Database error occurred.',
-                'is_success': False
-            }, status=status.HTTP_404_NOT_FOUND)
+def parse_endpoint_timeouts(value: str) -> dict:
+    # "/question=1:5,/question/add=2:60" -> {"/question": (1.0, 5.0), ...}
+    timeouts = {}
+    for entry in filter(None, (item.strip() for item in value.split(','))):
+        path, _, timeout = entry.partition('=')
+        connect_timeout, _, read_timeout = timeout.partition(':')
+        timeouts[path] = (float(connect_timeout), float(read_timeout or connect_timeout))
+    return timeouts
 
-        except Exception as e:
-            logger.info(e)
-            return Response({
-                'error': str(e),
-                'is_success': False
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
-    return wrapper
+class PoolCounters:
+    # request / in-flight counters used to size the question bank pools
 
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {
+            'requests': 0,
+            'errors': 0,
+            'in_flight': 0,
+            'peak_in_flight': 0,
+        }
 
-def question_bank_network_call(body: dict, request_type: str, request_path: str):
-    # Call the microservice to get questions
-    microservice_url = f"{question_bank_uri}{request_path}"
-    headers = {
+    def _track(self, counter, delta=1):
+        with self._lock:
+            self._counters[counter] += delta
+            if self._counters['in_flight'] > self._counters['peak_in_flight']:
+                self._counters['peak_in_flight'] = self._counters['in_flight']
+
+    def counters(self) -> dict:
+        with self._lock:
+            return dict(self._counters)
+
+
+class QuestionBankClient(PoolCounters):
+    """
+    Keep-alive connection pool to the question bank. Connect errors are
+    retried for every method, read/status errors only for idempotent GETs.
+    """
+
+    def __init__(self, base_uri, pool_size, pool_block, retries, backoff, jitter, default_timeout, timeouts):
+        super().__init__()
+        self.base_uri = base_uri
+        self.pool_size = pool_size
+        self.default_timeout = default_timeout
+        self.timeouts = timeouts
+
+        self.adapter = HTTPAdapter(
+            pool_connections=1,  # a single upstream host
+            pool_maxsize=pool_size,
+            pool_block=pool_block,
+            max_retries=Retry(
+                total=retries,
+                backoff_factor=backoff,
+                backoff_jitter=jitter,
+                status_forcelist=(502, 503, 504),
+                allowed_methods=frozenset(['GET']),
+                raise_on_status=False
+            )
+        )
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+    def request(self, method: str, path: str, **kwargs):
+        self._track('requests')
+        self._track('in_flight')
+        try:
+            with dependency_timer('upstream'):
+                return self.session.request(
+                    method,
+                    f"{self.base_uri}{path}",
+                    timeout=self.timeouts.get(path, self.default_timeout),
+                    **kwargs
+                )
+
+        except requests.RequestException:
+            self._track('errors')
+            raise
+
+        finally:
+            self._track('in_flight', -1)
+
+    def stats(self) -> dict:
+        stats = self.counters()
+
+        pools = []
+        for key in self.adapter.poolmanager.pools.keys():
+            pool = self.adapter.poolmanager.pools[key]
+            pools.append({
+                'host': pool.host,
+                'port': pool.port,
+                'connections_created': pool.num_connections,
+                'requests': pool.num_requests,
+                'idle_connections': sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0,
+            })
+
+        stats['pool_size'] = self.pool_size
+        stats['pools'] = pools
+        return stats
+
+
+QUESTION_BANK_POOL_SIZE = int(os.getenv('QUESTION_BANK_POOL_SIZE', 50))
+QUESTION_BANK_RETRIES = int(os.getenv('QUESTION_BANK_RETRIES', 2))
+QUESTION_BANK_RETRY_BACKOFF = float(os.getenv('QUESTION_BANK_RETRY_BACKOFF', 0.1))
+QUESTION_BANK_RETRY_JITTER = float(os.getenv('QUESTION_BANK_RETRY_JITTER', 0.2))
+QUESTION_BANK_DEFAULT_TIMEOUT = (
+    float(os.getenv('QUESTION_BANK_CONNECT_TIMEOUT', 2)),
+    float(os.getenv('QUESTION_BANK_READ_TIMEOUT', 10))
+)
+QUESTION_BANK_TIMEOUTS = parse_endpoint_timeouts(
+    os.getenv('QUESTION_BANK_TIMEOUTS', '/question=2:5,/answer/submit=2:5,/question/add=2:60')
+)
+
+question_bank_client = QuestionBankClient(
+    base_uri=question_bank_uri,
+    pool_size=QUESTION_BANK_POOL_SIZE,
+    pool_block=os.getenv('QUESTION_BANK_POOL_BLOCK', 'false').lower() == 'true',
+    retries=QUESTION_BANK_RETRIES,
+    backoff=QUESTION_BANK_RETRY_BACKOFF,
+    jitter=QUESTION_BANK_RETRY_JITTER,
+    default_timeout=QUESTION_BANK_DEFAULT_TIMEOUT,
+    timeouts=QUESTION_BANK_TIMEOUTS
+)
+
+
+def question_bank_headers() -> dict:
+    return {
         'Authorization': f'Bearer {os.getenv("ADMIN_TOKEN")}',  # Add the admin token in the headers
         'Content-Type': 'application/json'
     }
 
+
+def question_bank_network_call(body: dict, request_type: str, request_path: str):
+    # Call the microservice to get questions
+    headers = question_bank_headers()
+
     try:
         if request_type == 'GET':
-            response = requests.get(
-                microservice_url,
+            response = question_bank_client.request(
+                'GET',
+                request_path,
                 headers=headers,
                 params=body
             )
             return response.json()
 
         else:
-            response = requests.post(
-                microservice_url,
+            response = question_bank_client.request(
+                'POST',
+                request_path,
                 headers=headers,
                 json=body
             )
@@ -1,27 +1,48 @@
 import csv
-import json
-import random
-
-import uuid
+import hmac
+import os
 from datetime import timedelta
 
 import redis
 from dateutil import parser
-from django.db import IntegrityError, transaction
-from django.http import HttpResponse
+from django.conf import settings
+from django.http import HttpResponse, StreamingHttpResponse
+from django.urls import reverse
 from django.utils import timezone
 from rest_framework import generics, status
+from rest_framework.exceptions import ParseError
 from rest_framework.parsers import FormParser, MultiPartParser
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from exam.constants import USER_ALREADY_EXISTS, USER_CREATED_SUCCESSFULLY, EXAM_PREFIX_NOT_FOUND, \
-    MISSING_REQUIRED_FIELD, ALREADY_LOGGED_IN, INVALID_CREDENTIALS, CustomRedisException, USERNAME_MISSING, \
-    USER_NOT_LOGGED_IN
+from Saraswati.db_router import replica_reads
+from exam.constants import EXAM_PREFIX_NOT_FOUND, \
+    MISSING_REQUIRED_FIELD, ALREADY_LOGGED_IN, INVALID_CREDENTIALS, USERNAME_MISSING, \
+    USER_NOT_LOGGED_IN, INVALID_CURSOR, USER_NOT_FOUND, INVALID_SCORES, QUESTION_CONTENT_MISSING, JOB_NOT_FOUND, \
+    JOB_NOT_FINISHED, JOB_INPUT_TOO_LARGE, ADMIN_TOKEN_NOT_CONFIGURED
+from .answer_queue import enqueue_answer
+from .async_utils import async_question_bank_client
 from .cache import RedisManagerClient
+from .exam_config import exam_config_cache
+from .exam_timer import exam_timer
+from .export import (EXPORT_PAGE_LIMIT, encode_cursor, export_page, export_queryset, export_serializer,
+                     parse_cursor, stream_users_csv)
+from .fastjson import dumps
+from .importer import IMPORT_BATCH_SIZE, import_summary_response, import_users_csv
+from .ingest import (INGEST_BATCH_SIZE, ingest_questions, ingest_summary_response, json_rows, upload_format,
+                     upload_rows)
+from .jobs import (FAILED, FINISHED, JOB_INLINE_MAX_BYTES, JOB_INLINE_MAX_QUESTIONS, JOB_INLINE_MAX_ROWS,
+                   JOB_MAX_INPUT_BYTES, accepted_response_data, job_queue, run_as_job)
+from .leaderboard import leaderboard
+from .metrics import render_metrics
 from .models import Exam, User
-from .serializers import CSVUploadSerializer, ExamSerializer, UserCSVSerializer
-from .utils import exception_handler_decorator, question_bank_network_call
+from .prefixes import prefix_allocator
+from .question_content import question_content_cache, question_request
+from .question_paper import question_paper_cache
+from .resets import RESET_BULK_MAX, reset_students
+from .serializers import CSVUploadSerializer, ExamSerializer
+from .sessions import claim_login, session_cache, warm_request_caches
+from .utils import exception_handler_decorator, question_bank_client, question_bank_network_call
 from django.core.paginator import Paginator
 
 import logging
@@ -31,29 +52,95 @@ logger = logging.getLogger()
 
 redis_client = RedisManagerClient().client
 
+ADMIN_TOKEN = os.getenv('ADMIN_TOKEN', '')
+
+
+def queue_job(kind, args, chunks):
+    """202 for the queued job, None when redis is down and the request should run inline."""
+    try:
+        job_id = job_queue.submit(kind, args, chunks)
+
+    except redis.RedisError as e:
+        logger.info(e)
+        return None
+
+    data = accepted_response_data(job_id)
+    return Response(data, status=status.HTTP_202_ACCEPTED, headers={'Location': data['status_url']})
+
+
+def job_input_too_large():
+    return Response({
+        "error": JOB_INPUT_TOO_LARGE,
+        "is_success": False
+    },
+        status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+    )
+
 
 class UserCSVExportView(APIView):
+    # reporting read, a replica a little behind is fine
+    @replica_reads()
     def get(self, request):
-        page_number = request.GET.get('page', 1)
-        items_per_page = 100
+        exam_prefix = request.GET.get('exam_prefix')
 
-        users = User.objects.all().order_by('-marks')
+        try:
+            cursor = parse_cursor(request.GET['cursor']) if request.GET.get('cursor') else None
 
-        paginator = Paginator(users, items_per_page)
-        page = paginator.get_page(page_number)
+        except ValueError:
+            return Response({
+                "error": INVALID_CURSOR
+            },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        whole_sheet = request.GET.get('stream', '').lower() in ('1', 'true')
+        if (whole_sheet or request.GET.get('async')) and run_as_job(
+                request.GET, lambda: export_queryset(exam_prefix, cursor).count(), JOB_INLINE_MAX_ROWS):
+            response = queue_job('export_users', {
+                'exam_prefix': exam_prefix,
+                'cursor': list(cursor) if cursor else None
+            }, ())
+            if response is not None:
+                return response
+
+        # whole result sheet in one request, rows are read in keyset windows
+        if whole_sheet:
+            response = StreamingHttpResponse(
+                stream_users_csv(exam_prefix, cursor),
+                content_type='text/csv'
+            )
+            response['Content-Disposition'] = 'attachment; filename="users.csv"'
+            return response
 
-        serializer = UserCSVSerializer(page.object_list, many=True)
         response = HttpResponse(content_type='text/csv')
         response['Content-Disposition'] = 'attachment; filename="users.csv"'
-
         writer = csv.writer(response)
-        for user in serializer.data:
-            writer.writerow([
-                user.get('student_name', ''),
-                user.get('university_email', ''),
-                user.get('university_id', ''),
-                user.get('marks', '')
-            ])
+
+        # keyset pagination, the next page starts after X-Next-Cursor
+        if 'cursor' in request.GET:
+            try:
+                limit = min(int(request.GET.get('limit', 100)), EXPORT_PAGE_LIMIT)
+
+            except ValueError:
+                limit = 100
+
+            rows, next_cursor = export_page(exam_prefix, cursor, max(limit, 1))
+            writer.writerows(rows)
+            if next_cursor:
+                response['X-Next-Cursor'] = encode_cursor(*next_cursor)
+
+            return response
+
+        page_number = request.GET.get('page', 1)
+        items_per_page = 100
+
+        users = User.objects.all().order_by('-marks')
+        if exam_prefix:
+            users = users.filter(exam_prefix=exam_prefix)
+
+        paginator = Paginator(export_serializer.queryset(users), items_per_page)
+        page = paginator.get_page(page_number)
+        writer.writerows(export_serializer.rows(page.object_list))
 
         return response
 
@@ -73,29 +160,33 @@ class UserCSVUploadView(APIView):
             )
 
         if serializer.is_valid():
-            file = request.FILES['file']
-            decoded_file = file.read().decode('utf-8').splitlines()
-            reader = csv.DictReader(decoded_file)
-            users_to_create = []
+            try:
+                batch_size = max(int(request.data.get('batch_size', IMPORT_BATCH_SIZE)), 1)
+
+            except ValueError:
+                batch_size = IMPORT_BATCH_SIZE
+
+            on_conflict = 'update' if request.data.get('on_conflict') == 'update' else 'skip'
+
+            upload = request.FILES['file']
+            if run_as_job(request.query_params, upload.size, JOB_INLINE_MAX_BYTES):
+                if upload.size > JOB_MAX_INPUT_BYTES:
+                    return job_input_too_large()
+
+                response = queue_job('import_users', {
+                    'exam_prefix': exam_prefix,
+                    'batch_size': batch_size,
+                    'on_conflict': on_conflict
+                }, upload.chunks())
+                if response is not None:
+                    return response
 
             try:
-                for row in reader:
-                    user = User(
-                        student_name=row['student_name'],
-                        university_email=row['university_email'],
-                        university_id=row['university_id'],
-                        exam_prefix=exam_prefix,
-                        username=exam_prefix + row['university_id']
-                    )
-                    users_to_create.append(user)
-                User.objects.bulk_create(users_to_create)
-
-            except IntegrityError as ex:
-                return Response({
-                    "message": USER_ALREADY_EXISTS,
-                    "error": str(ex)
-                },
-                    status=status.HTTP_400_BAD_REQUEST
+                summary = import_users_csv(
+                    upload.file,
+                    exam_prefix,
+                    batch_size=batch_size,
+                    on_conflict=on_conflict
                 )
 
             except Exception as ex:
@@ -105,10 +196,8 @@ class UserCSVUploadView(APIView):
                     status=status.HTTP_400_BAD_REQUEST
                 )
 
-            return Response({
-                "message": USER_CREATED_SUCCESSFULLY},
-                status=status.HTTP_201_CREATED
-            )
+            data, response_status = import_summary_response(summary)
+            return Response(data, status=response_status)
 
         return Response(
             serializer.errors,
@@ -129,10 +218,12 @@ class ExamCreateView(generics.CreateAPIView):
                 valid_till = timezone.make_aware(valid_till, timezone.get_current_timezone())
         else:
             valid_till = timezone.now() + timedelta(days=14)
-        serializer.save(
-            created_at=timezone.now(),
-            valid_till=valid_till,
-            prefix=''.join(random.sample('abcdefghijklmnopqrstuvwxyz', 2)) + '_'
+        prefix_allocator.allocate(
+            lambda prefix: serializer.save(
+                created_at=timezone.now(),
+                valid_till=valid_till,
+                prefix=prefix
+            )
         )
 
 
@@ -151,58 +242,50 @@ class LoginAPIView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        with transaction.atomic():  # so entire code can be roll back
-            user = User.objects.select_for_update().get(username=username)  # locks the row in DB
-            if user.last_logged_in is None:
-                user.last_logged_in = timezone.now()
-                user.auth_token = uuid.uuid4().hex
-                user.save()
+        try:
+            # resolved before the token is issued so a missing exam never burns a login
+            exam_settings = exam_config_cache.get(exam_prefix)
 
-            else:
+        except (Exam.DoesNotExist, Exam.MultipleObjectsReturned):
+            # unknown user and already logged in still take precedence, as before
+            if User.objects.only('last_logged_in').get(username=username).last_logged_in is not None:
                 return Response({
                     'error': ALREADY_LOGGED_IN,
                     'is_success': False
                 }, status=status.HTTP_406_NOT_ACCEPTABLE)
+            raise
 
-            try:
-                time_per_question = redis_client.get(f"tpq:{exam_prefix}")
-                no_of_questions = redis_client.get(f"tq:{exam_prefix}")
-
-                if time_per_question is None or no_of_questions is None:
-                    raise CustomRedisException()
-
-            except CustomRedisException:
-                exam_obj = Exam.objects.get(prefix=exam_prefix)
-                time_per_question = exam_obj.time_per_question
-                no_of_questions = exam_obj.no_of_questions
-
-                redis_client.set(f"tpq:{exam_prefix}", time_per_question)
-                redis_client.set(f"noq:{exam_prefix}", no_of_questions)
-
-            except (
-                    redis.ConnectionError,
-                    redis.TimeoutError,
-                    redis.RedisError,
-                    AttributeError
-            ):
-                exam_obj = Exam.objects.get(prefix=exam_prefix)
-                time_per_question = exam_obj.time_per_question
-                no_of_questions = exam_obj.no_of_questions
+        claimed = claim_login(username)
+        if claimed is None:
+            if not User.objects.filter(username=username).exists():
+                raise User.DoesNotExist(INVALID_CREDENTIALS)
 
             return Response({
-                'status': 'User logged in',
-                'is_success': True,
-                'token': user.auth_token,
-                "time_per_question": time_per_question,
-                "total_questions": no_of_questions
-            }, status=status.HTTP_200_OK)
+                'error': ALREADY_LOGGED_IN,
+                'is_success': False
+            }, status=status.HTTP_406_NOT_ACCEPTABLE)
+
+        token, user_exam_prefix = claimed
+        session_cache.store(username, token, user_exam_prefix)
+        if settings.EXAM_TIMER:
+            exam_timer.start(username, exam_settings)
+
+        if settings.QUESTION_PREFETCH == 'login':
+            question_paper_cache.prefetch(username, exam_settings.no_of_questions)
+
+        return Response({
+            'status': 'User logged in',
+            'is_success': True,
+            'token': token,
+            "time_per_question": exam_settings.time_per_question,
+            "total_questions": exam_settings.no_of_questions
+        }, status=status.HTTP_200_OK)
 
 
 class RequestQuestionsAPIView(APIView):
     @exception_handler_decorator
     def post(self, request):
-        body_unicode = request.body.decode('utf-8')
-        body_data = json.loads(body_unicode)
+        body_data = request.data
 
         try:
             username = body_data['username']
@@ -225,14 +308,10 @@ class RequestQuestionsAPIView(APIView):
             },
                 status=status.HTTP_400_BAD_REQUEST)
 
-        # check if auth token is correct
-        try:
-            User.objects.get(
-                auth_token=body_data.get("token"),
-                username=username
-            )
+        warm_request_caches(username, exam_prefix)
 
-        except User.DoesNotExist:
+        # check if auth token is correct
+        if session_cache.resolve(username, body_data.get("token")) is None:
             return Response({
                     'error': USER_NOT_LOGGED_IN,
                     'is_success': False
@@ -240,67 +319,76 @@ class RequestQuestionsAPIView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        try:
-            no_of_questions = redis_client.get(f"noq:{exam_prefix}")
-            if no_of_questions is None:
-                raise CustomRedisException()
-
-        except CustomRedisException:
-            no_of_questions = Exam.objects.get(
-                prefix=exam_prefix
-            ).no_of_questions
-
-            # set it to redis
-            redis_client.set(f'noq:{exam_prefix}', no_of_questions)
-
-        except (
-                redis.ConnectionError,
-                redis.TimeoutError,
-                redis.RedisError,
-                AttributeError
-        ):
-            no_of_questions = Exam.objects.get(
-                prefix=exam_prefix
-            ).no_of_questions
-
-        response = question_bank_network_call({
-                                            "username": username,
-                                            "question_limit": no_of_questions
-                                        },
-            "GET",
-            "/question"
-        )
+        no_of_questions = exam_config_cache.get(exam_prefix).no_of_questions
+        lookahead = int(body_data.get('lookahead') or 0) if settings.QUESTION_PREFETCH != 'off' else 0
 
-        if not response.get("error"):
-            data = {
-                'question_id': response['question_id'],
-                'text': response['text'],
-                'options': response['options']
-            }
+        reserved = False
+        if settings.EXAM_TIMER:
+            reservation = exam_timer.begin(username)
+            if not reservation.allowed:
+                return Response({
+                    'error': reservation.error,
+                    'is_success': False
+                },
+                    status=status.HTTP_400_BAD_REQUEST
+                )
 
-        else:
-            data = {
-                'error': response.get("error") if response else 'Failed to fetch questions from microservice',
-                'is_success': False
-            }
+            if reservation.remaining is not None:
+                reserved = True
+                lookahead = min(lookahead, reservation.remaining - 1)
+
+        try:
+            data = self.question(username, no_of_questions, lookahead)
+
+        except BaseException:
+            if reserved:
+                exam_timer.release(username)
+            raise
 
         if data.get('is_success') is False:
-            return Response(
-                data,
-                status=status.HTTP_400_BAD_REQUEST
-            )
+            # nothing was served, the question index and its time stay unused
+            if reserved:
+                exam_timer.release(username)
+            return Response(data, status=status.HTTP_400_BAD_REQUEST)
 
+        if reserved:
+            exam_timer.served(username, data)
         return Response(data)
 
+    @staticmethod
+    def question(username, no_of_questions, lookahead):
+        if settings.QUESTION_PREFETCH != 'off':
+            data = question_paper_cache.serve(username, no_of_questions, lookahead)
+            if data is not None:
+                return data
+
+        response = question_bank_network_call(question_request(username, no_of_questions), "GET", "/question")
+
+        if not response.get("error"):
+            return question_content_cache.from_response(response) or {
+                'error': QUESTION_CONTENT_MISSING,
+                'is_success': False
+            }
+
+        return {
+            'error': response.get("error") if response else 'Failed to fetch questions from microservice',
+            'is_success': False
+        }
+
 
 class AddQuestionsAPIView(APIView):
+    """
+    A single JSON object is forwarded to the question bank as is. A JSON
+    array of questions or an uploaded CSV / NDJSON file is bulk ingested:
+    validated here and sent in parallel batches (see exam.ingest).
+    """
 
     def post(self, request):
-        try:
-            body_unicode = request.body.decode('utf-8')
-            body_data = json.loads(body_unicode)
+        if isinstance(request.data, list) or 'file' in request.FILES:
+            return self.bulk(request)
 
-            response = question_bank_network_call(body_data, "POST", "/question/add")
+        try:
+            response = question_bank_network_call(request.data, "POST", "/question/add")
             return Response(
                 response,
                 status=status.HTTP_200_OK if response.get("message") else status.HTTP_400_BAD_REQUEST
@@ -313,11 +401,57 @@ class AddQuestionsAPIView(APIView):
             )
 
 
+    @staticmethod
+    def bulk(request):
+        try:
+            batch_size = max(int(request.query_params.get('batch_size', INGEST_BATCH_SIZE)), 1)
+
+        except ValueError:
+            batch_size = INGEST_BATCH_SIZE
+
+        if isinstance(request.data, list):
+            if run_as_job(request.query_params, len(request.data), JOB_INLINE_MAX_QUESTIONS):
+                response = queue_job('ingest_questions', {
+                    'format': 'json',
+                    'batch_size': batch_size
+                }, [dumps(request.data)])
+                if response is not None:
+                    return response
+
+            rows = json_rows(request.data)
+
+        else:
+            upload = request.FILES['file']
+            if run_as_job(request.query_params, upload.size, JOB_INLINE_MAX_BYTES):
+                if upload.size > JOB_MAX_INPUT_BYTES:
+                    return job_input_too_large()
+
+                response = queue_job('ingest_questions', {
+                    'format': upload_format(upload, request.data.get('format')),
+                    'batch_size': batch_size
+                }, upload.chunks())
+                if response is not None:
+                    return response
+
+            rows = upload_rows(upload, request.data.get('format'))
+
+        try:
+            summary = ingest_questions(rows, batch_size=batch_size)
+
+        except Exception as e:
+            return Response(
+                status=status.HTTP_400_BAD_REQUEST,
+                data={"error": str(e)}
+            )
+
+        data, response_status = ingest_summary_response(summary)
+        return Response(data, status=response_status)
+
+
 class StoreResponseAPIView(APIView):
 
     def post(self, request):
-        body_unicode = request.body.decode('utf-8')
-        body_data = json.loads(body_unicode)
+        body_data = request.data
 
         if not body_data:
             return Response(
@@ -328,6 +462,40 @@ class StoreResponseAPIView(APIView):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        if settings.EXAM_TIMER:
+            missing = [field for field in ('username', 'question_id') if not body_data.get(field)]
+            if missing:
+                return Response({
+                    'error': MISSING_REQUIRED_FIELD.format(', '.join(missing)),
+                    'is_success': False
+                },
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+            verdict = exam_timer.check_answer(body_data['username'], body_data['question_id'])
+            if not verdict.allowed:
+                return Response({
+                    'error': verdict.error,
+                    'is_success': False
+                },
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        if settings.ANSWER_WRITE_BEHIND:
+            try:
+                key = enqueue_answer(redis_client, body_data)
+                return Response({
+                    "status": "queued",
+                    "is_success": True,
+                    "idempotency_key": key
+                },
+                    status=status.HTTP_202_ACCEPTED
+                )
+
+            except redis.RedisError as e:
+                # never drop an answer, forward it synchronously instead
+                logger.info(e)
+
         response = question_bank_network_call(body_data, "POST", "/answer/submit")
 
         if response.get("error"):
@@ -353,14 +521,13 @@ class StoreFeedbackAPIView(APIView):
         }
 
         try:
-            body_data = json.loads(request.body.decode('utf-8'))
             response = question_bank_network_call(
-                body_data,
+                request.data,
                 "POST",
                 "/submit/feedback"
             )
 
-        except json.decoder.JSONDecodeError:
+        except ParseError:
             pass
 
         return Response(
@@ -384,6 +551,12 @@ class RestStudentExamView(APIView):
                 user.marks = 0
                 user.reset_count = user.reset_count + 1
                 user.save()
+                leaderboard.set_marks({username: 0})
+
+                # revoke the token from memory, redis and db tiers
+                session_cache.invalidate(username)
+                question_paper_cache.invalidate(username)
+                exam_timer.invalidate(username)
 
                 # reset all answered questions from this username
                 question_bank_network_call(
@@ -424,6 +597,208 @@ class RestStudentExamView(APIView):
             )
 
 
+class BulkResetStudentExamView(APIView):
+    # {"usernames": [...]} and / or {"exam_prefix": "ab_"}
+    def post(self, request):
+        body_data = request.data if isinstance(request.data, dict) else {}
+        usernames = body_data.get('usernames') or []
+        exam_prefix = body_data.get('exam_prefix')
+        if not isinstance(usernames, list) or not all(isinstance(username, str) for username in usernames) \
+                or not isinstance(exam_prefix, (str, type(None))) or not (usernames or exam_prefix):
+            return Response({
+                'error': MISSING_REQUIRED_FIELD.format("usernames (a list of strings) or exam_prefix"),
+                'is_success': False
+            },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        if len(usernames) > RESET_BULK_MAX:
+            return Response({
+                'error': f'At most {RESET_BULK_MAX} usernames per request',
+                'is_success': False
+            },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            reset, response = reset_students(usernames, exam_prefix)
+
+        except Exception as ex:
+            return Response({
+                    'error': str(ex),
+                    'is_success': False
+                },
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        data = {
+            'status': f'{len(reset)} users reset',
+            'reset_count': len(reset),
+            'is_success': True,
+        }
+        if response and response.get('error'):
+            data['answers_reset_error'] = response['error']
+
+        return Response(data, status=status.HTTP_200_OK)
+
+
+class LeaderboardView(APIView):
+    def get(self, request):
+        exam_prefix = request.GET.get('exam_prefix')
+        if not exam_prefix:
+            return Response({
+                "error": MISSING_REQUIRED_FIELD.format("exam_prefix"),
+                "is_success": False
+            },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        try:
+            limit = int(request.GET.get('limit', 10))
+
+        except ValueError:
+            limit = 10
+
+        return Response(leaderboard.top(exam_prefix, limit))
+
+
+class LeaderboardStandingView(APIView):
+    def get(self, request):
+        username = request.GET.get('username')
+        if not username or '_' not in username:
+            return Response({
+                "error": USERNAME_MISSING,
+                "is_success": False
+            },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        standing = leaderboard.standing(username)
+        if standing is None:
+            return Response({
+                "error": USER_NOT_FOUND,
+                "is_success": False
+            },
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        return Response(standing)
+
+
+class MarksCallbackView(APIView):
+    # called by the question bank after scoring, {"username", "marks"} or {"scores": [...]}
+    def post(self, request):
+        if not ADMIN_TOKEN:
+            # an empty token would let any "Bearer " header through
+            return Response({
+                "error": ADMIN_TOKEN_NOT_CONFIGURED,
+                "is_success": False
+            },
+                status=status.HTTP_503_SERVICE_UNAVAILABLE
+            )
+
+        scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+        if scheme != 'Bearer' or not hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8')):
+            return Response({
+                "error": INVALID_CREDENTIALS,
+                "is_success": False
+            },
+                status=status.HTTP_401_UNAUTHORIZED
+            )
+
+        try:
+            scores = {
+                score['username']: int(score['marks'])
+                for score in request.data.get('scores', [request.data])
+            }
+
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return Response({
+                "error": INVALID_SCORES,
+                "is_success": False
+            },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        updated = leaderboard.record(scores)
+        return Response({
+            'updated': len(updated),
+            'unknown': sorted(set(scores) - set(updated)),
+            'is_success': True
+        })
+
+
+class QuestionBankPoolStatsView(APIView):
+    def get(self, request):
+        stats = question_bank_client.stats()
+        stats['async'] = async_question_bank_client.stats()
+        return Response(stats)
+
+
+class JobStatusView(APIView):
+    def get(self, request, job_id):
+        job = job_queue.get(job_id)
+        if job is None:
+            return Response({
+                'error': JOB_NOT_FOUND,
+                'is_success': False
+            },
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        job.pop('result', None)
+        if job['status'] in (FINISHED, FAILED):
+            job['result_url'] = reverse('job_result', args=[job_id])
+        return Response(job)
+
+
+class JobResultView(APIView):
+    def get(self, request, job_id):
+        job = job_queue.get(job_id)
+        if job is None:
+            return Response({
+                'error': JOB_NOT_FOUND,
+                'is_success': False
+            },
+                status=status.HTTP_404_NOT_FOUND
+            )
+
+        if job['status'] == FAILED:
+            return Response({
+                'error': job.get('error'),
+                'is_success': False
+            },
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        if job['status'] != FINISHED:
+            return Response({
+                'error': JOB_NOT_FINISHED,
+                'status': job['status'],
+                'is_success': False
+            },
+                status=status.HTTP_409_CONFLICT
+            )
+
+        if job.get('result_file'):
+            response = StreamingHttpResponse(job_queue.iter_result(job_id), content_type=job['result_type'])
+            response['Content-Disposition'] = f'attachment; filename="{job["result_file"]}"'
+            return response
+
+        return Response(job['result'], status=int(job['result_status']))
+
+
+class RedisHealthView(APIView):
+    def get(self, request):
+        health = RedisManagerClient().health()
+        return Response(health, status=status.HTTP_200_OK if health['ok'] else status.HTTP_503_SERVICE_UNAVAILABLE)
+
+
+class MetricsView(APIView):
+    def get(self, request):
+        return HttpResponse(render_metrics(os.getpid()), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
 class Ping(APIView):
     def get(self, request):
         return Response({"ping": "pong"})
@@ -0,0 +1,227 @@
+"""
+Exam lifecycle load test.
+
+Each locust user is one student: login -> /api/question + /api/answer/submit for
+every question -> feedback. On start the suite creates an exam through
+/api/create_exam/ and uploads --students users through /api/upload/users.
+
+    python loadtest/question_bank_stub.py --latency-ms 20 &
+    locust -f loadtest/locustfile.py --host http://127.0.0.1:8000 --headless \
+        -u 500 -r 100 --students 500 --max-p95-ms 300 --baseline loadtest/baseline.json
+
+Per-endpoint RPS and p50/p95/p99 are printed when the run stops. The process
+exits non-zero when a threshold is crossed or an endpoint regressed more than
+--max-regression percent against --baseline (write one with --save-baseline).
+"""
+import csv
+import io
+import itertools
+import json
+import logging
+import random
+
+import gevent
+import requests
+from locust import HttpUser, SequentialTaskSet, between, events, task
+from locust.exception import StopUser
+from locust.runners import MasterRunner, WorkerRunner
+
+exam = {'prefix': None}
+student_counter = itertools.count()
+
+
+@events.init_command_line_parser.add_listener
+def add_arguments(parser):
+    parser.add_argument('--students', type=int, default=100, help='Students to seed for the exam.')
+    parser.add_argument('--questions', type=int, default=10, help='no_of_questions of the seeded exam.')
+    parser.add_argument('--exam-prefix', default='', help='Reuse an already seeded exam instead of creating one.')
+    parser.add_argument('--think-time', type=float, default=1.0, help='Max seconds a student waits between calls.')
+    parser.add_argument('--max-p95-ms', type=float, default=0, help='Fail if any endpoint p95 exceeds this.')
+    parser.add_argument('--max-fail-ratio', type=float, default=0.01, help='Fail above this request failure ratio.')
+    parser.add_argument('--baseline', default='', help='JSON written by --save-baseline to compare against.')
+    parser.add_argument('--max-regression', type=float, default=20, help='Allowed p95 / RPS regression in percent.')
+    parser.add_argument('--save-baseline', default='', help='Write this run\'s per-endpoint stats to this file.')
+
+
+def seed_exam(environment):
+    options = environment.parsed_options
+    if options.exam_prefix:
+        return options.exam_prefix
+
+    response = requests.post(f'{environment.host}/api/create_exam/', json={
+        'exam_name': 'locust load test',
+        'created_for': 0,
+        'no_of_questions': options.questions,
+        'time_per_question': 30,
+    }, timeout=30)
+    response.raise_for_status()
+    prefix = response.json()['prefix']
+
+    roster = io.StringIO()
+    writer = csv.writer(roster)
+    writer.writerow(['student_name', 'university_email', 'university_id'])
+    for index in range(options.students):
+        writer.writerow([f'Student {index}', f'student{index}@example.edu', 100000 + index])
+
+    response = requests.post(
+        f'{environment.host}/api/upload/users',
+        data={'exam_prefix': prefix},
+        files={'file': ('students.csv', roster.getvalue().encode('utf-8'), 'text/csv')},
+        timeout=300
+    )
+    response.raise_for_status()
+    logging.info(f'seeded exam {prefix} with {options.students} students')
+    return prefix
+
+
+@events.init.add_listener
+def on_init(environment, **kwargs):
+    if isinstance(environment.runner, WorkerRunner):
+        def set_prefix(message, **kwargs):
+            exam['prefix'] = message.data
+
+        environment.runner.register_message('exam_prefix', set_prefix)
+
+
+@events.test_start.add_listener
+def on_test_start(environment, **kwargs):
+    if isinstance(environment.runner, WorkerRunner):
+        return
+
+    exam['prefix'] = seed_exam(environment)
+    if isinstance(environment.runner, MasterRunner):
+        environment.runner.send_message('exam_prefix', exam['prefix'])
+
+
+def next_username(environment):
+    # workers take interleaved slices of the seeded roster
+    runner = environment.runner
+    worker_index = getattr(runner, 'worker_index', 0) if isinstance(runner, WorkerRunner) else 0
+    worker_count = max(getattr(runner, 'worker_count', 1), 1) if isinstance(runner, WorkerRunner) else 1
+    index = next(student_counter) * worker_count + worker_index
+    if index >= environment.parsed_options.students:
+        return None
+
+    return f"{exam['prefix']}{100000 + index}"
+
+
+class ExamLifecycle(SequentialTaskSet):
+    def on_start(self):
+        # on workers the prefix arrives from the master right after test start
+        while exam['prefix'] is None:
+            gevent.sleep(0.1)
+
+        self.username = next_username(self.user.environment)
+        if self.username is None:
+            raise StopUser()
+
+        self.token = None
+        self.total_questions = 0
+
+    @task
+    def login(self):
+        with self.client.post('/api/login', json={'username': self.username}, catch_response=True) as response:
+            if response.status_code != 200:
+                response.failure(f'login failed: {response.text}')
+                raise StopUser()
+
+            body = response.json()
+            self.token = body['token']
+            self.total_questions = int(body['total_questions'])
+
+    @task
+    def answer_questions(self):
+        for _ in range(self.total_questions):
+            with self.client.post('/api/question', json={
+                'username': self.username,
+                'token': self.token,
+            }, catch_response=True) as response:
+                if response.status_code != 200:
+                    response.failure(response.text)
+                    break
+
+                question = response.json()
+
+            self.wait()
+            self.client.post('/api/answer/submit', json={
+                'username': self.username,
+                'question_id': question['question_id'],
+                'answer': random.choice(question['options']),
+            })
+
+    @task
+    def feedback(self):
+        self.client.post('/api/submit/feedback', json={
+            'username': self.username,
+            'rating': random.randint(1, 5),
+        })
+        raise StopUser()
+
+
+class Student(HttpUser):
+    tasks = [ExamLifecycle]
+
+    def wait_time(self):
+        return between(0, self.environment.parsed_options.think_time)(self)
+
+
+def endpoint_stats(environment):
+    stats = {}
+    for (name, method), entry in environment.stats.entries.items():
+        if not entry.num_requests:
+            continue
+
+        stats[f'{method} {name}'] = {
+            'requests': entry.num_requests,
+            'failures': entry.num_failures,
+            'rps': entry.total_rps,
+            'p50': entry.get_response_time_percentile(0.50),
+            'p95': entry.get_response_time_percentile(0.95),
+            'p99': entry.get_response_time_percentile(0.99),
+        }
+    return stats
+
+
+@events.quitting.add_listener
+def check_thresholds(environment, **kwargs):
+    if isinstance(environment.runner, WorkerRunner):
+        return
+
+    options = environment.parsed_options
+    stats = endpoint_stats(environment)
+    problems = []
+
+    logging.info(f"{'endpoint':<32}{'rps':>9}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for endpoint, row in sorted(stats.items()):
+        logging.info(f"{endpoint:<32}{row['rps']:>9.1f}{row['p50']:>9.0f}{row['p95']:>9.0f}{row['p99']:>9.0f}")
+        if options.max_p95_ms and row['p95'] > options.max_p95_ms:
+            problems.append(f"{endpoint} p95 {row['p95']:.0f}ms > {options.max_p95_ms:.0f}ms")
+
+    if environment.stats.total.fail_ratio > options.max_fail_ratio:
+        problems.append(f'failure ratio {environment.stats.total.fail_ratio:.2%} > {options.max_fail_ratio:.2%}')
+
+    if options.baseline:
+        with open(options.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+
+        allowed = 1 + options.max_regression / 100
+        for endpoint, before in baseline.items():
+            after = stats.get(endpoint)
+            if after is None:
+                continue
+
+            if after['p95'] > before['p95'] * allowed:
+                problems.append(f"{endpoint} p95 regressed {before['p95']:.0f}ms -> {after['p95']:.0f}ms")
+
+            if after['rps'] * allowed < before['rps']:
+                problems.append(f"{endpoint} rps regressed {before['rps']:.1f} -> {after['rps']:.1f}")
+
+    if options.save_baseline:
+        with open(options.save_baseline, 'w') as baseline_file:
+            json.dump(stats, baseline_file, indent=2, sort_keys=True)
+
+    for problem in problems:
+        logging.error(problem)
+
+    if problems:
+        environment.process_exit_code = 1
@@ -0,0 +1,128 @@
+"""
+Stand-in for the question bank microservice, used by the locust suite.
+
+    python loadtest/question_bank_stub.py --port 5012 --latency-ms 20
+
+Point the app at it with QuestionBankAppURI=http://127.0.0.1:5012.
+"""
+import argparse
+import random
+import threading
+import time
+from collections import defaultdict
+
+from flask import Flask, jsonify, request
+
+app = Flask(__name__)
+
+settings = {
+    'latency_ms': 0,
+    'questions': 200,
+    'options': 4,
+}
+served = defaultdict(int)
+served_lock = threading.Lock()
+
+
+def question(question_id):
+    return {
+        'question_id': question_id,
+        'text': f'Question {question_id}: which option is correct?',
+        'options': [f'Option {index} for question {question_id}' for index in range(settings['options'])],
+    }
+
+
+@app.before_request
+def simulate_latency():
+    if settings['latency_ms']:
+        # +-50% jitter around the configured latency
+        time.sleep(settings['latency_ms'] * random.uniform(0.5, 1.5) / 1000)
+
+
+@app.get('/question')
+def next_question():
+    username = request.args.get('username', '')
+    limit = int(request.args.get('question_limit', 10))
+    with served_lock:
+        index = served[username]
+        served[username] += 1
+
+    if index >= limit:
+        return jsonify({'error': 'No more questions'})
+
+    question_id = index % settings['questions'] + 1
+    if request.args.get('ids_only') == 'true':
+        return jsonify({'question_id': question_id})
+
+    return jsonify(question(question_id))
+
+
+@app.get('/question/content')
+def question_content():
+    question_ids = [int(question_id) for question_id in request.args.get('question_ids', '').split(',') if question_id]
+    return jsonify({'questions': [question(question_id) for question_id in question_ids]})
+
+
+@app.get('/question/pool')
+def question_pool():
+    return jsonify({'questions': [question(question_id) for question_id in range(1, settings['questions'] + 1)]})
+
+
+@app.get('/question/paper')
+def question_paper():
+    limit = int(request.args.get('question_limit', 10))
+    start = random.randrange(settings['questions'])
+    return jsonify({
+        'questions': [question((start + index) % settings['questions'] + 1) for index in range(limit)]
+    })
+
+
+@app.post('/question/add')
+def add_questions():
+    # a single question or a bulk ingest batch of {"questions": [...]}
+    body = request.get_json(silent=True) or {}
+    return jsonify({'message': 'Questions added', 'count': len(body.get('questions') or [body])})
+
+
+@app.post('/answer/submit')
+def submit_answer():
+    return jsonify({'message': 'Answer stored'})
+
+
+@app.post('/answer/submit/bulk')
+def submit_answers_bulk():
+    return jsonify({'message': 'Answers stored', 'failed': []})
+
+
+@app.post('/submit/feedback')
+def submit_feedback():
+    return jsonify({'status': 'success', 'message': 'Feedback submitted successfully'})
+
+
+@app.post('/reset/student/answers')
+def reset_answers():
+    with served_lock:
+        served.pop((request.get_json(silent=True) or {}).get('username', ''), None)
+    return jsonify({'message': 'Answers reset'})
+
+
+@app.post('/reset/student/answers/bulk')
+def reset_answers_bulk():
+    usernames = (request.get_json(silent=True) or {}).get('usernames', [])
+    with served_lock:
+        for username in usernames:
+            served.pop(username, None)
+    return jsonify({'message': 'Answers reset', 'count': len(usernames)})
+
+
+if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=5012)
+    arg_parser.add_argument('--latency-ms', type=int, default=0, help='Average added latency per request.')
+    arg_parser.add_argument('--questions', type=int, default=200, help='Size of the question pool.')
+    arg_parser.add_argument('--options', type=int, default=4, help='Options per question.')
+    args = arg_parser.parse_args()
+
+    settings.update(latency_ms=args.latency_ms, questions=args.questions, options=args.options)
+    app.run(host=args.host, port=args.port, threaded=True)